@@ -2,17 +2,176 @@
 FastAPI dependency to require and validate Supabase user via JWT.
 """
 
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
 import logging
+import threading
+import time
+from dataclasses import dataclass
 from functools import lru_cache
 from typing import Any
 
+import httpx
+import jwt
+from cachetools import TLRUCache
 from fastapi import Header, HTTPException, Request, status
-from supabase import Client, create_client
+from supabase import AsyncClient, AsyncClientOptions, Client, ClientOptions, acreate_client, create_client
 
-from config.settings import SUPABASE_SERVICE_KEY, SUPABASE_URL
+from config.settings import (
+    SUPABASE_HTTP_MAX_CONNECTIONS,
+    SUPABASE_HTTP_MAX_KEEPALIVE,
+    SUPABASE_JWT_CACHE_TTL,
+    SUPABASE_JWT_LOCAL_VERIFY,
+    SUPABASE_SERVICE_KEY,
+    SUPABASE_URL,
+)
 
 logger = logging.getLogger(__name__)
 
+# ============================================================================
+# VERIFIED USER CACHE
+# ============================================================================
+
+# Entries are (user, expires_at) keyed by sha256(token); the raw token is never stored.
+_user_cache: TLRUCache = TLRUCache(
+    maxsize=10_000,
+    ttu=lambda _key, value, _now: value[1],
+    timer=time.time,
+)
+_user_cache_lock = threading.Lock()
+
+
+def _token_cache_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def _get_cached_user(token: str) -> Any:
+    if SUPABASE_JWT_CACHE_TTL <= 0:
+        return None
+    with _user_cache_lock:
+        entry = _user_cache.get(_token_cache_key(token))
+    return entry[0] if entry else None
+
+
+def _token_expiry(token: str) -> float | None:
+    """
+    Reads `exp` straight from the JWT payload segment (no signature check, no header parse).
+    """
+    try:
+        payload = token.split(".", 2)[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"])
+    except (IndexError, KeyError, TypeError, ValueError, binascii.Error):
+        return None
+
+
+def _cache_user(token: str, user: Any, token_exp: float | None = None) -> None:
+    """
+    Caches a verified user for SUPABASE_JWT_CACHE_TTL seconds, never past the token's `exp`.
+    """
+    if SUPABASE_JWT_CACHE_TTL <= 0:
+        return
+
+    if token_exp is None:
+        # Signature was already verified by Supabase; only `exp` is read here.
+        token_exp = _token_expiry(token)
+        if token_exp is None:
+            return
+
+    expires_at = min(time.time() + SUPABASE_JWT_CACHE_TTL, token_exp)
+    if expires_at <= time.time():
+        return
+
+    with _user_cache_lock:
+        _user_cache[_token_cache_key(token)] = (user, expires_at)
+
+
+# ============================================================================
+# LOCAL JWT VERIFICATION
+# ============================================================================
+
+# Only asymmetric tokens can be verified against the public JWKS; HS256 tokens
+# (legacy/local projects) fall back to Supabase Auth.
+_ASYMMETRIC_JWT_ALGORITHMS = ["RS256", "ES256"]
+
+
+@dataclass(frozen=True, slots=True)
+class SupabaseUser:
+    """
+    User built from locally verified JWT claims.
+
+    Exposes the same attributes routes read from the Supabase SDK user.
+    """
+
+    id: str
+    exp: int
+    email: str | None = None
+    phone: str | None = None
+    role: str | None = None
+
+    @classmethod
+    def from_claims(cls, claims: dict[str, Any]) -> "SupabaseUser":
+        """
+        Builds the user from verified claims, keeping only the fields routes read.
+        """
+        return cls(
+            id=claims["sub"],
+            exp=claims["exp"],
+            email=claims.get("email") or None,
+            phone=claims.get("phone") or None,
+            role=claims.get("role"),
+        )
+
+
+@lru_cache(maxsize=1)
+def _get_jwks_client() -> jwt.PyJWKClient:
+    """
+    Returns a cached JWKS client; signing keys are fetched lazily and kept for an hour.
+    """
+    return jwt.PyJWKClient(
+        f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json",
+        cache_keys=True,
+        lifespan=3600,
+    )
+
+
+def _verify_token_locally(token: str) -> SupabaseUser | None:
+    """
+    Verifies an asymmetric Supabase JWT against the project's JWKS.
+
+    Returns None when the token cannot be verified locally, in which case the caller
+    should fall back to Supabase Auth. Raises jwt.InvalidTokenError for bad tokens.
+    """
+    if not SUPABASE_JWT_LOCAL_VERIFY or not SUPABASE_URL:
+        return None
+
+    if jwt.get_unverified_header(token).get("alg") not in _ASYMMETRIC_JWT_ALGORITHMS:
+        return None
+
+    try:
+        signing_key = _get_jwks_client().get_signing_key_from_jwt(token).key
+    except jwt.PyJWKClientError as exc:
+        logger.warning(
+            "JWKS signing key unavailable, falling back to Supabase Auth",
+            extra={
+                "error": str(exc),
+                "error_type": type(exc).__name__,
+            },
+        )
+        return None
+
+    claims = jwt.decode(
+        token,
+        signing_key,
+        algorithms=_ASYMMETRIC_JWT_ALGORITHMS,
+        audience="authenticated",
+        options={"require": ["exp", "sub"]},
+    )
+    return SupabaseUser.from_claims(claims)
+
 
 def _extract_bearer_token(authorization: str | None) -> str | None:
     """
@@ -22,14 +181,29 @@ def _extract_bearer_token(authorization: str | None) -> str | None:
         return None
 
     value = authorization.strip()
-    if not value:
-        return None
 
-    if value.lower().startswith("bearer "):
-        token = value[7:].strip()
-        return token or None
+    # Only the 7-char scheme prefix is case-folded, not the (often 1KB+) JWT.
+    if value[:7].lower() == "bearer ":
+        # The right edge is already stripped, so only the left needs trimming.
+        return value[7:].lstrip() or None
+
+    return value or None
 
-    return value
+
+# One keep-alive pool per client, shared by its PostgREST, Storage and Auth calls so requests reuse
+# open TLS connections. The timeout matches the PostgREST default, which an explicit httpx client replaces.
+_SUPABASE_HTTP_LIMITS = httpx.Limits(
+    max_connections=SUPABASE_HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=SUPABASE_HTTP_MAX_KEEPALIVE,
+)
+_SUPABASE_HTTP_TIMEOUT = httpx.Timeout(120.0)
+
+
+def _check_supabase_settings() -> None:
+    if not SUPABASE_URL:
+        raise RuntimeError("SUPABASE_URL is not set")
+    if not SUPABASE_SERVICE_KEY:
+        raise RuntimeError("SUPABASE_SERVICE_KEY is not set")
 
 
 @lru_cache(maxsize=1)
@@ -37,30 +211,40 @@ def get_supabase_client() -> Client:
     """
     Returns a cached Supabase client instance (Responsible for the singletonness).
     """
-    if not SUPABASE_URL:
-        raise RuntimeError("SUPABASE_URL is not set")
-    if not SUPABASE_SERVICE_KEY:
-        raise RuntimeError("SUPABASE_SERVICE_KEY is not set")
-    return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    _check_supabase_settings()
+    http_client = httpx.Client(
+        limits=_SUPABASE_HTTP_LIMITS, timeout=_SUPABASE_HTTP_TIMEOUT, follow_redirects=True, http2=True
+    )
+    return create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY, options=ClientOptions(httpx_client=http_client))
 
 
-def require_supabase_user(
-    request: Request,
-    authorization: str | None = Header(default=None, alias="Authorization"),
-) -> Any:
-    """FastAPI dependency: validates request JWT via Supabase Auth.
+_async_supabase_client: AsyncClient | None = None
+_async_supabase_client_lock = asyncio.Lock()
 
-    Expected header: `Authorization: Bearer <jwt>`.
+
+async def get_async_supabase_client() -> AsyncClient:
+    """
+    Returns a cached async Supabase client instance, for routes whose writes shouldn't block the event loop.
     """
+    global _async_supabase_client
+    if _async_supabase_client is None:
+        async with _async_supabase_client_lock:
+            # Concurrent first requests must not each build (and leak) their own client
+            if _async_supabase_client is None:
+                _check_supabase_settings()
+                http_client = httpx.AsyncClient(
+                    limits=_SUPABASE_HTTP_LIMITS, timeout=_SUPABASE_HTTP_TIMEOUT, follow_redirects=True, http2=True
+                )
+                _async_supabase_client = await acreate_client(
+                    SUPABASE_URL, SUPABASE_SERVICE_KEY, options=AsyncClientOptions(httpx_client=http_client)
+                )
+    return _async_supabase_client
 
-    token = _extract_bearer_token(authorization)
-    if not token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Missing Authorization token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
 
+def _verify_token_remotely(token: str) -> Any:
+    """
+    Verifies the JWT via Supabase Auth and returns the SDK user.
+    """
     supabase = get_supabase_client()
 
     try:
@@ -91,5 +275,52 @@ def require_supabase_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    return user
+
+
+def require_supabase_user(
+    request: Request,
+    authorization: str | None = Header(default=None, alias="Authorization"),
+) -> Any:
+    """FastAPI dependency: validates request JWT locally (JWKS) or via Supabase Auth.
+
+    Expected header: `Authorization: Bearer <jwt>`.
+    """
+
+    token = _extract_bearer_token(authorization)
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Missing Authorization token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    cached_user = _get_cached_user(token)
+    if cached_user is not None:
+        request.state.supabase_user = cached_user
+        return cached_user
+
+    try:
+        user = _verify_token_locally(token)
+    except jwt.InvalidTokenError as exc:
+        logger.warning(
+            "Local JWT verification failed",
+            extra={
+                "error": str(exc),
+                "error_type": type(exc).__name__,
+            },
+        )
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        ) from exc
+
+    if user is None:
+        user = _verify_token_remotely(token)
+        _cache_user(token, user)
+    else:
+        _cache_user(token, user, token_exp=user.exp)
+
     request.state.supabase_user = user
     return user
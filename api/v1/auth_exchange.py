@@ -1,46 +1,64 @@
 import asyncio
+import json
 import logging
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
-import firebase_admin
-from fastapi import APIRouter, HTTPException
-from firebase_admin import auth, credentials
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
+from supabase import Client
 
+from api.v1.auth import get_supabase_client
 from config import settings
 
+if TYPE_CHECKING:
+    import firebase_admin
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Initialize Firebase Admin if not already initialized
-# This is a bit of a singleton pattern within the module scope
-# Ideally this should be done in a dedicated startup event or module
-try:
-    if not firebase_admin._apps:
-        if settings.FIREBASE_CREDENTIALS:
-            import json
-
-            # Check if it's a JSON string or a file path
-            creds_data = settings.FIREBASE_CREDENTIALS.strip()
-            if creds_data.startswith("{"):
-                try:
-                    cred_dict = json.loads(creds_data)
-                    cred = credentials.Certificate(cred_dict)
-                    logger.info("Initializing Firebase Admin with JSON data from environment.")
-                except json.JSONDecodeError:
-                    logger.error("FIREBASE_CREDENTIALS looks like JSON but is invalid.")
-                    cred = None
-            else:
-                # Treat as file path
-                cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS)
-                logger.info(f"Initializing Firebase Admin with certificate file: {settings.FIREBASE_CREDENTIALS}")
-
-            if cred:
-                firebase_admin.initialize_app(cred)
-        else:
+
+@lru_cache(maxsize=1)
+def _get_firebase_app() -> "firebase_admin.App | None":
+    """
+    Initializes Firebase Admin on first use (not at import) and returns the app.
+
+    Importing firebase_admin and parsing the service-account certificate are slow,
+    so both are kept off worker startup. Returns None when Firebase Admin cannot be initialized.
+    """
+    import firebase_admin
+    from firebase_admin import credentials
+
+    try:
+        return firebase_admin.get_app()
+    except ValueError:
+        pass
+
+    try:
+        if not settings.FIREBASE_CREDENTIALS:
             logger.warning("FIREBASE_CREDENTIALS not set. Firebase Admin not initialized.")
-except Exception as e:
-    logger.error(f"Failed to initialize Firebase Admin: {e}", exc_info=True)
+            return None
+
+        # Check if it's a JSON string or a file path
+        creds_data = settings.FIREBASE_CREDENTIALS.strip()
+        if creds_data.startswith("{"):
+            try:
+                cred_dict = json.loads(creds_data)
+                cred = credentials.Certificate(cred_dict)
+                logger.info("Initializing Firebase Admin with JSON data from environment.")
+            except json.JSONDecodeError:
+                logger.error("FIREBASE_CREDENTIALS looks like JSON but is invalid.")
+                return None
+        else:
+            # Treat as file path
+            cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS)
+            logger.info(f"Initializing Firebase Admin with certificate file: {settings.FIREBASE_CREDENTIALS}")
+
+        return firebase_admin.initialize_app(cred)
+    except Exception as e:
+        logger.error(f"Failed to initialize Firebase Admin: {e}", exc_info=True)
+        return None
 
 
 class ExchangeRequest(BaseModel):
@@ -48,7 +66,10 @@ class ExchangeRequest(BaseModel):
 
 
 @router.post("/auth/exchange-firebase-token")
-async def exchange_firebase_token(req: ExchangeRequest):
+async def exchange_firebase_token(
+    req: ExchangeRequest,
+    supabase: Client = Depends(get_supabase_client),
+):
     """
     Exchanges a Firebase ID Token for the Supabase OTP stored in the database.
     This handles the race condition by retrying if the OTP is not immediately found.
@@ -56,8 +77,11 @@ async def exchange_firebase_token(req: ExchangeRequest):
     token = req.firebase_token
 
     # 1. Verify Firebase Token
+    firebase_app = _get_firebase_app()
+    from firebase_admin import auth
+
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = auth.verify_id_token(token, app=firebase_app)
         phone_number = decoded_token.get("phone_number")
         if not phone_number:
             raise HTTPException(status_code=400, detail="Token does not contain a phone number")
@@ -73,35 +97,35 @@ async def exchange_firebase_token(req: ExchangeRequest):
     # We assume they match. If needed, insert normalization logic here.
 
     # 3. Retrieve OTP from Supabase Table with Retry Logic
-    from supabase import Client, create_client
-
-    url: str = settings.SUPABASE_URL
-    key: str = settings.SUPABASE_SERVICE_KEY
-    supabase: Client = create_client(url, key)
-
+    # The SMS hook usually lands within tens of milliseconds, so poll early and back off
+    # exponentially between attempts: 50ms, 100ms, ... 800ms (~1.5s in total).
     max_retries = 6
-    retry_delay = 0.5  # seconds
+    retry_delay = 0.05  # seconds
 
     found_otp = None
     phone_number = phone_number.replace("+", "")
     for attempt in range(max_retries):
         try:
             # Query the table
-            res = supabase.table("phonenum_otps").select("otp").eq("phone_number", phone_number).execute()
+            res = await asyncio.to_thread(
+                supabase.table("phonenum_otps").select("otp").eq("phone_number", phone_number).limit(1).execute
+            )
 
-            if res.data and len(res.data) > 0:
+            if res.data:
                 found_otp = res.data[0]["otp"]
                 break
 
             # If not found, wait and retry
             logger.info(f"OTP not found for {phone_number}, attempt {attempt + 1}/{max_retries}")
-            await asyncio.sleep(retry_delay)
 
         except Exception as e:
             logger.error(f"Supabase query failed: {e}")
             # If query actually fails (network/auth), we might want to break or continue.
             # For now, let's continue to be safe.
+
+        if attempt < max_retries - 1:
             await asyncio.sleep(retry_delay)
+            retry_delay *= 2
 
     if not found_otp:
         raise HTTPException(status_code=404, detail="OTP not found temporarily. Please try again or resend.")
@@ -1,5 +1,7 @@
 import logging
+import threading
 
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, status
 from supabase import Client
 
@@ -7,6 +9,11 @@ from api.v1.auth import get_supabase_client, require_supabase_user
 
 logger = logging.getLogger(__name__)
 
+# user_id -> user_type. Roles are changed directly in the database, so the TTL is the only way an entry
+# expires; it bounds how long a demoted admin keeps access.
+_role_cache: TTLCache = TTLCache(maxsize=4096, ttl=60)
+_role_cache_lock = threading.Lock()
+
 
 def require_admin(
     user: dict = Depends(require_supabase_user),
@@ -14,6 +21,8 @@ def require_admin(
 ) -> dict:
     """
     Dependency that enforces admin access by checking 'user_type' in public.users table.
+
+    The user_type is cached per user for 60 seconds, so a role change takes up to that long to apply.
     """
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authentication required")
@@ -24,13 +33,19 @@ def require_admin(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User ID not found")
 
     try:
-        # Query public.users table for user_type
-        response = supabase_client.table("users").select("user_type").eq("id", user_id).single().execute()
+        with _role_cache_lock:
+            user_type = _role_cache.get(user_id)
+
+        if user_type is None:
+            # Query public.users table for user_type
+            response = supabase_client.table("users").select("user_type").eq("id", user_id).single().execute()
 
-        if not response.data:
-            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User profile not found")
+            if not response.data:
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User profile not found")
 
-        user_type = response.data.get("user_type")
+            user_type = response.data.get("user_type")
+            with _role_cache_lock:
+                _role_cache[user_id] = user_type
 
         if user_type != "skolist-admin":
             logger.warning(f"Unauthorized access attempt by user {user_id} with type {user_type}")
@@ -1,16 +1,21 @@
+import hashlib
 import logging
 
+import orjson
+from cachetools import TTLCache
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from supabase import Client
+from supabase import AsyncClient, Client
 
-from api.v1.auth import get_supabase_client
+from api.v1.auth import get_async_supabase_client, get_supabase_client
 
 # Reuse helper to format questions same as QGen
 from api.v1.qgen.generate_questions.utils.fetch_questions import (
     QuestionRequestType,
     extract_bank_question_to_gen_payload,
 )
+from config.settings import BANK_SEARCH_FTS
 
 from .dependencies import require_admin
 
@@ -32,6 +37,32 @@ class BankFilter(BaseModel):
     search_query: str | None = None
 
 
+# BankFilter fields applied as plain `column = value` filters; search_query and
+# concept_ids need their own query shapes.
+_EQ_FILTER_FIELDS = frozenset(
+    {
+        "subject_id",
+        "chapter_id",
+        "question_type",
+        "hardness_level",
+        "is_solved_example",
+        "is_from_exercise",
+        "is_image_needed",
+        "is_incomplete",
+    }
+)
+
+
+# Bound once; the list loop picks one per row
+_SOLVED_EXAMPLE = QuestionRequestType.SOLVED_EXAMPLE
+_EXERCISE_QUESTION = QuestionRequestType.EXERCISE_QUESTION
+
+# Exact totals per filter set (BankFilter JSON). count="exact" is a full COUNT over the
+# filtered rows, so it is paid once per filter set instead of on every page; the cache is
+# also cleared whenever this router edits a question.
+_total_count_cache: TTLCache = TTLCache(maxsize=1024, ttl=60)
+
+
 class ListQuestionsRequest(BaseModel):
     page: int = 1
     page_size: int = 20
@@ -56,44 +87,40 @@ class ListQuestionsResponse(BaseModel):
 async def list_bank_questions(request: ListQuestionsRequest, supabase: Client = Depends(get_supabase_client)):
     """
     Fetch paginated list of bank questions with filters.
+
+    Rows come straight from the database, so the page is serialized with orjson as-is;
+    `response_model` only documents the shape (FastAPI skips it for returned Responses).
+
+    With BANK_SEARCH_FTS on, search_query matches whole words (websearch syntax: quoted phrases, `or`, `-word`)
+    through the indexed question_tsv column, instead of the substring ILIKE match on question_text.
     """
     try:
         # Debug logging
         logger.info(f"Received filters: {request.filters}")
         logger.info(f"Chapter ID filter: {request.filters.chapter_id}")
 
-        # Base query
-        query = supabase.table("bank_questions").select("*", count="exact")
-
-        # Apply Filters
-        if request.filters.subject_id:
-            query = query.eq("subject_id", request.filters.subject_id)
+        count_key = request.filters.model_dump_json()
+        total = _total_count_cache.get(count_key)
 
-        if request.filters.chapter_id:
-            logger.info(f"Applying chapter_id filter: {request.filters.chapter_id}")
-            query = query.eq("chapter_id", request.filters.chapter_id)
-
-        if request.filters.question_type:
-            query = query.eq("question_type", request.filters.question_type)
-
-        if request.filters.hardness_level:
-            query = query.eq("hardness_level", request.filters.hardness_level)
-
-        if request.filters.is_solved_example is not None:
-            query = query.eq("is_solved_example", request.filters.is_solved_example)
-
-        if request.filters.is_from_exercise is not None:
-            query = query.eq("is_from_exercise", request.filters.is_from_exercise)
-
-        if request.filters.is_image_needed is not None:
-            query = query.eq("is_image_needed", request.filters.is_image_needed)
+        # Base query; concept ids are embedded so the page needs a single round-trip
+        query = supabase.table("bank_questions").select(
+            "*, concepts:bank_questions_concepts_maps(concept_id)",
+            count="exact" if total is None else None,
+        )
 
-        if request.filters.is_incomplete is not None:
-            query = query.eq("is_incomplete", request.filters.is_incomplete)
+        # Apply Filters (empty strings from the admin UI mean "no filter", same as None)
+        for column, value in request.filters.model_dump(include=_EQ_FILTER_FIELDS, exclude_none=True).items():
+            if value != "":
+                query = query.eq(column, value)
 
         if request.filters.search_query:
-            # Simple text search on question_text
-            query = query.ilike("question_text", f"%{request.filters.search_query}%")
+            if BANK_SEARCH_FTS:
+                # Indexed full-text search: question_tsv is to_tsvector('simple', question_text), see
+                # supabase_dir/migrations/20261016000004_bank_questions_question_tsv.sql
+                query = query.filter("question_tsv", "wfts(simple)", request.filters.search_query)
+            else:
+                # Simple text search on question_text (sequential scan)
+                query = query.ilike("question_text", f"%{request.filters.search_query}%")
 
         # Concept filtering logic
         # Since bank_questions doesn't have concept_ids array column, we need to filter by ID
@@ -112,7 +139,7 @@ async def list_bank_questions(request: ListQuestionsRequest, supabase: Client =
 
             valid_ids = [row["bank_question_id"] for row in map_res.data]
             if not valid_ids:
-                return ListQuestionsResponse(data=[], total=0, page=request.page, page_size=request.page_size)
+                return ORJSONResponse({"data": [], "total": 0, "page": request.page, "page_size": request.page_size})
 
             query = query.in_("id", valid_ids)
 
@@ -125,72 +152,40 @@ async def list_bank_questions(request: ListQuestionsRequest, supabase: Client =
         # Execute
         response = query.execute()
 
+        if total is None:
+            total = _total_count_cache[count_key] = response.count or 0
+
         # Format response
         formatted_list = []
         for item in response.data:
-            # We need to fetch concepts for each question to display them
-            # This is N+1 problem potential, but for page_size=20 it's acceptable for admin tool.
-            # OR we can do a second query to fetch all concepts for these 20 IDs.
+            # Embedded bank_questions_concepts_maps rows; not part of the raw bank row
+            concept_ids = [m["concept_id"] for m in item.pop("concepts", None) or []]
 
             # Formatted payload (reuses logic from fetch_questions)
             # logic expects a request_type to set is_solved/is_exercise flags in the payload.
             # We can infer it from the specific item
-            item_req_type = (
-                QuestionRequestType.SOLVED_EXAMPLE
-                if item.get("is_solved_example")
-                else QuestionRequestType.EXERCISE_QUESTION
+            payload = extract_bank_question_to_gen_payload(
+                item, _SOLVED_EXAMPLE if item.get("is_solved_example") else _EXERCISE_QUESTION
             )
 
-            payload = extract_bank_question_to_gen_payload(item, item_req_type)
-
-            # Fetch concepts:
-            # Using a separate query or if we could join in the main query
-            # Supabase-py join syntax: .select("*, bank_questions_concepts_maps(concept_id)")
-            # Let's assume we didn't do join above to keep count clean, so we do it now or
-            # ideally we should have done it in the main query.
-
-            # Let's optimize: fetch concepts for these IDs in batch if possible, or just lazy load.
-            # For admin UI, let's just do individual fetch or rely on what we have.
-            # Actually, extract_bank_question_to_gen_payload doesn't put concepts in payload.
             # The GeneratedQuestionCard needs 'concepts' list to display badges.
             # 'concept_ids' list is side-loaded.
-
             formatted_list.append(
                 {
                     "id": item["id"],
                     "question": payload,  # The 'inner' question data with text, options etc.
-                    "concept_ids": [],  # Will populate this if we fetch maps
+                    "concept_ids": concept_ids,
                     "raw_data": item,
                 }
             )
 
-        # Optimization: Fetch concepts for all these questions
-        if response.data:
-            q_ids = [q["id"] for q in response.data]
-            maps = (
-                supabase.table("bank_questions_concepts_maps")
-                .select("bank_question_id, concept_id")
-                .in_("bank_question_id", q_ids)
-                .execute()
-            )
-
-            # Group by question
-            q_to_concepts = {}
-            for m in maps.data:
-                qid = m["bank_question_id"]
-                if qid not in q_to_concepts:
-                    q_to_concepts[qid] = []
-                q_to_concepts[qid].append(m["concept_id"])
-
-            # Attach to list
-            for q in formatted_list:
-                q["concept_ids"] = q_to_concepts.get(q["id"], [])
-
-        return ListQuestionsResponse(
-            data=formatted_list,
-            total=response.count or 0,
-            page=request.page,
-            page_size=request.page_size,
+        return ORJSONResponse(
+            {
+                "data": formatted_list,
+                "total": total,
+                "page": request.page,
+                "page_size": request.page_size,
+            }
         )
     except Exception as e:
         logger.error(f"Error fetching bank questions: {e}")
@@ -204,14 +199,22 @@ async def list_bank_questions(request: ListQuestionsRequest, supabase: Client =
 # PREVIEW ENDPOINTS (No Save)
 # ============================================================================
 
-import os
-
 from google import genai
 
 from api.v1.qgen.auto_correct.service import AutoCorrectService
 from api.v1.qgen.regenerate_question import process_question_and_validate
+from api.v1.qgen.utils.gemini_client import get_gemini_client
 from supabase_dir import BankQuestionsUpdate
 
+# Auto-correct output per question content. Repeated previews of an unchanged question are served from memory
+# instead of another multi-second Gemini call. Regenerate previews are not cached: asking again for the same
+# question and prompt is how an admin gets a different version.
+_preview_cache: TTLCache = TTLCache(maxsize=512, ttl=3600)
+
+
+def _preview_cache_key(question: dict) -> str:
+    return hashlib.blake2b(orjson.dumps(question, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
 
 class PreviewRequest(BaseModel):
     question: dict  # The question payload (Generations format)
@@ -223,27 +226,28 @@ class CompareResponse(BaseModel):
 
 
 @router.post("/preview/auto-correct", response_model=CompareResponse)
-async def preview_auto_correct(request: PreviewRequest, supabase: Client = Depends(get_supabase_client)):
+async def preview_auto_correct(
+    request: PreviewRequest,
+    supabase: Client = Depends(get_supabase_client),
+):
     """
     Run auto-correct on the question but DO NOT save.
     Returns both original and new version for comparison.
     """
-    gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
     # We use valid image_part=None for now as we don't have the screenshot here easily
     # The AutoCorrectService handles optional image.
 
     try:
-        # Reuse the service logic
-        corrected_q = await AutoCorrectService.process_and_validate(
-            gemini_client=gemini_client,
-            gen_question_data=request.question,
-            image_part=None,
-            retry_idx=0,
-        )
-
-        # Convert Pydantic model to dict
-        new_data = corrected_q.model_dump(exclude_none=True)
+        cache_key = _preview_cache_key(request.question)
+        new_data = _preview_cache.get(cache_key)
+        if new_data is None:
+            # Reuse the service logic; concurrent previews share batched Gemini calls
+            corrected_q = await AutoCorrectService.correct_text_only(request.question)
+
+            # Convert Pydantic model to dict
+            new_data = _preview_cache[cache_key] = corrected_q.model_dump(
+                include=corrected_q.model_fields_set, exclude_none=True
+            )
 
         # Merge with ID/Metadata from original to keep it consistent
         merged_new = {**request.question, **new_data}
@@ -261,12 +265,14 @@ class RegeneratePreviewRequest(BaseModel):
 
 
 @router.post("/preview/regenerate", response_model=CompareResponse)
-async def preview_regenerate(request: RegeneratePreviewRequest, supabase: Client = Depends(get_supabase_client)):
+async def preview_regenerate(
+    request: RegeneratePreviewRequest,
+    supabase: Client = Depends(get_supabase_client),
+    gemini_client: genai.Client = Depends(get_gemini_client),
+):
     """
     Run regenerate on the question but DO NOT save.
     """
-    gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
     try:
         # Reuse regenerate logic
         # process_question_and_validate uses the prompt generator internally
@@ -284,8 +290,7 @@ async def preview_regenerate(request: RegeneratePreviewRequest, supabase: Client
             q_data["question_text"] = f"{q_data.get('question_text')} \n\nInstruction: {request.prompt}"
 
         new_q = await process_question_and_validate(gemini_client=gemini_client, gen_question_data=q_data, retry_idx=0)
-
-        new_data = new_q.model_dump(exclude_none=True)
+        new_data = new_q.model_dump(include=new_q.model_fields_set, exclude_none=True)
         merged_new = {**request.question, **new_data}
 
         return CompareResponse(original=request.question, new=merged_new)
@@ -299,13 +304,40 @@ async def preview_regenerate(request: RegeneratePreviewRequest, supabase: Client
 # ============================================================================
 
 
+# Content columns /update replaces wholesale (missing keys are written as NULL).
+# match_columns and svgs are mapped from the gen payload separately.
+_BANK_UPDATE_FIELDS = tuple(
+    field
+    for field in (
+        "question_text",
+        "answer_text",
+        "explanation",
+        "marks",
+        "hardness_level",
+        "question_type",
+        "option1",
+        "option2",
+        "option3",
+        "option4",
+        "correct_mcq_option",
+        "msq_option1_answer",
+        "msq_option2_answer",
+        "msq_option3_answer",
+        "msq_option4_answer",
+    )
+    if field in BankQuestionsUpdate.model_fields
+)
+
+
 class UpdateBankQuestionRequest(BaseModel):
     id: str
     question: dict  # The final approved question payload
 
 
 @router.post("/update")
-async def update_bank_question(request: UpdateBankQuestionRequest, supabase: Client = Depends(get_supabase_client)):
+async def update_bank_question(
+    request: UpdateBankQuestionRequest, supabase: AsyncClient = Depends(get_async_supabase_client)
+):
     """
     Persist changes to bank_questions table.
     """
@@ -320,48 +352,16 @@ async def update_bank_question(request: UpdateBankQuestionRequest, supabase: Cli
     # Gen payload usually has 'svgs' as list of dicts or objects.
     svg_list = q_data.pop("svgs", None)
 
-    update_payload = {
-        "question_text": q_data.get("question_text"),
-        "answer_text": q_data.get("answer_text"),
-        "explanation": q_data.get("explanation"),
-        "marks": q_data.get("marks"),
-        "hardness_level": q_data.get("hardness_level"),
-        "question_type": q_data.get("question_type"),
-        "option1": q_data.get("option1"),
-        "option2": q_data.get("option2"),
-        "option3": q_data.get("option3"),
-        "option4": q_data.get("option4"),
-        "correct_mcq_option": q_data.get("correct_mcq_option"),
-        "msq_option1_answer": q_data.get("msq_option1_answer"),
-        "msq_option2_answer": q_data.get("msq_option2_answer"),
-        "msq_option3_answer": q_data.get("msq_option3_answer"),
-        "msq_option4_answer": q_data.get("msq_option4_answer"),
-        # match_columns handling
-        # If match_cols is dict, we might need to stringify it if DB expects string
-        # Assuming Supabase/Postgres handles JSON/Dict mapping if column is compatible
-        "match_columns": match_cols if match_cols else None,
-        # svgs handling
-        # If we have list, we might just store it as is if DB handles it, or JSON stringify
-        # Usually for bank, we just keep it simple.
-        # Logic: If we received new SVGs, we update.
-        # CAUTION: 'svgs' column in schema is 'str'.
-        # We should probably JSON stringify if list.
-        "svgs": str(svg_list) if svg_list else None,
-    }
-
-    # Remove None values to avoid overwriting with nulls if intent was partial update?
-    # No, this is a full update of the question content (Replace).
-    # But clean up keys that are strictly None to rely on DB defaults?
-    # Better to update what we have.
+    # This is a full update of the question content (Replace), so every field is written
+    update_payload = {field: q_data.get(field) for field in _BANK_UPDATE_FIELDS}
+    # Assuming Supabase/Postgres handles JSON/Dict mapping for match_columns
+    update_payload["match_columns"] = match_cols if match_cols else None
+    # 'svgs' column in schema is 'str', so store the list as JSON
+    update_payload["svgs"] = orjson.dumps(svg_list).decode() if svg_list else None
 
     try:
-        # Validate with Pydantic Schema
-        # Use BankQuestionsUpdate (from supabase_dir)
-        # We need to filter keys that are not in valid schema
-        valid_keys = BankQuestionsUpdate.model_fields.keys()
-        final_payload = {k: v for k, v in update_payload.items() if k in valid_keys}
-
-        supabase.table("bank_questions").update(final_payload).eq("id", request.id).execute()
+        await supabase.table("bank_questions").update(update_payload).eq("id", request.id).execute()
+        _total_count_cache.clear()
 
         return {"status": "success", "id": request.id}
 
@@ -375,9 +375,10 @@ class QuestionIdRequest(BaseModel):
 
 
 @router.post("/remove_image_needed")
-async def remove_image_needed(request: QuestionIdRequest, supabase: Client = Depends(get_supabase_client)):
+async def remove_image_needed(request: QuestionIdRequest, supabase: AsyncClient = Depends(get_async_supabase_client)):
     try:
-        supabase.table("bank_questions").update({"is_image_needed": False}).eq("id", request.id).execute()
+        await supabase.table("bank_questions").update({"is_image_needed": False}).eq("id", request.id).execute()
+        _total_count_cache.clear()
         return {"status": "success", "id": request.id}
     except Exception as e:
         logger.error(f"Failed to remove image needed flag: {e}")
@@ -385,9 +386,10 @@ async def remove_image_needed(request: QuestionIdRequest, supabase: Client = Dep
 
 
 @router.post("/remove_incomplete")
-async def remove_incomplete(request: QuestionIdRequest, supabase: Client = Depends(get_supabase_client)):
+async def remove_incomplete(request: QuestionIdRequest, supabase: AsyncClient = Depends(get_async_supabase_client)):
     try:
-        supabase.table("bank_questions").update({"is_incomplete": False}).eq("id", request.id).execute()
+        await supabase.table("bank_questions").update({"is_incomplete": False}).eq("id", request.id).execute()
+        _total_count_cache.clear()
         return {"status": "success", "id": request.id}
     except Exception as e:
         logger.error(f"Failed to remove incomplete flag: {e}")
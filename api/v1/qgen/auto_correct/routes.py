@@ -1,7 +1,8 @@
+import asyncio
 import logging
 
 import supabase
-from fastapi import APIRouter, Depends, Form, HTTPException, Request, status
+from fastapi import Depends, Form, HTTPException, Request, status
 from fastapi.responses import Response
 
 from api.v1.auth import get_supabase_client, require_supabase_user
@@ -10,10 +11,7 @@ from api.v1.qgen.credits import check_user_has_credits, deduct_user_credits
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
 
-
-@router.post("/auto_correct_question")
 async def auto_correct_question(
     request: Request,
     gen_question_id: str = Form(..., description="UUID of the question to correct"),
@@ -25,33 +23,35 @@ async def auto_correct_question(
     """
     user_id = user.id
 
-    # Check credits
-    if not check_user_has_credits(user_id):
-        return Response(status_code=status.HTTP_402_PAYMENT_REQUIRED, content="Insufficient credits")
-
     logger.info(
         "Received auto-correct request",
         extra={"gen_question_id": gen_question_id, "user_id": user_id},
     )
 
     try:
-        # Fetch Question
-        gen_question = supabase_client.table("gen_questions").select("*").eq("id", gen_question_id).execute()
+        # Check credits while fetching the question and its existing SVGs; all three are independent
+        # blocking calls, so their round trips overlap instead of adding up
+        has_credits, gen_question, gen_images = await asyncio.gather(
+            asyncio.to_thread(check_user_has_credits, user_id),
+            asyncio.to_thread(supabase_client.table("gen_questions").select("*").eq("id", gen_question_id).execute),
+            asyncio.to_thread(
+                supabase_client.table("gen_images")
+                .select("*")
+                .eq("gen_question_id", gen_question_id)
+                .order("position")
+                .execute
+            ),
+        )
+
+        # Insufficient credits takes precedence over a missing question, as when the check ran first
+        if not has_credits:
+            return Response(status_code=status.HTTP_402_PAYMENT_REQUIRED, content="Insufficient credits")
 
         if not gen_question.data:
             raise HTTPException(status_code=404, detail="Gen Question not found")
 
         gen_question_data = gen_question.data[0]
 
-        # Fetch existing SVGs for this question
-        gen_images = (
-            supabase_client.table("gen_images")
-            .select("*")
-            .eq("gen_question_id", gen_question_id)
-            .order("position")
-            .execute()
-        )
-
         # Add SVGs to gen_question_data
         if gen_images.data:
             logger.debug(
@@ -79,7 +79,7 @@ async def auto_correct_question(
         )
 
         # Deduct credits
-        deduct_user_credits(user_id, 2)
+        await asyncio.to_thread(deduct_user_credits, user_id, 2)
 
         return Response(status_code=status.HTTP_200_OK)
 
@@ -1,18 +1,68 @@
+import asyncio
+import hashlib
+import io
 import logging
-import os
+from collections import Counter
+from functools import partial
+from operator import attrgetter
 
 import supabase
 from google import genai
+from google.genai import errors as genai_errors
 from google.genai import types
-
-from api.v1.qgen.models import AllQuestions, AutoCorrectedQuestion
-from api.v1.qgen.prompts import auto_correct_questions_prompt
-from api.v1.qgen.utils.screenshot_utils import generate_screenshot, save_image_for_debug
+from pydantic import ValidationError
+
+from api.v1.qgen.gen_images_service import replace_gen_images
+from api.v1.qgen.models import AllQuestions, AutoCorrectedQuestion, AutoCorrectedQuestionList
+from api.v1.qgen.prompts import (
+    AUTO_CORRECT_SYSTEM_INSTRUCTION,
+    auto_correct_questions_batch_prompt,
+    auto_correct_questions_prompt,
+)
+from api.v1.qgen.utils.gemini_cache import SystemInstructionCache
+from api.v1.qgen.utils.gemini_client import get_gemini_client
+from api.v1.qgen.utils.gemini_limiter import gemini_limiter
+from api.v1.qgen.utils.micro_batcher import MicroBatcher
+from api.v1.qgen.utils.retry import backoff_delay, classify_error, run_hedged
+from api.v1.qgen.utils.screenshot_utils import (
+    SCREENSHOT_MIME_TYPE,
+    generate_screenshot,
+    save_image_for_debug_in_background,
+)
 from api.v1.qgen.version_service import create_new_version_on_update
+from config.settings import GEMINI_CONTEXT_CACHE_TTL
 from supabase_dir import GenImagesInsert
 
 logger = logging.getLogger(__name__)
 
+AUTO_CORRECT_MODEL = "gemini-2.5-flash"
+# Text-only corrections (no screenshot) are cheap enough for the lite model
+AUTO_CORRECT_LITE_MODEL = "gemini-2.5-flash-lite"
+
+# A second, speculative Gemini call is started when the first hasn't answered within this many
+# seconds; whichever validates first wins and the other is cancelled. Caps slow-call tail latency
+# without paying for two calls on every question.
+AUTO_CORRECT_HEDGE_DELAY = 20.0
+
+# JSON schema for the structured response, built once at import instead of on every request.
+# Passed as response_json_schema so the SDK forwards it without re-deriving it from the model.
+_AUTO_CORRECT_RESPONSE_SCHEMA = AutoCorrectedQuestion.model_json_schema()
+_AUTO_CORRECT_BATCH_RESPONSE_SCHEMA = AutoCorrectedQuestionList.model_json_schema()
+
+# Text-only corrections arriving within AUTO_CORRECT_BATCH_WAIT seconds of each other are sent to Gemini
+# together, up to AUTO_CORRECT_BATCH_SIZE per call
+AUTO_CORRECT_BATCH_SIZE = 8
+AUTO_CORRECT_BATCH_WAIT = 0.25
+
+# The correction instructions are identical on every call, so they are registered once per model as
+# Gemini cached content and requests only send the question (and screenshot)
+_system_instruction_cache = SystemInstructionCache(
+    AUTO_CORRECT_SYSTEM_INSTRUCTION, ttl_seconds=GEMINI_CONTEXT_CACHE_TTL
+)
+
+# In-flight correct_with_retries calls, keyed by a hash of the prompt and screenshot
+_inflight_corrections: dict[str, asyncio.Task] = {}
+
 
 class QuestionProcessingError(Exception):
     pass
@@ -22,41 +72,39 @@ class QuestionValidationError(Exception):
     pass
 
 
-def _log_prefix(retry_idx: int = None) -> str:
-    if retry_idx is not None:
-        return f"RETRY:{retry_idx} | "
-    return ""
-
-
 class AutoCorrectService:
     @staticmethod
-    async def process_question(
+    async def _generate(
         gemini_client: genai.Client,
-        gen_question_data: dict,
-        image_part: types.Part | None = None,
-        retry_idx: int = None,
-    ) -> dict:
-        prompt = auto_correct_questions_prompt(gen_question_data)
-        contents = []
-        if image_part:
-            contents.append(image_part)
-        contents.append(types.Part.from_text(text=prompt))
-
-        response = await gemini_client.aio.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=contents,
-            config={
-                "response_mime_type": "application/json",
-                # Note: We need to define schema or import it.
-                # For simplicity, we are using the one from models if available or simple dict
-                # The prompt implies a structure.
-                "response_schema": {
-                    "type": "OBJECT",
-                    "properties": {"question": {"type": "OBJECT"}},
-                },
-            },
-        )
-        return response
+        model: str,
+        contents: list,
+        response_json_schema: dict = _AUTO_CORRECT_RESPONSE_SCHEMA,
+    ) -> types.GenerateContentResponse:
+        """
+        Calls Gemini with the correction instructions, referencing their context cache when one exists.
+        """
+        config = {
+            "response_mime_type": "application/json",
+            "response_json_schema": response_json_schema,
+        }
+        cache_name = await _system_instruction_cache.get(gemini_client, model)
+        if cache_name:
+            try:
+                async with gemini_limiter.acquire():
+                    return await gemini_client.aio.models.generate_content(
+                        model=model, contents=contents, config={**config, "cached_content": cache_name}
+                    )
+            except genai_errors.ClientError as e:
+                # An expired or deleted cache must not fail the correction; resend the instructions inline
+                if e.code not in (400, 403, 404):
+                    raise
+                logger.warning(f"Gemini rejected context cache {cache_name}, sending instructions inline: {e}")
+                _system_instruction_cache.invalidate(model, cache_name)
+
+        async with gemini_limiter.acquire():
+            return await gemini_client.aio.models.generate_content(
+                model=model, contents=contents, config={**config, "system_instruction": AUTO_CORRECT_SYSTEM_INSTRUCTION}
+            )
 
     @staticmethod
     async def process_and_validate(
@@ -64,32 +112,187 @@ class AutoCorrectService:
         gen_question_data: dict,
         image_part: types.Part | None = None,
         retry_idx: int = None,
+        prompt_part: types.Part | None = None,
     ) -> AllQuestions:
         # Refined call with proper schema
-        prompt = auto_correct_questions_prompt(gen_question_data)
+        # Retry loops pass a prebuilt prompt_part so the prompt is rendered once per question
+        if prompt_part is None:
+            prompt_part = types.Part.from_text(text=auto_correct_questions_prompt(gen_question_data))
         contents = []
         if image_part:
             contents.append(image_part)
-        contents.append(types.Part.from_text(text=prompt))
-
-        response = await gemini_client.aio.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=contents,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": AutoCorrectedQuestion,
-            },
+        contents.append(prompt_part)
+
+        # Without a screenshot, try the lite model first and fall back to the full model if its output is invalid
+        models = (AUTO_CORRECT_MODEL,) if image_part else (AUTO_CORRECT_LITE_MODEL, AUTO_CORRECT_MODEL)
+        for model in models:
+            response = await AutoCorrectService._generate(gemini_client, model, contents)
+
+            try:
+                try:
+                    corrected_question = AutoCorrectedQuestion.model_validate_json(response.text).question
+                except ValidationError as e:
+                    raise QuestionValidationError(f"Failed to parse response: {e}") from e
+
+                if not corrected_question.question_text:
+                    raise QuestionValidationError("Corrected question missing question_text")
+
+                return corrected_question
+            except QuestionValidationError as e:
+                if model == models[-1]:
+                    raise
+                logger.warning(f"{model} returned an invalid correction, retrying with {models[-1]}: {e}")
+
+    @staticmethod
+    async def correct_text_only(gen_question_data: dict) -> AllQuestions:
+        """
+        Corrects a question without a screenshot. Concurrent calls are coalesced into batched Gemini
+        requests by _text_only_batcher.
+        """
+        return await _text_only_batcher.submit(gen_question_data)
+
+    @staticmethod
+    async def _correct_text_only_batch(gen_questions: list[dict]) -> list[AllQuestions | Exception]:
+        """
+        Corrects the questions coalesced by _text_only_batcher with one Gemini call. Questions the batched
+        answer doesn't cover (failed call, missing or repeated key, or invalid entry) are corrected individually.
+        """
+        gemini_client = get_gemini_client()
+        results: list[AllQuestions | Exception | None] = [None] * len(gen_questions)
+
+        if len(gen_questions) > 1:
+            # The questions come from different callers, so each correction is matched back to its question by
+            # the key it echoes rather than by position; untagged, unknown or repeated keys are never trusted
+            keys = [f"q{i}" for i in range(1, len(gen_questions) + 1)]
+            prompt = auto_correct_questions_batch_prompt(list(zip(keys, gen_questions, strict=True)))
+            try:
+                response = await AutoCorrectService._generate(
+                    gemini_client,
+                    AUTO_CORRECT_LITE_MODEL,
+                    [types.Part.from_text(text=prompt)],
+                    response_json_schema=_AUTO_CORRECT_BATCH_RESPONSE_SCHEMA,
+                )
+                corrections = AutoCorrectedQuestionList.model_validate_json(response.text).corrections
+                key_counts = Counter(correction.key for correction in corrections)
+                index_by_key = {key: i for i, key in enumerate(keys)}
+                for correction in corrections:
+                    i = index_by_key.get(correction.key)
+                    if i is not None and key_counts[correction.key] == 1 and correction.question.question_text:
+                        results[i] = correction.question
+            except Exception as e:
+                logger.warning(
+                    f"Batched correction of {len(gen_questions)} questions failed, correcting individually: {e}"
+                )
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        retried = await asyncio.gather(
+            *(AutoCorrectService.process_and_validate(gemini_client, gen_questions[i]) for i in missing),
+            return_exceptions=True,
         )
+        for i, result in zip(missing, retried, strict=True):
+            results[i] = result
+        return results
 
+    @staticmethod
+    async def upload_image(gemini_client: genai.Client, image_bytes: bytes) -> types.File | None:
+        """
+        Uploads the screenshot to the Gemini Files API so retries can reference it instead of resending it.
+        Returns None if the upload fails; callers keep sending the image inline in that case.
+        """
         try:
-            corrected_question = response.parsed.question
+            return await gemini_client.aio.files.upload(
+                file=io.BytesIO(image_bytes), config={"mime_type": SCREENSHOT_MIME_TYPE}
+            )
         except Exception as e:
-            raise QuestionValidationError(f"Failed to parse response: {e}") from e
+            logger.warning(f"Failed to upload screenshot to Gemini Files API, sending it inline: {e}")
+            return None
 
-        if not corrected_question.question_text:
-            raise QuestionValidationError("Corrected question missing question_text")
+    @staticmethod
+    async def correct_with_retries(
+        gemini_client: genai.Client,
+        gen_question_data: dict,
+        image_bytes: bytes,
+        max_retries: int = 5,
+    ) -> AllQuestions:
+        """
+        Calls Gemini until it returns a valid corrected question, backing off between attempts.
+        Only the Gemini call is retried; persisting the result is left to the caller.
 
-        return corrected_question
+        Concurrent corrections of the same question (same prompt and screenshot) share one in-flight
+        call instead of each paying for their own.
+        """
+        prompt = auto_correct_questions_prompt(gen_question_data)
+        key = hashlib.blake2b(prompt.encode() + image_bytes, digest_size=16).hexdigest()
+
+        task = _inflight_corrections.get(key)
+        if task is None:
+            task = asyncio.create_task(
+                AutoCorrectService._correct_with_retries(
+                    gemini_client, gen_question_data, image_bytes, prompt, max_retries
+                )
+            )
+            _inflight_corrections[key] = task
+            task.add_done_callback(lambda _: _inflight_corrections.pop(key, None))
+        # Shielded so one caller going away doesn't cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    @staticmethod
+    async def _correct_with_retries(
+        gemini_client: genai.Client,
+        gen_question_data: dict,
+        image_bytes: bytes,
+        prompt: str,
+        max_retries: int,
+    ) -> AllQuestions:
+        image_part = types.Part.from_bytes(data=image_bytes, mime_type=SCREENSHOT_MIME_TYPE)
+        prompt_part = types.Part.from_text(text=prompt)
+
+        uploaded_image = None
+        upload_attempted = False
+        try:
+            last_exception = None
+            for attempt in range(max_retries):
+                try:
+                    return await run_hedged(
+                        partial(
+                            AutoCorrectService.process_and_validate,
+                            gemini_client,
+                            gen_question_data,
+                            image_part,
+                            attempt + 1,
+                            prompt_part=prompt_part,
+                        ),
+                        hedge_delay=AUTO_CORRECT_HEDGE_DELAY,
+                        # A hedge that has to queue for the limiter only adds load when Gemini is already busy
+                        should_hedge=gemini_limiter.has_free_slot,
+                    )
+                except QuestionValidationError as e:
+                    # The same prompt keeps producing the same invalid output, so retrying only burns quota
+                    raise QuestionProcessingError(f"Auto-correct returned an invalid question: {e}") from e
+                except Exception as e:
+                    if classify_error(e) == "fatal":
+                        raise QuestionProcessingError(f"Gemini rejected the auto-correct request: {e}") from e
+                    last_exception = e
+                    logger.warning(f"Attempt {attempt + 1} failed: {e}")
+
+                if attempt + 1 < max_retries:
+                    # The first attempt sends the image inline; only upload it once we know it will be resent
+                    if not upload_attempted:
+                        upload_attempted = True
+                        uploaded_image = await AutoCorrectService.upload_image(gemini_client, image_bytes)
+                        if uploaded_image:
+                            image_part = types.Part.from_uri(
+                                file_uri=uploaded_image.uri, mime_type=SCREENSHOT_MIME_TYPE
+                            )
+                    await asyncio.sleep(backoff_delay(attempt))
+
+            raise QuestionProcessingError(f"Auto-correct failed after {max_retries} retries") from last_exception
+        finally:
+            if uploaded_image:
+                try:
+                    await gemini_client.aio.files.delete(name=uploaded_image.name)
+                except Exception as e:
+                    logger.warning(f"Failed to delete uploaded screenshot {uploaded_image.name}: {e}")
 
     @staticmethod
     async def correct_question(
@@ -102,74 +305,77 @@ class AutoCorrectService:
         logger.info(f"Generating screenshot for question {gen_question_id}")
         image_bytes = await generate_screenshot(gen_question_data, browser_service)
 
-        # Log/Save image
-        await save_image_for_debug(image_bytes, gen_question_id, "image/png")
-
-        image_part = types.Part.from_bytes(data=image_bytes, mime_type="image/png")
+        # Log/Save image in the background; it's informational and shouldn't delay the Gemini call
+        save_image_for_debug_in_background(image_bytes, gen_question_id, SCREENSHOT_MIME_TYPE)
 
         # 2. Call Gemini with Retry
-        gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-        max_retries = 5
+        corrected_question = await AutoCorrectService.correct_with_retries(
+            get_gemini_client(), gen_question_data, image_bytes
+        )
 
-        last_exception = None
-        for attempt in range(max_retries):
-            try:
-                corrected_question = await AutoCorrectService.process_and_validate(
-                    gemini_client, gen_question_data, image_part, attempt + 1
-                )
+        # 3. Update DB (not retried: a failed write shouldn't cost another Gemini call)
+        # Every optional field defaults to None, so only the fields Gemini actually returned need dumping.
+        # mode="json" yields JSON-native values in the same pass, so the client can encode the payload as-is.
+        update_data = corrected_question.model_dump(
+            mode="json", include=corrected_question.model_fields_set, exclude_none=True
+        )
 
-                # 3. Update DB
-                update_data = corrected_question.model_dump(exclude_none=True)
-
-                # Extract SVGs before updating gen_questions
-                # (svgs is not a column in gen_questions)
-                svg_list = update_data.pop("svgs", None)
-
-                # Map 'columns' to 'match_the_following_columns' if it exists
-                # (for match_the_following type)
-                if "columns" in update_data:
-                    cols = update_data.pop("columns")
-                    if isinstance(cols, list):
-                        dict_cols = {}
-                        for col in cols:
-                            if isinstance(col, dict):
-                                dict_cols[col["name"]] = col["items"]
-                            else:
-                                dict_cols[getattr(col, "name", "")] = getattr(col, "items", [])
-                        update_data["match_the_following_columns"] = dict_cols
+        # Extract SVGs before updating gen_questions
+        # (svgs is not a column in gen_questions)
+        svg_list = update_data.pop("svgs", None)
+
+        # Map 'columns' to 'match_the_following_columns' if it exists
+        # (for match_the_following type)
+        if "columns" in update_data:
+            cols = update_data.pop("columns")
+            if isinstance(cols, list):
+                dict_cols = {}
+                for col in cols:
+                    if isinstance(col, dict):
+                        dict_cols[col["name"]] = col["items"]
                     else:
-                        update_data["match_the_following_columns"] = cols
-
-                # Create new version before updating question
-                create_new_version_on_update(supabase_client, gen_question_id, update_data)
-
-                supabase_client.table("gen_questions").update(update_data).eq("id", gen_question_id).execute()
-
-                # Insert SVGs into gen_images table if present
-                if svg_list:
-                    logger.debug(f"SVGs generated for question {gen_question_id}: {len(svg_list)} SVG(s) found")
-
-                    # First, delete existing SVGs for this question (to replace with new ones)
-                    supabase_client.table("gen_images").delete().eq("gen_question_id", gen_question_id).execute()
-
-                    for position, svg_item in enumerate(svg_list, start=1):
-                        try:
-                            svg_string = svg_item.get("svg") if isinstance(svg_item, dict) else svg_item.svg
-                            if svg_string:
-                                gen_image = GenImagesInsert(
-                                    gen_question_id=gen_question_id,
-                                    svg_string=svg_string,
-                                    position=position,
-                                )
-                                supabase_client.table("gen_images").insert(
-                                    gen_image.model_dump(mode="json", exclude_none=True)
-                                ).execute()
-                        except Exception as svg_error:
-                            logger.warning(f"Failed to insert SVG for question {gen_question_id}: {svg_error}")
-
-                return True
-            except Exception as e:
-                last_exception = e
-                logger.warning(f"Attempt {attempt + 1} failed: {e}")
+                        dict_cols[getattr(col, "name", "")] = getattr(col, "items", [])
+                update_data["match_the_following_columns"] = dict_cols
+            else:
+                update_data["match_the_following_columns"] = cols
+
+        try:
+            # Record the new version and update the question concurrently. The version merges
+            # update_data over the stored row, so it comes out the same whichever write lands first.
+            await asyncio.gather(
+                asyncio.to_thread(create_new_version_on_update, supabase_client, gen_question_id, update_data),
+                asyncio.to_thread(
+                    supabase_client.table("gen_questions").update(update_data).eq("id", gen_question_id).execute
+                ),
+            )
+
+            # Insert SVGs into gen_images table if present
+            if svg_list:
+                logger.debug(f"SVGs generated for question {gen_question_id}: {len(svg_list)} SVG(s) found")
+
+                # Items all come from the same schema, so pick the accessor once for the whole list
+                get_svg = (lambda item: item.get("svg")) if isinstance(svg_list[0], dict) else attrgetter("svg")
+                gen_image_rows = []
+                for position, svg_item in enumerate(svg_list, start=1):
+                    svg_string = get_svg(svg_item)
+                    if svg_string:
+                        gen_image = GenImagesInsert(
+                            gen_question_id=gen_question_id,
+                            svg_string=svg_string,
+                            position=position,
+                        )
+                        gen_image_rows.append(gen_image.model_dump(mode="json", exclude_none=True))
+
+                # Replace the existing SVGs for this question with the new ones
+                await asyncio.to_thread(replace_gen_images, supabase_client, gen_question_id, gen_image_rows)
+        except Exception as e:
+            raise QuestionProcessingError(f"Failed to save auto-corrected question {gen_question_id}: {e}") from e
+
+        return True
+
 
-        raise QuestionProcessingError(f"Auto-correct failed after {max_retries} retries") from last_exception
+_text_only_batcher: MicroBatcher[dict, AllQuestions] = MicroBatcher(
+    AutoCorrectService._correct_text_only_batch,
+    max_batch_size=AUTO_CORRECT_BATCH_SIZE,
+    max_wait=AUTO_CORRECT_BATCH_WAIT,
+)
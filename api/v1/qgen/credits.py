@@ -1,14 +1,21 @@
 """
 Credits management logic for QGen.
+
+Deductions go through the deduct_credits Postgres function (supabase_dir/migrations), which floors and writes
+the new balance in one round trip and one statement, so concurrent requests cannot overwrite each other's
+deduction. Databases without the function fall back to a read followed by an update.
 """
 
 import logging
 import uuid
 
 from api.v1.auth import get_supabase_client
+from api.v1.qgen.utils.optional_rpc import OptionalRpc
 
 logger = logging.getLogger(__name__)
 
+_deduct_credits_rpc = OptionalRpc("deduct_credits")
+
 
 def check_user_has_credits(user_id: uuid.UUID) -> bool:
     """
@@ -22,13 +29,13 @@ def check_user_has_credits(user_id: uuid.UUID) -> bool:
     """
     try:
         supabase = get_supabase_client()
-        response = supabase.table("users").select("credits").eq("id", str(user_id)).single().execute()
+        response = supabase.table("users").select("credits").eq("id", str(user_id)).limit(1).execute()
 
         if not response.data:
             logger.warning(f"User {user_id} not found when checking credits.")
             return False
 
-        current_credits = response.data.get("credits", 0)
+        current_credits = response.data[0].get("credits") or 0
         return current_credits > 0
 
     except Exception as e:
@@ -37,6 +44,23 @@ def check_user_has_credits(user_id: uuid.UUID) -> bool:
         return False
 
 
+def _deduct_with_update(supabase, user_id: uuid.UUID, credits_used: int) -> None:
+    """
+    Fallback for databases without deduct_credits: read, floor at 0, write back.
+    """
+    response = supabase.table("users").select("credits").eq("id", str(user_id)).single().execute()
+
+    if not response.data:
+        logger.error(f"User {user_id} not found when deducting credits.")
+        return
+
+    current_credits = response.data.get("credits", 0)
+    new_credits = max(0, current_credits - credits_used)
+    supabase.table("users").update({"credits": new_credits}).eq("id", str(user_id)).execute()
+
+    logger.info(f"Deducted {credits_used} credits from user {user_id}. Old: {current_credits}, New: {new_credits}")
+
+
 def deduct_user_credits(user_id: uuid.UUID, credits_used: int) -> None:
     """
     Deducts credits from the user's account safely (floor at 0).
@@ -52,22 +76,15 @@ def deduct_user_credits(user_id: uuid.UUID, credits_used: int) -> None:
     try:
         supabase = get_supabase_client()
 
-        # 1. Fetch current credits
-        response = supabase.table("users").select("credits").eq("id", str(user_id)).single().execute()
-
-        if not response.data:
-            logger.error(f"User {user_id} not found when deducting credits.")
+        response = _deduct_credits_rpc.call(supabase, {"uid": str(user_id), "n": credits_used})
+        if response is not None:
+            if response.data is None:
+                logger.error(f"User {user_id} not found when deducting credits.")
+            else:
+                logger.info(f"Deducted {credits_used} credits from user {user_id}. New: {response.data}")
             return
 
-        current_credits = response.data.get("credits", 0)
-
-        # 2. Calculate new credits (floor at 0)
-        new_credits = max(0, current_credits - credits_used)
-
-        # 3. Update credits
-        supabase.table("users").update({"credits": new_credits}).eq("id", str(user_id)).execute()
-
-        logger.info(f"Deducted {credits_used} credits from user {user_id}. Old: {current_credits}, New: {new_credits}")
+        _deduct_with_update(supabase, user_id, credits_used)
 
     except Exception as e:
         logger.error(f"Error deducting credits for user {user_id}: {e}")
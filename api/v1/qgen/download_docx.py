@@ -1,16 +1,23 @@
+import asyncio
+import copy
 import io
 import logging
 import re
+from collections.abc import Iterable
+from urllib.parse import urlsplit, urlunsplit
 
+import httpx
 import math2docx
-import requests
 import supabase
+from cachetools import TTLCache
 from docx import Document
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_TAB_ALIGNMENT
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
-from docx.shared import Inches, Mm, Pt
+from docx.shared import Inches, Length, Mm, Pt
+from docx.text.paragraph import Paragraph
 from fastapi import Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from api.v1.auth import get_supabase_client
@@ -20,32 +27,266 @@ from api.v1.qgen.paper_layout_config import (
     PAGE_MARGIN_RIGHT_MM,
     PAGE_MARGIN_TOP_MM,
 )
-from api.v1.qgen.utils.paper_utils import fetch_paper_data, format_duration
+from api.v1.qgen.utils.paper_utils import (
+    etag_matches,
+    fetch_paper_data,
+    format_duration,
+    group_questions_by_section,
+    iter_chunks,
+    paper_etag,
+)
 
 logger = logging.getLogger(__name__)
 
+# Display ($$...$$, \[...\]) and inline ($...$, \(...\)) math. The capturing group makes re.split keep
+# each math span, so math always lands at the odd indices of the split.
+_LATEX_RE = re.compile(r"(\$\$.*?\$\$|\$.*?\$|\\\(.*?\\\)|\\\[.*?\\\])")
+# Delimiter width by a span's first two characters; anything else is a single "$"
+_LATEX_DELIMITER_WIDTH = {"$$": 2, "\\[": 2, "\\(": 2}
 
-class DownloadDocxRequest(BaseModel):
-    draft_id: str
-    mode: str  # "paper" or "answer"
+# Code points that are not valid XML 1.0 characters (C0 controls other than tab/LF/CR, surrogates,
+# U+FFFE/U+FFFF), mapped to None so str.translate drops them
+_XML_INVALID_CHARS = dict.fromkeys(
+    [*(c for c in range(0x20) if c not in (0x9, 0xA, 0xD)), *range(0xD800, 0xE000), 0xFFFE, 0xFFFF]
+)
 
 
-async def download_docx(
-    download_req: DownloadDocxRequest,
-    fastapi_request: Request,
-    supabase_client: supabase.Client = Depends(get_supabase_client),
-):
+def remove_control_characters(text):
     """
-    API endpoint to generate and download a DOCX of the question paper.
+    Removes non-printable control characters that are invalid in XML 1.0.
+    Valid characters are:
+    #x9 | #xA | #xD | [#x20-#xD7FF] | [#xE000-#xFFFD] | [#x10000-#x10FFFF]
     """
-    logger.info(
-        "Received download_docx request",
-        extra={"draft_id": download_req.draft_id, "mode": download_req.mode},
-    )
+    if not text:
+        return ""
+    return text.translate(_XML_INVALID_CHARS)
 
-    # 1. Fetch Paper Data
-    data = await fetch_paper_data(download_req.draft_id, supabase_client)
 
+# Logo and question image downloads; generous, since a slow image shouldn't drop it from the paper
+_IMAGE_DOWNLOAD_TIMEOUT = httpx.Timeout(20.0)
+_IMAGE_DOWNLOAD_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=20)
+# Created on first use, inside the running event loop
+_image_client: httpx.AsyncClient | None = None
+
+# Downloaded logos and question images by URL, bounded by total bytes. Logos in particular are fetched for
+# every download of a draft but almost never change.
+_image_cache: TTLCache = TTLCache(maxsize=64 * 1024 * 1024, ttl=3600, getsizeof=len)
+
+# Finished documents by ETag, bounded by total bytes. The ETag hashes everything the document is built from,
+# so any edit to the draft, its sections or questions produces a new key and stale entries just age out.
+_docx_cache: TTLCache = TTLCache(maxsize=128 * 1024 * 1024, ttl=86400, getsizeof=len)
+
+# Fixed document dimensions, converted to EMUs once instead of for every paper/question
+_BODY_FONT_SIZE = Pt(12)
+_SECTION_FONT_SIZE = Pt(14)
+_TITLE_FONT_SIZE = Pt(16)
+_INSTITUTE_FONT_SIZE = Pt(20)
+_LOGO_HEIGHT = Inches(0.6)
+_META_TABLE_WIDTH = Inches(6)
+_QUESTION_IMAGE_WIDTH = Inches(2.5)
+_DEFAULT_PAGE_WIDTH = Inches(8.5)
+_DEFAULT_MARGIN = Inches(1.0)
+
+_DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def _get_image_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide client for logo/image downloads. Images almost all come from the same storage
+    host, so keeping the connections alive skips a TCP+TLS handshake per image on later downloads.
+    """
+    global _image_client
+
+    if _image_client is None:
+        _image_client = httpx.AsyncClient(
+            timeout=_IMAGE_DOWNLOAD_TIMEOUT,
+            limits=_IMAGE_DOWNLOAD_LIMITS,
+            follow_redirects=True,
+            http2=True,
+        )
+    return _image_client
+
+
+async def close_image_client() -> None:
+    """Closes the shared image client; called on app shutdown."""
+    global _image_client
+
+    if _image_client is not None:
+        await _image_client.aclose()
+        _image_client = None
+
+
+def _image_cache_key(url: str) -> str:
+    """
+    Supabase signed URLs carry a fresh token on every request, so they are keyed on the object path;
+    any other URL is keyed as-is.
+    """
+    parts = urlsplit(url)
+    if "/storage/v1/object/sign/" in parts.path:
+        return urlunsplit(parts._replace(query=""))
+    return url
+
+
+async def _fetch_image_bytes(client: httpx.AsyncClient, url: str) -> bytes | None:
+    """Returns the image at url from the cache or the network; None (and nothing cached) unless it's a 200."""
+    key = _image_cache_key(url)
+    if (cached := _image_cache.get(key)) is not None:
+        return cached
+
+    response = await client.get(url)
+    if response.status_code != 200:
+        logger.warning(f"Failed to download image for DOCX {url}: HTTP {response.status_code}")
+        return None
+
+    content = response.content
+    # Images larger than the whole cache budget are served but not kept
+    if len(content) <= _image_cache.maxsize:
+        _image_cache[key] = content
+    return content
+
+
+async def _download_images(urls: Iterable[str]) -> dict[str, bytes]:
+    """
+    Downloads the given image URLs concurrently over the shared connection pool, serving repeats from the cache.
+    Failed or non-200 downloads are logged and left out, so the DOCX is built without them.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    images = {}
+    missing = []
+    for url in unique_urls:
+        if (cached := _image_cache.get(_image_cache_key(url))) is not None:
+            images[url] = cached
+        else:
+            missing.append(url)
+    if not missing:
+        return images
+
+    client = _get_image_client()
+    results = await asyncio.gather(*(_fetch_image_bytes(client, url) for url in missing), return_exceptions=True)
+
+    for url, result in zip(missing, results, strict=True):
+        if isinstance(result, Exception):
+            logger.warning(f"Failed to download image for DOCX {url}: {result}")
+        elif result is not None:
+            images[url] = result
+    return images
+
+
+def _add_bold_run(paragraph, text: str, size: Length | None = None, underline: bool = False):
+    """Adds a bold run (optionally sized/underlined) to paragraph and returns it."""
+    run = paragraph.add_run(text)
+    run.bold = True
+    if underline:
+        run.underline = True
+    if size is not None:
+        run.font.size = size
+    return run
+
+
+def _build_no_border_tbl_borders():
+    tbl_borders = OxmlElement("w:tblBorders")
+    for border_name in ["top", "left", "bottom", "right", "insideH", "insideV"]:
+        border = OxmlElement(f"w:{border_name}")
+        border.set(qn("w:val"), "nil")
+        tbl_borders.append(border)
+    return tbl_borders
+
+
+def _build_horizontal_rule_p_bdr():
+    p_bdr = OxmlElement("w:pBdr")
+    bottom = OxmlElement("w:bottom")
+    bottom.set(qn("w:val"), "single")
+    bottom.set(qn("w:sz"), "6")  # 6 = 3/4 pt
+    bottom.set(qn("w:space"), "1")
+    bottom.set(qn("w:color"), "auto")
+    p_bdr.append(bottom)
+    return p_bdr
+
+
+# Border XML is identical for every table/rule, so it is built once and deep-copied into each document
+_NO_BORDER_TBL_BORDERS = _build_no_border_tbl_borders()
+_HORIZONTAL_RULE_P_BDR = _build_horizontal_rule_p_bdr()
+
+
+def set_table_no_border(table):
+    """Remove all borders from a table to make it invisible."""
+    tbl = table._tbl
+    # Get or create tblPr element
+    tbl_pr = tbl.tblPr
+    if tbl_pr is None:
+        tbl_pr = OxmlElement("w:tblPr")
+        tbl.insert(0, tbl_pr)
+
+    tbl_pr.append(copy.deepcopy(_NO_BORDER_TBL_BORDERS))
+
+
+def add_horizontal_rule(paragraph):
+    """Adds a bottom border to the paragraph to create a horizontal line."""
+    p = paragraph._p
+    pPr = p.get_or_add_pPr()
+    pBdr = copy.deepcopy(_HORIZONTAL_RULE_P_BDR)
+
+    # Ensure pBdr is inserted before alignment (jc) or other spacing elements
+    # if they exist to respect some schema strictness, though mostly for jc.
+    # Ideally pBdr is early in pPr.
+    # Find first element that should come AFTER pBdr?
+    # Schema: pStyle, keepNext, keepLines, pageBreakBefore, framePr,
+    #         widowControl, numPr, suppressLineNumbers, pBdr
+    # So we append, unless we see something that must be after.
+    # But simply appending usually works for 'jc' if 'jc' isn't set yet.
+    # If we set alignment later, python-docx handles it?
+    # Let's just insert at the beginning of pPr to be safe if no pStyle,
+    # or after pStyle if it exists.
+
+    if len(pPr) > 0 and pPr[0].tag == qn("w:pStyle"):
+        pPr.insert(1, pBdr)
+        return
+
+    pPr.insert(0, pBdr)  # Insert as first element/early element safe bet for fresh para
+
+
+def add_text_with_math(paragraph, text, context_info=""):
+    if not text:
+        return
+    # Most text has no "$" or "\\", so it can't contain a LaTeX span and skips the regex split entirely
+    parts = _LATEX_RE.split(text) if "$" in text or "\\" in text else (text,)
+    for index, part in enumerate(parts):
+        if not part:
+            continue
+
+        # Odd indices are the captured LaTeX spans
+        if index % 2:
+            # Clean delimiters
+            width = _LATEX_DELIMITER_WIDTH.get(part[:2], 1)
+            clean_latex = part[width:-width]
+
+            # Render into a detached staging paragraph so a failed conversion leaves nothing to roll back
+            staging = Paragraph(OxmlElement("w:p"), paragraph._parent)
+            try:
+                math2docx.add_math(staging, clean_latex)
+            except Exception as e:
+                logger.warning(f"Failed to add math [{context_info}]: '{part}' -> {e}")
+                try:
+                    sanitized_part = remove_control_characters(part)
+                    paragraph.add_run(sanitized_part)  # Fallback to text
+                except Exception as e_run:
+                    logger.error(f"Fallback add_run failed for part '{part}': {e_run}")
+            else:
+                # Appending moves each element out of the staging paragraph
+                paragraph._p.extend(list(staging._p))
+        else:
+            try:
+                sanitized_part = remove_control_characters(part)
+                paragraph.add_run(sanitized_part)
+            except Exception as e_run:
+                logger.error(f"Standard add_run failed for part '{part}': {e_run}")
+
+
+def _build_docx(data: dict, mode: str, downloaded_images: dict[str, bytes]) -> io.BytesIO:
+    """
+    Builds the DOCX for a paper from fetch_paper_data output, with its images already downloaded
+    (keyed by URL). Synchronous and CPU-bound, so the endpoint runs it in a worker thread.
+    """
     draft = data["draft"]
     sections = data["sections"]
     questions = data["questions"]
@@ -58,360 +299,261 @@ async def download_docx(
     show_instructions = draft.get("is_show_instruction", True)
     show_explanation = draft.get("is_show_explanation_answer_key", True)
 
-    latex_regex = r"(\$\$.*?\$\$|\$.*?\$|\\\(.*?\\\)|\\\[.*?\\\])"
-
-    def set_table_no_border(table):
-        """Remove all borders from a table to make it invisible."""
-        tbl = table._tbl
-        # Get or create tblPr element
-        tbl_pr = tbl.tblPr
-        if tbl_pr is None:
-            tbl_pr = OxmlElement("w:tblPr")
-            tbl.insert(0, tbl_pr)
-
-        # Create and add borders element
-        tbl_borders = OxmlElement("w:tblBorders")
-        for border_name in ["top", "left", "bottom", "right", "insideH", "insideV"]:
-            border = OxmlElement(f"w:{border_name}")
-            border.set(qn("w:val"), "nil")
-            tbl_borders.append(border)
-        tbl_pr.append(tbl_borders)
-
-    def add_horizontal_rule(paragraph):
-        """Adds a bottom border to the paragraph to create a horizontal line."""
-        p = paragraph._p
-        pPr = p.get_or_add_pPr()
-        pBdr = OxmlElement("w:pBdr")
-
-        bottom = OxmlElement("w:bottom")
-        bottom.set(qn("w:val"), "single")
-        bottom.set(qn("w:sz"), "6")  # 6 = 3/4 pt
-        bottom.set(qn("w:space"), "1")
-        bottom.set(qn("w:color"), "auto")
-        pBdr.append(bottom)
-
-        # Ensure pBdr is inserted before alignment (jc) or other spacing elements
-        # if they exist to respect some schema strictness, though mostly for jc.
-        # Ideally pBdr is early in pPr.
-        # Find first element that should come AFTER pBdr?
-        # Schema: pStyle, keepNext, keepLines, pageBreakBefore, framePr,
-        #         widowControl, numPr, suppressLineNumbers, pBdr
-        # So we append, unless we see something that must be after.
-        # But simply appending usually works for 'jc' if 'jc' isn't set yet.
-        # If we set alignment later, python-docx handles it?
-        # Let's just insert at the beginning of pPr to be safe if no pStyle,
-        # or after pStyle if it exists.
-
-        if len(pPr) > 0 and pPr[0].tag == qn("w:pStyle"):
-            pPr.insert(1, pBdr)
-            return
-
-        pPr.insert(0, pBdr)  # Insert as first element/early element safe bet for fresh para
-
-    def remove_control_characters(text):
-        """
-        Removes non-printable control characters that are invalid in XML 1.0.
-        Valid characters are:
-        #x9 | #xA | #xD | [#x20-#xD7FF] | [#xE000-#xFFFD] | [#x10000-#x10FFFF]
-        """
-        if not text:
-            return ""
-        return "".join(
-            ch
-            for ch in text
-            if (
-                (0x20 <= ord(ch) <= 0xD7FF)
-                or (0xE000 <= ord(ch) <= 0xFFFD)
-                or (0x10000 <= ord(ch) <= 0x10FFFF)
-                or ch in ("\t", "\n", "\r")
-            )
-        )
+    doc = Document()
 
-    def add_text_with_math(paragraph, text, context_info=""):
-        if not text:
-            return
-        parts = re.split(latex_regex, text)
-        for part in parts:
-            if not part:
-                continue
-
-            # Check if part is LaTeX
-            is_latex = re.match(latex_regex, part)
-            if is_latex:
-                # Clean delimiters
-                clean_latex = part
-                if part.startswith("$$") and part.endswith("$$"):
-                    clean_latex = part[2:-2]
-                elif part.startswith("$") and part.endswith("$"):
-                    clean_latex = part[1:-1]
-                elif part.startswith("\\[") and part.endswith("\\]"):
-                    clean_latex = part[2:-2]
-                elif part.startswith("\\(") and part.endswith("\\)"):
-                    clean_latex = part[2:-2]
+    # Set page margins from config (synced with frontend/PDF)
+    section = doc.sections[0]
+    section.top_margin = Mm(PAGE_MARGIN_TOP_MM)
+    section.right_margin = Mm(PAGE_MARGIN_RIGHT_MM)
+    section.bottom_margin = Mm(PAGE_MARGIN_BOTTOM_MM)
+    section.left_margin = Mm(PAGE_MARGIN_LEFT_MM)
 
-                try:
-                    # Capture state before attempt
-                    initial_msg_count = len(paragraph._p)
-                    # logger.info(
-                    #     f"DEBUG: Before math '{clean_latex[:20]}', "
-                    #     f"children: {initial_msg_count}"
-                    # )
-
-                    math2docx.add_math(paragraph, clean_latex)
-
-                    # logger.info(f"DEBUG: Success adding math. Children: {len(paragraph._p)}")
-                except Exception as e:
-                    logger.warning(f"Failed to add math [{context_info}]: '{part}' -> {e}")
-
-                    # Rollback
-                    current_msg_count = len(paragraph._p)
-                    # logger.debug(
-                    #     f"DEBUG: Rollback triggered. Initial: {initial_msg_count}, "
-                    #     f"Current: {current_msg_count}"
-                    # )
-
-                    if current_msg_count > initial_msg_count:
-                        diff = current_msg_count - initial_msg_count
-                        logger.debug(f"DEBUG: Removing {diff} elements causing corruption.")
-                        for _ in range(diff):
-                            # Remove the last element
-                            if len(paragraph._p) > 0:
-                                removed = paragraph._p[-1]
-                                # logger.debug(f"DEBUG: Removing XML tag: {removed.tag}")
-                                paragraph._p.remove(removed)
+    # Set default font
+    style = doc.styles["Normal"]
+    font = style.font
+    font.name = "Times New Roman"
+    font.size = _BODY_FONT_SIZE
 
+    # Header Section ... (rest remains similar but using add_text_with_math)
+    if show_logo and logo_url in downloaded_images:
+        try:
+            image_stream = io.BytesIO(downloaded_images[logo_url])
+            p = doc.add_paragraph()
+            p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+            run = p.add_run()
+            run.add_picture(image_stream, height=_LOGO_HEIGHT)
+        except Exception as e:
+            logger.warning(f"Failed to add logo to DOCX: {e}")
+
+    # Institute Name
+    h1 = doc.add_paragraph()
+    h1.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    _add_bold_run(h1, draft.get("institute_name") or "Institute Name", size=_INSTITUTE_FONT_SIZE)
+
+    # Paper Title
+    h2 = doc.add_paragraph()
+    h2.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    title_suffix = " - Answer Key" if mode == "answer" else ""
+    _add_bold_run(h2, (draft.get("paper_title") or "Examination Paper") + title_suffix, size=_TITLE_FONT_SIZE)
+
+    # Meta Information Table
+    table = doc.add_table(rows=2, cols=2)
+    table.width = _META_TABLE_WIDTH
+    set_table_no_border(table)  # Hide borders
+
+    # Row 1
+    cells_r1 = table.rows[0].cells
+    cells_r1[0].text = f"Subject: {draft.get('subject_name') or '..........'}"
+    cells_r1[1].text = f"Class: {draft.get('school_class_name') or '..........'}"
+    cells_r1[1].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
+
+    # Row 2
+    cells_r2 = table.rows[1].cells
+    cells_r2[0].text = f"Max. Marks: {draft.get('maximum_marks') or '...'}"
+    cells_r2[1].text = f"Duration: {format_duration(draft.get('paper_duration'))}"
+    cells_r2[1].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
+
+    # Horizontal Rule
+    hr_p = doc.add_paragraph()
+    add_horizontal_rule(hr_p)
+
+    # Instructions
+    if mode == "paper" and show_instructions and instructions:
+        _add_bold_run(doc.add_paragraph(), "General Instructions:")
+        for inst in instructions:
+            p = doc.add_paragraph(style="List Number")
+            add_text_with_math(p, inst.get("instruction_text"))
+
+    # Calculate available width for right alignment
+    doc_section = doc.sections[0]
+    # Use safe defaults if margins are not set (though usually they are)
+    page_width = doc_section.page_width or _DEFAULT_PAGE_WIDTH
+    left_margin = doc_section.left_margin or _DEFAULT_MARGIN
+    right_margin = doc_section.right_margin or _DEFAULT_MARGIN
+    printable_width = page_width - left_margin - right_margin
+
+    questions_by_section = group_questions_by_section(questions)
+
+    # Sections and Questions - global indexing for consistent numbering across sections
+    global_question_index = 0
+    for section in sections:
+        section_questions = questions_by_section.get(section["id"])
+        if not section_questions:
+            continue
+
+        total_marks = sum(q["marks"] for q in section_questions)
+
+        p = doc.add_paragraph()
+        p.paragraph_format.tab_stops.add_tab_stop(printable_width, WD_TAB_ALIGNMENT.RIGHT)
+
+        _add_bold_run(p, f"{section.get('section_name')}", size=_SECTION_FONT_SIZE, underline=True)
+        _add_bold_run(p, f"\t[{total_marks}]", size=_SECTION_FONT_SIZE)
+
+        p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+
+        for q in section_questions:
+            global_question_index += 1
+            q_p = doc.add_paragraph()
+
+            # Add right-aligned tab stop
+            q_p.paragraph_format.tab_stops.add_tab_stop(printable_width, WD_TAB_ALIGNMENT.RIGHT)
+
+            _add_bold_run(q_p, f"{global_question_index}. ")
+
+            # Question Text with Math
+            add_text_with_math(q_p, q.get("question_text", ""), f"Q{global_question_index}-Text")
+
+            m_run = q_p.add_run(f"\t[{q.get('marks')}]")
+            m_run.italic = True
+            q_p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+
+            # Images
+            q_images = images_map.get(q["id"], [])
+            for img in q_images:
+                image_bytes = downloaded_images.get(img.get("img_url"))
+                if image_bytes:
                     try:
-                        sanitized_part = remove_control_characters(part)
-                        paragraph.add_run(sanitized_part)  # Fallback to text
-                    except Exception as e_run:
-                        logger.error(f"Fallback add_run failed for part '{part}': {e_run}")
-            else:
-                try:
-                    sanitized_part = remove_control_characters(part)
-                    paragraph.add_run(sanitized_part)
-                except Exception as e_run:
-                    logger.error(f"Standard add_run failed for part '{part}': {e_run}")
-
-    # 3. Build DOCX
+                        doc.add_picture(io.BytesIO(image_bytes), width=_QUESTION_IMAGE_WIDTH)
+                    except Exception:
+                        pass
+
+            # Options (MCQ)
+            if mode == "paper":
+                if q.get("question_type") in ["mcq4", "msq4"]:
+                    opt_table = doc.add_table(rows=2, cols=2)
+                    set_table_no_border(opt_table)  # Hide borders
+                    opts = [
+                        q.get("option1"),
+                        q.get("option2"),
+                        q.get("option3"),
+                        q.get("option4"),
+                    ]
+                    labels = ["a) ", "b) ", "c) ", "d) "]
+                    for i, opt in enumerate(opts):
+                        row = i // 2
+                        col = i % 2
+                        if opt:
+                            cell_p = opt_table.rows[row].cells[col].paragraphs[0]
+                            _add_bold_run(cell_p, labels[i])
+                            add_text_with_math(cell_p, str(opt), f"Q{global_question_index}-Opt{i + 1}")
+                elif q.get("question_type") == "match_the_following":
+                    cols = q.get("match_the_following_columns") or {}
+                    col_names = list(cols.keys())
+                    if len(col_names) >= 2:
+                        left_col = cols[col_names[0]]
+                        right_col = cols[col_names[1]]
+                        max_rows = max(len(left_col), len(right_col))
+
+                        match_table = doc.add_table(rows=max_rows + 1, cols=2)
+                        set_table_no_border(match_table)
+
+                        # Headers
+                        for c_idx, name in enumerate(col_names[:2]):
+                            cell_p = match_table.rows[0].cells[c_idx].paragraphs[0]
+                            _add_bold_run(cell_p, name)
+
+                        # Items
+                        for r_idx in range(max_rows):
+                            left_item = left_col[r_idx] if r_idx < len(left_col) else ""
+                            right_item = right_col[r_idx] if r_idx < len(right_col) else ""
+
+                            # Left Col
+                            l_cell_p = match_table.rows[r_idx + 1].cells[0].paragraphs[0]
+                            _add_bold_run(l_cell_p, f"{r_idx + 1}. ")
+                            add_text_with_math(l_cell_p, str(left_item), f"Q{global_question_index}-L{r_idx}")
+
+                            # Right Col
+                            r_cell_p = match_table.rows[r_idx + 1].cells[1].paragraphs[0]
+                            _add_bold_run(r_cell_p, f"{chr(65 + r_idx)}. ")
+                            add_text_with_math(r_cell_p, str(right_item), f"Q{global_question_index}-R{r_idx}")
+
+            # Answer Key
+            if mode == "answer":
+                ans_p = doc.add_paragraph()
+                _add_bold_run(ans_p, "Ans: ")
+                add_text_with_math(ans_p, str(q.get("answer_text") or "N/A"), f"Q{global_question_index}-Ans")
+
+                if show_explanation and q.get("explanation"):
+                    exp_p = doc.add_paragraph()
+                    _add_bold_run(exp_p, "Explanation: ")
+                    add_text_with_math(exp_p, str(q["explanation"]), f"Q{global_question_index}-Expl")
+
+            # Page Break
+            if q.get("is_page_break_below"):
+                doc.add_page_break()
+
+    # Save to BytesIO
+    target_stream = io.BytesIO()
     try:
-        doc = Document()
-
-        # Set page margins from config (synced with frontend/PDF)
-        section = doc.sections[0]
-        section.top_margin = Mm(PAGE_MARGIN_TOP_MM)
-        section.right_margin = Mm(PAGE_MARGIN_RIGHT_MM)
-        section.bottom_margin = Mm(PAGE_MARGIN_BOTTOM_MM)
-        section.left_margin = Mm(PAGE_MARGIN_LEFT_MM)
-
-        # Set default font
-        style = doc.styles["Normal"]
-        font = style.font
-        font.name = "Times New Roman"
-        font.size = Pt(12)
-
-        # Header Section ... (rest remains similar but using add_text_with_math)
-        if show_logo and logo_url:
-            try:
-                response = requests.get(logo_url)
-                if response.status_code == 200:
-                    image_stream = io.BytesIO(response.content)
-                    p = doc.add_paragraph()
-                    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    run = p.add_run()
-                    run.add_picture(image_stream, height=Inches(0.6))
-            except Exception as e:
-                logger.warning(f"Failed to add logo to DOCX: {e}")
-
-        # Institute Name
-        h1 = doc.add_paragraph()
-        h1.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        run = h1.add_run(draft.get("institute_name") or "Institute Name")
-        run.bold = True
-        run.font.size = Pt(20)
-
-        # Paper Title
-        h2 = doc.add_paragraph()
-        h2.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        title_suffix = " - Answer Key" if download_req.mode == "answer" else ""
-        run = h2.add_run((draft.get("paper_title") or "Examination Paper") + title_suffix)
-        run.bold = True
-        run.font.size = Pt(16)
-
-        # Meta Information Table
-        table = doc.add_table(rows=2, cols=2)
-        table.width = Inches(6)
-        set_table_no_border(table)  # Hide borders
-
-        # Row 1
-        cells_r1 = table.rows[0].cells
-        cells_r1[0].text = f"Subject: {draft.get('subject_name') or '..........'}"
-        cells_r1[1].text = f"Class: {draft.get('school_class_name') or '..........'}"
-        cells_r1[1].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-
-        # Row 2
-        cells_r2 = table.rows[1].cells
-        cells_r2[0].text = f"Max. Marks: {draft.get('maximum_marks') or '...'}"
-        cells_r2[1].text = f"Duration: {format_duration(draft.get('paper_duration'))}"
-        cells_r2[1].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.RIGHT
-
-        # Horizontal Rule
-        hr_p = doc.add_paragraph()
-        add_horizontal_rule(hr_p)
-
-        # Instructions
-        if download_req.mode == "paper" and show_instructions and instructions:
-            doc.add_paragraph("General Instructions:").runs[0].bold = True
-            for inst in instructions:
-                p = doc.add_paragraph(style="List Number")
-                add_text_with_math(p, inst.get("instruction_text"))
-
-        # Calculate available width for right alignment
-        doc_section = doc.sections[0]
-        # Use safe defaults if margins are not set (though usually they are)
-        page_width = doc_section.page_width or Inches(8.5)
-        left_margin = doc_section.left_margin or Inches(1.0)
-        right_margin = doc_section.right_margin or Inches(1.0)
-        printable_width = page_width - left_margin - right_margin
-
-        # Sections and Questions - global indexing for consistent numbering across sections
-        global_question_index = 0
-        for section in sections:
-            section_questions = sorted(
-                [q for q in questions if q["qgen_draft_section_id"] == section["id"]],
-                key=lambda q: q.get("position_in_draft", 0),
-            )
-            if not section_questions:
-                continue
-
-            total_marks = sum(q.get("marks", 0) for q in section_questions)
+        doc.save(target_stream)
+    except Exception as e:
+        logger.error(f"Failed to save DOCX (content corruption check): {e}")
+        raise HTTPException(status_code=500, detail="Document generation corrupted") from e
+
+    target_stream.seek(0)
+    return target_stream
 
-            p = doc.add_paragraph()
-            p.paragraph_format.tab_stops.add_tab_stop(printable_width, WD_TAB_ALIGNMENT.RIGHT)
-
-            run = p.add_run(f"{section.get('section_name')}")
-            run.bold = True
-            run.underline = True
-            run.font.size = Pt(14)
-
-            m_run = p.add_run(f"\t[{total_marks}]")
-            m_run.bold = True
-            m_run.font.size = Pt(14)
-
-            p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-
-            for q in section_questions:
-                global_question_index += 1
-                q_p = doc.add_paragraph()
-
-                # Add right-aligned tab stop
-                q_p.paragraph_format.tab_stops.add_tab_stop(printable_width, WD_TAB_ALIGNMENT.RIGHT)
-
-                q_p.add_run(f"{global_question_index}. ").bold = True
-
-                # Question Text with Math
-                add_text_with_math(q_p, q.get("question_text", ""), f"Q{global_question_index}-Text")
-
-                m_run = q_p.add_run(f"\t[{q.get('marks')}]")
-                m_run.italic = True
-                q_p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-
-                # Images
-                q_images = images_map.get(q["id"], [])
-                for img in q_images:
-                    if img.get("img_url"):
-                        try:
-                            resp = requests.get(img["img_url"])
-                            if resp.status_code == 200:
-                                doc.add_picture(io.BytesIO(resp.content), width=Inches(2.5))
-                        except Exception:
-                            pass
-
-                # Options (MCQ)
-                if download_req.mode == "paper":
-                    if q.get("question_type") in ["mcq4", "msq4"]:
-                        opt_table = doc.add_table(rows=2, cols=2)
-                        set_table_no_border(opt_table)  # Hide borders
-                        opts = [
-                            q.get("option1"),
-                            q.get("option2"),
-                            q.get("option3"),
-                            q.get("option4"),
-                        ]
-                        labels = ["a) ", "b) ", "c) ", "d) "]
-                        for i, opt in enumerate(opts):
-                            row = i // 2
-                            col = i % 2
-                            if opt:
-                                cell_p = opt_table.rows[row].cells[col].paragraphs[0]
-                                cell_p.add_run(labels[i]).bold = True
-                                add_text_with_math(cell_p, str(opt), f"Q{global_question_index}-Opt{i + 1}")
-                    elif q.get("question_type") == "match_the_following":
-                        cols = q.get("match_the_following_columns") or {}
-                        col_names = list(cols.keys())
-                        if len(col_names) >= 2:
-                            left_col = cols[col_names[0]]
-                            right_col = cols[col_names[1]]
-                            max_rows = max(len(left_col), len(right_col))
-
-                            match_table = doc.add_table(rows=max_rows + 1, cols=2)
-                            set_table_no_border(match_table)
-
-                            # Headers
-                            for c_idx, name in enumerate(col_names[:2]):
-                                cell_p = match_table.rows[0].cells[c_idx].paragraphs[0]
-                                cell_p.add_run(name).bold = True
-
-                            # Items
-                            for r_idx in range(max_rows):
-                                left_item = left_col[r_idx] if r_idx < len(left_col) else ""
-                                right_item = right_col[r_idx] if r_idx < len(right_col) else ""
-
-                                # Left Col
-                                l_cell_p = match_table.rows[r_idx + 1].cells[0].paragraphs[0]
-                                l_cell_p.add_run(f"{r_idx + 1}. ").bold = True
-                                add_text_with_math(l_cell_p, str(left_item), f"Q{global_question_index}-L{r_idx}")
-
-                                # Right Col
-                                r_cell_p = match_table.rows[r_idx + 1].cells[1].paragraphs[0]
-                                r_cell_p.add_run(f"{chr(65 + r_idx)}. ").bold = True
-                                add_text_with_math(r_cell_p, str(right_item), f"Q{global_question_index}-R{r_idx}")
-
-                # Answer Key
-                if download_req.mode == "answer":
-                    ans_p = doc.add_paragraph()
-                    ans_p.add_run("Ans: ").bold = True
-                    add_text_with_math(ans_p, str(q.get("answer_text") or "N/A"), f"Q{global_question_index}-Ans")
-
-                    if show_explanation and q.get("explanation"):
-                        exp_p = doc.add_paragraph()
-                        exp_p.add_run("Explanation: ").bold = True
-                        add_text_with_math(exp_p, str(q["explanation"]), f"Q{global_question_index}-Expl")
-
-                # Page Break
-                if q.get("is_page_break_below"):
-                    doc.add_page_break()
-
-        # Save to BytesIO
-        target_stream = io.BytesIO()
-        try:
-            doc.save(target_stream)
-        except Exception as e:
-            logger.error(f"Failed to save DOCX (content corruption check): {e}")
-            raise HTTPException(status_code=500, detail="Document generation corrupted") from e
 
-        target_stream.seek(0)
+class DownloadDocxRequest(BaseModel):
+    draft_id: str
+    mode: str  # "paper" or "answer"
 
-        filename = f"{draft.get('paper_title', 'Paper')}_{download_req.mode}.docx"
 
-        return Response(
-            content=target_stream.read(),
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f"attachment; filename={filename}"},
+async def download_docx(
+    download_req: DownloadDocxRequest,
+    fastapi_request: Request,
+    supabase_client: supabase.Client = Depends(get_supabase_client),
+):
+    """
+    API endpoint to generate and download a DOCX of the question paper.
+    """
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Received download_docx request",
+            extra={"draft_id": download_req.draft_id, "mode": download_req.mode},
         )
 
+    # 1. Fetch Paper Data
+    data = await fetch_paper_data(download_req.draft_id, supabase_client)
+
+    draft = data["draft"]
+    logo_url = data["logo_url"]
+    filename = f"{draft.get('paper_title', 'Paper')}_{download_req.mode}.docx"
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "ETag": paper_etag(data, download_req.mode),
+        "Cache-Control": "private, no-cache",
+    }
+
+    # Unchanged since the client's copy, or already built for someone else
+    if etag_matches(fastapi_request.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=304, headers={"ETag": headers["ETag"], "Cache-Control": headers["Cache-Control"]})
+    if (cached := _docx_cache.get(headers["ETag"])) is not None:
+        return StreamingResponse(iter_chunks(io.BytesIO(cached)), media_type=_DOCX_MEDIA_TYPE, headers=headers)
+
+    # 2. Download the logo and every question image up front, concurrently
+    image_urls = [img["img_url"] for q_images in data["images_map"].values() for img in q_images if img.get("img_url")]
+    if draft.get("is_show_logo", True) and logo_url:
+        image_urls.append(logo_url)
+    downloaded_images = await _download_images(image_urls)
+    if not downloaded_images.keys() >= set(image_urls):
+        # Built without some images: serve it, but don't cache it or let the client revalidate against it,
+        # or one failed download would stick to this ETag
+        del headers["ETag"]
+        headers["Cache-Control"] = "no-store"
+
+    # 3. Build DOCX (CPU-bound lxml work, kept off the event loop)
+    try:
+        docx_stream = await asyncio.to_thread(_build_docx, data, download_req.mode, downloaded_images)
     except HTTPException:
         # Re-raise HTTPExceptions so they aren't caught by the general Exception block
         raise
     except Exception as e:
         logger.exception("DOCX generation failed")
         raise HTTPException(status_code=500, detail="Failed to generate DOCX") from e
+
+    document = docx_stream.getvalue()
+    if "ETag" in headers and len(document) <= _docx_cache.maxsize:
+        _docx_cache[headers["ETag"]] = document
+
+    return StreamingResponse(iter_chunks(docx_stream), media_type=_DOCX_MEDIA_TYPE, headers=headers)
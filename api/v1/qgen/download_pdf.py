@@ -1,8 +1,17 @@
+import asyncio
+import io
 import logging
+import re
+import zipfile
+from html import escape as _html_escape
+from typing import Literal
+from urllib.parse import quote
 
 import supabase
+from cachetools import TTLCache
 from fastapi import Depends, HTTPException, Request, Response
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 from api.v1.auth import get_supabase_client
 from api.v1.qgen.paper_layout_config import (
@@ -29,475 +38,611 @@ from api.v1.qgen.paper_layout_config import (
     SECTION_MARGIN_TOP,
     get_pdf_margins,
 )
-from api.v1.qgen.utils.paper_utils import fetch_paper_data, format_duration
+from api.v1.qgen.utils.katex_assets import KATEX_HEAD_HTML, KATEX_READY
+from api.v1.qgen.utils.paper_utils import (
+    etag_matches,
+    fetch_paper_data,
+    format_duration,
+    group_questions_by_section,
+    iter_chunks,
+    paper_etag,
+)
 
 logger = logging.getLogger(__name__)
 
+_OPTION_LABELS = ("a)", "b)", "c)", "d)")
 
-class DownloadPdfRequest(BaseModel):
-    draft_id: str
-    mode: str  # "paper" or "answer"
+# Rendered PDFs by ETag, bounded by total bytes. The ETag hashes everything the paper is rendered from, so any
+# edit to the draft, its sections or questions produces a new key and stale entries just age out.
+_pdf_cache: TTLCache = TTLCache(maxsize=128 * 1024 * 1024, ttl=86400, getsizeof=len)
 
+# Anything but letters, digits and a few separators is replaced when a paper title becomes a file name
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^\w\- .()]+")
 
-async def download_pdf(
-    download_req: DownloadPdfRequest,
-    request: Request,
-    supabase_client: supabase.Client = Depends(get_supabase_client),
-):
+
+def _e(value) -> str:
     """
-    API endpoint to generate and download a PDF of the question paper.
+    HTML-escapes a database value for text or a quoted attribute. LaTeX survives: KaTeX reads the decoded
+    text nodes. SVG strings are markup and are inserted unescaped.
     """
-    logger.info(
-        "Received download_pdf request",
-        extra={"draft_id": download_req.draft_id, "mode": download_req.mode},
-    )
-
-    # 1. Fetch Paper Data using shared utility
-    data = await fetch_paper_data(download_req.draft_id, supabase_client)
-
-    draft = data["draft"]
-    sections = data["sections"]
-    questions = data["questions"]
-    instructions = data["instructions"]
-    logo_url = data["logo_url"]
-    images_map = data["images_map"]
-
-    # 6. Generate HTML
-    html_content = generate_paper_html(
-        draft, sections, questions, instructions, logo_url, download_req.mode, images_map
-    )
-
-    # 7. Convert to PDF using Queue-based Browser Service
-    try:
-        browser_service = getattr(request.app.state, "browser_service", None)
-        if not browser_service:
-            logger.error("Browser service instance not found in app state")
-            raise HTTPException(
-                status_code=503,
-                detail="PDF generation service is currently initializing or unavailable.",
-            )
-
-        pdf_bytes = await browser_service.generate_pdf(
-            html_content,
-            pdf_options={"format": "A4", "print_background": True, "margin": get_pdf_margins()},
-        )
-
-        filename = f"{draft.get('paper_title', 'Paper')}_{download_req.mode}.pdf"
-        return Response(
-            content=pdf_bytes,
-            media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename={filename}"},
-        )
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("PDF generation failed")
-        raise HTTPException(status_code=500, detail="Failed to generate PDF") from e
-
-
-def generate_paper_html(draft, sections, questions, instructions, logo_url, mode, images_map=None):
-    # Get toggle values from draft (default to True for backward compatibility)
-    show_logo = draft.get("is_show_logo", True)
-    show_instructions = draft.get("is_show_instruction", True)
-    show_explanation = draft.get("is_show_explanation_answer_key", True)
-
-    # CSS for the paper - Values from paper_layout_config.py (synced with frontend index.css)
-    css = (
-        """
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
-
-    body {
-        font-family: 'Times New Roman', Times, serif;
-        color: black;
-        line-height: 1.5;
-        padding: 0;
-        margin: 0;
-        -webkit-print-color-adjust: exact;
-    }
+    return "" if value is None else _html_escape(str(value))
 
-    .page {
-        padding: 0;
-        box-sizing: border-box;
-    }
-
-    .header {
-        text-align: center;
-        margin-bottom: """
-        + HEADER_MARGIN_BOTTOM
-        + """;
-    }
 
-    .logo {
-        height: """
-        + HEADER_LOGO_HEIGHT
-        + """;
-        width: auto;
-        margin-bottom: """
-        + HEADER_LOGO_MARGIN_BOTTOM
-        + """;
-        object-fit: contain;
-    }
+# CSS for the paper - Values from paper_layout_config.py (synced with frontend index.css); built once at import
+_PAPER_CSS = (
+    """
+body {
+    font-family: 'Times New Roman', Times, serif;
+    color: black;
+    line-height: 1.5;
+    padding: 0;
+    margin: 0;
+    -webkit-print-color-adjust: exact;
+}
+
+.page {
+    padding: 0;
+    box-sizing: border-box;
+}
+
+.header {
+    text-align: center;
+    margin-bottom: """
+    + HEADER_MARGIN_BOTTOM
+    + """;
+}
+
+.logo {
+    height: """
+    + HEADER_LOGO_HEIGHT
+    + """;
+    width: auto;
+    margin-bottom: """
+    + HEADER_LOGO_MARGIN_BOTTOM
+    + """;
+    object-fit: contain;
+}
+
+.institute-name {
+    font-size: 24px;
+    font-weight: bold;
+    text-transform: uppercase;
+    letter-spacing: 0.025em;
+    margin: 0;
+    line-height: 1.2;
+}
+
+.paper-title {
+    font-size: 20px;
+    font-weight: bold;
+    margin: """
+    + HEADER_TITLE_MARGIN_TOP
+    + """ 0 0 0;
+    line-height: 1.2;
+}
+
+.meta-box {
+    border-top: 2px solid black;
+    border-bottom: 2px solid black;
+    padding: """
+    + HEADER_META_PADDING_Y
+    + """ 8px;
+    margin-top: """
+    + HEADER_META_MARGIN_TOP
+    + """;
+    display: flex;
+    justify-content: space-between;
+    font-weight: bold;
+    font-size: 14px;
+}
+
+.meta-column {
+    display: flex;
+    flex-direction: column;
+    gap: """
+    + HEADER_META_GAP
+    + """;
+}
+
+.instructions {
+    margin-bottom: """
+    + INSTRUCTIONS_MARGIN_BOTTOM
+    + """;
+    border-bottom: 2px solid black;
+    padding-bottom: """
+    + INSTRUCTIONS_PADDING_BOTTOM
+    + """;
+}
+
+.instructions-title {
+    font-weight: bold;
+    font-size: 14px;
+    margin-bottom: """
+    + INSTRUCTIONS_TITLE_MARGIN_BOTTOM
+    + """;
+}
+
+.instructions-list {
+    margin: 0;
+    padding-left: """
+    + INSTRUCTIONS_LIST_PADDING_LEFT
+    + """;
+    font-size: 14px;
+    font-weight: 500;
+    list-style-type: decimal;
+}
+
+.instructions-list li {
+    padding-left: 4px;
+    margin-bottom: """
+    + INSTRUCTIONS_ITEM_GAP
+    + """;
+}
+
+.section-header {
+    display: flex;
+    position: relative;
+    justify-content: center;
+    align-items: baseline;
+    margin-top: """
+    + SECTION_MARGIN_TOP
+    + """;
+    margin-bottom: """
+    + SECTION_MARGIN_BOTTOM
+    + """;
+}
+
+.section-name {
+    font-size: 18px;
+    font-weight: bold;
+    text-transform: uppercase;
+    text-decoration: underline;
+}
+
+.section-marks {
+    position: absolute;
+    right: 0;
+    font-weight: bold;
+    font-size: 14px;
+}
+
+.question {
+    margin-bottom: """
+    + QUESTION_MARGIN_BOTTOM
+    + """;
+    display: flex;
+    gap: """
+    + QUESTION_FLEX_GAP
+    + """;
+    page-break-inside: avoid;
+}
+
+.q-number {
+    font-weight: 600;
+    min-width: 20px;
+}
+
+.q-content {
+    flex: 1;
+}
+
+.q-row {
+    display: flex;
+    justify-content: space-between;
+    align-items: flex-start;
+}
+
+.q-text {
+    font-size: 15px;
+    color: #1f2937;
+}
+
+.q-marks {
+    font-weight: 600;
+    font-size: 13px;
+    color: #6b7280;
+    white-space: nowrap;
+    margin-left: 8px;
+}
+
+.options-grid {
+    display: grid;
+    grid-template-columns: repeat(2, 1fr);
+    gap: """
+    + OPTIONS_GAP_Y
+    + " "
+    + OPTIONS_GAP_X
+    + """;
+    margin-top: """
+    + OPTIONS_MARGIN_TOP
+    + """;
+}
+
+.option {
+    display: flex;
+    gap: 8px;
+    font-size: 15px;
+}
+
+.opt-label {
+    font-weight: 600;
+    color: #1f2937;
+}
+
+.answer-container {
+    margin-top: """
+    + ANSWER_MARGIN_BOTTOM
+    + """;
+    display: flex;
+    gap: 4px;
+}
+
+.ans-label {
+    font-weight: 600;
+    font-size: 15px;
+}
+
+.explanation-container {
+    margin-top: """
+    + ANSWER_EXPLANATION_MARGIN_TOP
+    + """;
+    font-size: 15px;
+}
+
+.exp-label {
+    font-weight: 600;
+    text-decoration: none;
+    margin-right: 4px;
+}
+
+.images-container {
+    display: flex;
+    flex-wrap: wrap;
+    gap: 8px;
+    margin: 8px 0;
+}
+
+.q-image {
+    max-height: 96px;
+    max-width: 100%;
+    object-fit: contain;
+}
+
+.q-svg {
+    max-width: 100%;
+    height: auto;
+}
+
+.page-break {
+    page-break-after: always;
+}
+
+/* Katex matching */
+.katex { font-size: 1.05em !important; }
+</style>
+"""
+)
 
-    .institute-name {
-        font-size: 24px;
-        font-weight: bold;
-        text-transform: uppercase;
-        letter-spacing: 0.025em;
-        margin: 0;
-        line-height: 1.2;
-    }
+# KaTeX Auto-render configuration script
+_KATEX_SCRIPT = """
+<script>
+    document.addEventListener("DOMContentLoaded", function() {
+        try {
+            renderMathInElement(document.body, {
+                delimiters: [
+                    {left: '$$', right: '$$', display: true},
+                    {left: '$', right: '$', display: false},
+                    {left: '\\\\(', right: '\\\\)', display: false},
+                    {left: '\\\\( ', right: ' \\\\)', display: false},
+                    {left: '\\\\(  ', right: '  \\\\)', display: false},
+                    {left: '\\\\[', right: '\\\\]', display: true}
+                ],
+                throwOnError : false
+            });
+            window.__katexOk = true;
+        } finally {
+            // Signal KATEX_READY once the math fonts are in, even if rendering failed
+            document.fonts.ready.then(function() { window.__katexDone = true; });
+        }
+    });
+</script>
+"""
+
+# Truthy once the math has rendered and every image and font has loaded. Renders that fall short are served
+# but never cached or given an ETag, so a transient load failure doesn't outlive the request.
+_PAPER_COMPLETE = (
+    "window.__katexOk === true"
+    " && Array.from(document.images).every(img => img.complete && img.naturalWidth > 0)"
+    " && !Array.from(document.fonts).some(font => font.status === 'error')"
+)
 
-    .paper-title {
-        font-size: 20px;
-        font-weight: bold;
-        margin: """
-        + HEADER_TITLE_MARGIN_TOP
-        + """ 0 0 0;
-        line-height: 1.2;
-    }
 
-    .meta-box {
-        border-top: 2px solid black;
-        border-bottom: 2px solid black;
-        padding: """
-        + HEADER_META_PADDING_Y
-        + """ 8px;
-        margin-top: """
-        + HEADER_META_MARGIN_TOP
-        + """;
-        display: flex;
-        justify-content: space-between;
-        font-weight: bold;
-        font-size: 14px;
-    }
-
-    .meta-column {
-        display: flex;
-        flex-direction: column;
-        gap: """
-        + HEADER_META_GAP
-        + """;
-    }
+class DownloadPdfRequest(BaseModel):
+    draft_id: str
+    mode: str  # "paper" or "answer"
 
-    .instructions {
-        margin-bottom: """
-        + INSTRUCTIONS_MARGIN_BOTTOM
-        + """;
-        border-bottom: 2px solid black;
-        padding-bottom: """
-        + INSTRUCTIONS_PADDING_BOTTOM
-        + """;
-    }
 
-    .instructions-title {
-        font-weight: bold;
-        font-size: 14px;
-        margin-bottom: """
-        + INSTRUCTIONS_TITLE_MARGIN_BOTTOM
-        + """;
-    }
+class DownloadPdfsRequest(BaseModel):
+    draft_id: str
+    modes: list[Literal["paper", "answer"]] = Field(min_length=1, max_length=2)
 
-    .instructions-list {
-        margin: 0;
-        padding-left: """
-        + INSTRUCTIONS_LIST_PADDING_LEFT
-        + """;
-        font-size: 14px;
-        font-weight: 500;
-        list-style-type: decimal;
-    }
 
-    .instructions-list li {
-        padding-left: 4px;
-        margin-bottom: """
-        + INSTRUCTIONS_ITEM_GAP
-        + """;
-    }
+def _safe_filename(title: str | None) -> str:
+    """
+    Reduces a user-supplied paper title to a file name without quotes, path separators or control characters,
+    so it can be used for zip entries and in a Content-Disposition header.
+    """
+    return _UNSAFE_FILENAME_CHARS.sub("_", title or "").strip(" ._")[:100] or "Paper"
 
-    .section-header {
-        display: flex;
-        position: relative;
-        justify-content: center;
-        align-items: baseline;
-        margin-top: """
-        + SECTION_MARGIN_TOP
-        + """;
-        margin-bottom: """
-        + SECTION_MARGIN_BOTTOM
-        + """;
-    }
 
-    .section-name {
-        font-size: 18px;
-        font-weight: bold;
-        text-transform: uppercase;
-        text-decoration: underline;
-    }
+def _attachment_disposition(filename: str) -> str:
+    """
+    Builds a Content-Disposition header with an ASCII fallback name and the full name in RFC 5987 filename*.
+    """
+    ascii_name = filename.encode("ascii", "replace").decode("ascii").replace("?", "_")
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
 
-    .section-marks {
-        position: absolute;
-        right: 0;
-        font-weight: bold;
-        font-size: 14px;
-    }
 
-    .question {
-        margin-bottom: """
-        + QUESTION_MARGIN_BOTTOM
-        + """;
-        display: flex;
-        gap: """
-        + QUESTION_FLEX_GAP
-        + """;
-        page-break-inside: avoid;
-    }
+def _get_browser_service(request: Request):
+    browser_service = getattr(request.app.state, "browser_service", None)
+    if not browser_service:
+        logger.error("Browser service instance not found in app state")
+        raise HTTPException(
+            status_code=503,
+            detail="PDF generation service is currently initializing or unavailable.",
+        )
+    return browser_service
 
-    .q-number {
-        font-weight: 600;
-        min-width: 20px;
-    }
 
-    .q-content {
-        flex: 1;
-    }
+async def _render_pdf(browser_service, data: dict, mode: str, etag: str) -> tuple[bytes, bool]:
+    """
+    Generates the paper HTML for mode from fetch_paper_data output and prints it to PDF, reusing the
+    bytes already rendered for etag. Returns the PDF and whether it rendered completely; only complete
+    renders are cached.
+    """
+    if (cached := _pdf_cache.get(etag)) is not None:
+        return cached, True
 
-    .q-row {
-        display: flex;
-        justify-content: space-between;
-        align-items: flex-start;
-    }
+    html_content = generate_paper_html(
+        data["draft"],
+        data["sections"],
+        data["questions"],
+        data["instructions"],
+        data["logo_url"],
+        mode,
+        data["images_map"],
+    )
+    pdf_bytes, complete = await browser_service.render_pdf(
+        html_content,
+        pdf_options={"format": "A4", "print_background": True, "margin": get_pdf_margins()},
+        ready_function=KATEX_READY,
+        complete_function=_PAPER_COMPLETE,
+    )
+    if not complete:
+        logger.warning("Paper PDF rendered with missing math, images or fonts; not caching it")
+    elif len(pdf_bytes) <= _pdf_cache.maxsize:
+        _pdf_cache[etag] = pdf_bytes
+    return pdf_bytes, complete
 
-    .q-text {
-        font-size: 15px;
-        color: #1f2937;
-    }
 
-    .q-marks {
-        font-weight: 600;
-        font-size: 13px;
-        color: #6b7280;
-        white-space: nowrap;
-        margin-left: 8px;
-    }
+async def download_pdf(
+    download_req: DownloadPdfRequest,
+    request: Request,
+    supabase_client: supabase.Client = Depends(get_supabase_client),
+):
+    """
+    API endpoint to generate and download a PDF of the question paper.
+    """
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Received download_pdf request",
+            extra={"draft_id": download_req.draft_id, "mode": download_req.mode},
+        )
 
-    .options-grid {
-        display: grid;
-        grid-template-columns: repeat(2, 1fr);
-        gap: """
-        + OPTIONS_GAP_Y
-        + " "
-        + OPTIONS_GAP_X
-        + """;
-        margin-top: """
-        + OPTIONS_MARGIN_TOP
-        + """;
-    }
+    # 1. Fetch Paper Data using shared utility
+    data = await fetch_paper_data(download_req.draft_id, supabase_client)
 
-    .option {
-        display: flex;
-        gap: 8px;
-        font-size: 15px;
+    filename = f"{data['draft'].get('paper_title', 'Paper')}_{download_req.mode}.pdf"
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "ETag": paper_etag(data, download_req.mode),
+        "Cache-Control": "private, no-cache",
     }
 
-    .opt-label {
-        font-weight: 600;
-        color: #1f2937;
-    }
+    # Unchanged since the client's copy
+    if etag_matches(request.headers.get("If-None-Match"), headers["ETag"]):
+        return Response(status_code=304, headers={"ETag": headers["ETag"], "Cache-Control": headers["Cache-Control"]})
 
-    .answer-container {
-        margin-top: """
-        + ANSWER_MARGIN_BOTTOM
-        + """;
-        display: flex;
-        gap: 4px;
-    }
+    # 2. Generate HTML and convert to PDF using Queue-based Browser Service (or reuse an earlier render)
+    try:
+        pdf_bytes, complete = await _render_pdf(_get_browser_service(request), data, download_req.mode, headers["ETag"])
+        if not complete:
+            # Don't let the client revalidate against a partial render either
+            del headers["ETag"]
+            headers["Cache-Control"] = "no-store"
+        return StreamingResponse(iter_chunks(io.BytesIO(pdf_bytes)), media_type="application/pdf", headers=headers)
 
-    .ans-label {
-        font-weight: 600;
-        font-size: 15px;
-    }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("PDF generation failed")
+        raise HTTPException(status_code=500, detail="Failed to generate PDF") from e
 
-    .explanation-container {
-        margin-top: """
-        + ANSWER_EXPLANATION_MARGIN_TOP
-        + """;
-        font-size: 15px;
-    }
 
-    .exp-label {
-        font-weight: 600;
-        text-decoration: none;
-        margin-right: 4px;
-    }
+async def download_pdfs(
+    download_req: DownloadPdfsRequest,
+    request: Request,
+    supabase_client: supabase.Client = Depends(get_supabase_client),
+):
+    """
+    API endpoint to generate several PDFs of the question paper (e.g. paper and answer key) in one request.
 
-    .images-container {
-        display: flex;
-        flex-wrap: wrap;
-        gap: 8px;
-        margin: 8px 0;
-    }
+    The paper data is fetched once and the PDFs are rendered concurrently, then returned as one zip.
+    """
+    modes = list(dict.fromkeys(download_req.modes))
 
-    .q-image {
-        max-height: 96px;
-        max-width: 100%;
-        object-fit: contain;
-    }
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "Received download_pdfs request",
+            extra={"draft_id": download_req.draft_id, "modes": modes},
+        )
 
-    .q-svg {
-        max-width: 100%;
-        height: auto;
-    }
+    # 1. Fetch Paper Data once for every mode
+    data = await fetch_paper_data(download_req.draft_id, supabase_client)
+    title = _safe_filename(data["draft"].get("paper_title"))
 
-    .page-break {
-        page-break-after: always;
-    }
+    # 2. Render all modes concurrently; the browser workers print them in parallel
+    try:
+        browser_service = _get_browser_service(request)
+        renders = await asyncio.gather(
+            *(_render_pdf(browser_service, data, mode, paper_etag(data, mode)) for mode in modes)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("PDF generation failed")
+        raise HTTPException(status_code=500, detail="Failed to generate PDF") from e
 
-    /* Katex matching */
-    .katex { font-size: 1.05em !important; }
-    </style>
-    """
+    # 3. Bundle as a zip; PDFs are already compressed, so they are stored as-is
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_STORED) as zf:
+        for mode, (pdf_bytes, _) in zip(modes, renders, strict=True):
+            zf.writestr(f"{title}_{mode}.pdf", pdf_bytes)
+    archive.seek(0)
+
+    return StreamingResponse(
+        iter_chunks(archive),
+        media_type="application/zip",
+        headers={"Content-Disposition": _attachment_disposition(f"{title}.zip")},
     )
 
-    # KaTeX Auto-render configuration script
-    katex_script = """
-    <script>
-        document.addEventListener("DOMContentLoaded", function() {
-            renderMathInElement(document.body, {
-                delimiters: [
-                    {left: '$$', right: '$$', display: true},
-                    {left: '$', right: '$', display: false},
-                    {left: '\\\\(', right: '\\\\)', display: false},
-                    {left: '\\\\( ', right: ' \\\\)', display: false},
-                    {left: '\\\\(  ', right: '  \\\\)', display: false},
-                    {left: '\\\\[', right: '\\\\]', display: true}
-                ],
-                throwOnError : false
-            });
-        });
-    </script>
-    """
 
-    html = f"""
+def generate_paper_html(draft, sections, questions, instructions, logo_url, mode, images_map=None):
+    # Get toggle values from draft (default to True for backward compatibility)
+    show_logo = draft.get("is_show_logo", True)
+    show_instructions = draft.get("is_show_instruction", True)
+    show_explanation = draft.get("is_show_explanation_answer_key", True)
+
+    out = [
+        f"""
     <!DOCTYPE html>
     <html>
     <head>
         <meta charset="UTF-8">
-        <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/katex@0.16.8/dist/katex.min.css">
-        <script src="https://cdn.jsdelivr.net/npm/katex@0.16.8/dist/katex.min.js"></script>
-        <script src="https://cdn.jsdelivr.net/npm/katex@0.16.8/dist/contrib/auto-render.min.js"></script>
-        <style>{css}</style>
+        {KATEX_HEAD_HTML}
+        <style>{_PAPER_CSS}</style>
     </head>
     <body>
         <div class="page">
             <div class="header">
-                {f'<img src="{logo_url}" class="logo">' if show_logo and logo_url else ""}
-                <div class="institute-name">{draft.get("institute_name") or "Institute Name"}</div>
-                <div class="paper-title">{draft.get("paper_title") or "Examination Paper"}{
-        " - Answer Key" if mode == "answer" else ""
-    }</div>
+                {f'<img src="{_e(logo_url)}" class="logo">' if show_logo and logo_url else ""}
+                <div class="institute-name">{_e(draft.get("institute_name") or "Institute Name")}</div>
+                <div class="paper-title">{_e(draft.get("paper_title") or "Examination Paper")}{
+            " - Answer Key" if mode == "answer" else ""
+        }</div>
 
                 <div class="meta-box">
                     <div class="meta-column" style="text-align: left;">
-                        <span>Subject: {draft.get("subject_name") or "..................."}</span>
-                        <span>Class: {draft.get("school_class_name") or "..................."}</span>
+                        <span>Subject: {_e(draft.get("subject_name") or "...................")}</span>
+                        <span>Class: {_e(draft.get("school_class_name") or "...................")}</span>
                     </div>
                     <div class="meta-column" style="text-align: right;">
-                        <span>Max. Marks: {draft.get("maximum_marks") or "..."}</span>
-                        <span>Duration: {format_duration(draft.get("paper_duration"))}</span>
+                        <span>Max. Marks: {_e(draft.get("maximum_marks") or "...")}</span>
+                        <span>Duration: {_e(format_duration(draft.get("paper_duration")))}</span>
                     </div>
                 </div>
             </div>
+            """
+    ]
 
-            {
-        f'''
-            <div class="instructions">
-                <div class="instructions-title">General Instructions:</div>
-                <ol class="instructions-list">
-                    {''.join(f"<li>{inst.get('instruction_text')}</li>" for inst in instructions)}
-                </ol>
-            </div>
-            '''
-        if mode == "paper" and show_instructions and instructions
-        else ""
-    }
+    if mode == "paper" and show_instructions and instructions:
+        out.append(
+            '<div class="instructions"><div class="instructions-title">General Instructions:</div>'
+            '<ol class="instructions-list">'
+        )
+        for inst in instructions:
+            out.append("<li>")
+            out.append(_e(inst.get("instruction_text")))
+            out.append("</li>")
+        out.append("</ol></div>")
 
-            {render_all_sections(sections, questions, mode, images_map, show_explanation)}
-        </div>
-        {katex_script}
-    </body>
-    </html>
-    """
-    return html
+    render_all_sections(out, sections, questions, mode, images_map, show_explanation)
+
+    out.append("</div>")
+    out.append(_KATEX_SCRIPT)
+    out.append("</body></html>")
+    return "".join(out)
 
 
-def render_all_sections(sections, all_questions, mode, images_map=None, show_explanation=True):
-    """Render all sections with global question numbering."""
-    html_parts = []
+def render_all_sections(out, sections, all_questions, mode, images_map=None, show_explanation=True):
+    """Render all sections with global question numbering, appending the HTML to out."""
     global_question_index = 0
+    questions_by_section = group_questions_by_section(all_questions)
 
     for section in sections:
-        section_questions = sorted(
-            [q for q in all_questions if q["qgen_draft_section_id"] == section["id"]],
-            key=lambda q: q.get("position_in_draft", 0),
-        )
+        section_questions = questions_by_section.get(section["id"])
         if not section_questions:
             continue
 
-        total_marks = sum(q.get("marks", 0) for q in section_questions)
+        total_marks = sum(q["marks"] for q in section_questions)
+
+        out.append('<div class="section-container"><div class="section-header"><span class="section-name">')
+        out.append(_e(section.get("section_name")))
+        out.append('</span><span class="section-marks">[')
+        out.append(str(total_marks))
+        out.append("]</span></div>")
 
-        questions_html = []
         for q in section_questions:
             global_question_index += 1
-            questions_html.append(
-                render_question(
-                    q,
-                    global_question_index,
-                    mode,
-                    images_map.get(q["id"], []) if images_map else [],
-                    show_explanation,
-                )
+            render_question(
+                out,
+                q,
+                global_question_index,
+                mode,
+                images_map.get(q["id"], []) if images_map else [],
+                show_explanation,
             )
 
-        section_html = f"""
-        <div class="section-container">
-            <div class="section-header">
-                <span class="section-name">{section.get("section_name")}</span>
-                <span class="section-marks">[{total_marks}]</span>
-            </div>
-            {"".join(questions_html)}
-        </div>
-        """
-        html_parts.append(section_html)
-
-    return "".join(html_parts)
+        out.append("</div>")
 
 
-def render_question(q, display_idx, mode, images=None, show_explanation=True):
-    is_mcq = q.get("question_type") in ["mcq4", "msq4"]
+def render_question(out, q, display_idx, mode, images=None, show_explanation=True):
+    """Render one question, appending the HTML to out."""
+    out.append('<div class="question"><div class="q-number">')
+    out.append(str(display_idx))
+    out.append('.</div><div class="q-content"><div class="q-row"><div class="q-text">')
+    out.append(_e(q.get("question_text")))
+    out.append('</div><div class="q-marks">[')
+    out.append(_e(q.get("marks")))
+    out.append("]</div></div>")
 
     # Images rendering
-    images_html = ""
     if images:
-        images_html = '<div class="images-container">'
+        out.append('<div class="images-container">')
         for img in images:
             if img.get("svg_string"):
-                images_html += f'<div class="q-svg">{img["svg_string"]}</div>'
+                out.append('<div class="q-svg">')
+                out.append(img["svg_string"])
+                out.append("</div>")
             elif img.get("img_url"):
-                images_html += f'<img src="{img["img_url"]}" class="q-image">'
-        images_html += "</div>"
+                out.append('<img src="')
+                out.append(_e(img["img_url"]))
+                out.append('" class="q-image">')
+        out.append("</div>")
 
     # Options rendering
-    options_html = ""
     if mode == "paper":
-        if is_mcq:
+        if q.get("question_type") in ["mcq4", "msq4"]:
             options = [q.get("option1"), q.get("option2"), q.get("option3"), q.get("option4")]
-            options_html = '<div class="options-grid">'
-            labels = ["a)", "b)", "c)", "d)"]
-            for i, opt in enumerate(options):
+            out.append('<div class="options-grid">')
+            for label, opt in zip(_OPTION_LABELS, options, strict=True):
                 if opt:
-                    options_html += f'<div class="option"><span class="opt-label">{labels[i]}</span> {opt}</div>'
-            options_html += "</div>"
+                    out.append('<div class="option"><span class="opt-label">')
+                    out.append(label)
+                    out.append("</span> ")
+                    out.append(_e(opt))
+                    out.append("</div>")
+            out.append("</div>")
         elif q.get("question_type") == "match_the_following":
             cols = q.get("match_the_following_columns") or {}
             col_names = list(cols.keys())
@@ -506,60 +651,40 @@ def render_question(q, display_idx, mode, images=None, show_explanation=True):
                 right_col = cols[col_names[1]]
                 max_rows = max(len(left_col), len(right_col))
 
-                options_html = '<table class="match-table">'
-                options_html += (
-                    f'<tr><th style="text-align:left">{col_names[0]}</th>'
-                    f'<th style="text-align:left">{col_names[1]}</th></tr>'
-                )
+                out.append('<table class="match-table"><tr><th style="text-align:left">')
+                out.append(_e(col_names[0]))
+                out.append('</th><th style="text-align:left">')
+                out.append(_e(col_names[1]))
+                out.append("</th></tr>")
                 for i in range(max_rows):
                     left_item = left_col[i] if i < len(left_col) else ""
                     right_item = right_col[i] if i < len(right_col) else ""
 
-                    options_html += "<tr>"
-                    options_html += (
-                        f'<td><div class="match-item"><span class="match-prefix">{i + 1}.</span> {left_item}</div></td>'
-                    )
-                    options_html += (
-                        f'<td><div class="match-item">'
-                        f'<span class="match-prefix">{chr(65 + i)}.</span> {right_item}</div></td>'
-                    )
-                    options_html += "</tr>"
-                options_html += "</table>"
+                    out.append('<tr><td><div class="match-item"><span class="match-prefix">')
+                    out.append(str(i + 1))
+                    out.append(".</span> ")
+                    out.append(_e(left_item))
+                    out.append('</div></td><td><div class="match-item"><span class="match-prefix">')
+                    out.append(chr(65 + i))
+                    out.append(".</span> ")
+                    out.append(_e(right_item))
+                    out.append("</div></td></tr>")
+                out.append("</table>")
 
     # Answer rendering
-    answer_html = ""
     if mode == "answer":
-        answer_text = q.get("answer_text") or "N/A"
-        explanation_html = ""
+        out.append('<div class="answer-container"><span class="ans-label">Ans:</span> <span class="q-text">')
+        out.append(_e(q.get("answer_text") or "N/A"))
+        out.append("</span></div>")
         if show_explanation and q.get("explanation"):
-            explanation_html = (
-                '<div class="explanation-container">'
-                '<span class="exp-label">Explanation:</span>'
-                f'<span class="q-text">{q["explanation"]}</span></div>'
+            out.append(
+                '<div class="explanation-container"><span class="exp-label">Explanation:</span><span class="q-text">'
             )
-        answer_html = f"""
-        <div class="answer-container">
-            <span class="ans-label">Ans:</span> <span class="q-text">{answer_text}</span>
-        </div>
-        {explanation_html}
-        """
+            out.append(_e(q["explanation"]))
+            out.append("</span></div>")
+
+    out.append("</div></div>")
 
     # Break logic
-    page_break = '<div class="page-break"></div>' if q.get("is_page_break_below") else ""
-
-    html = f"""
-    <div class="question">
-        <div class="q-number">{display_idx}.</div>
-        <div class="q-content">
-            <div class="q-row">
-                <div class="q-text">{q.get("question_text")}</div>
-                <div class="q-marks">[{q.get("marks")}]</div>
-            </div>
-            {images_html}
-            {options_html}
-            {answer_html}
-        </div>
-    </div>
-    {page_break}
-    """
-    return html
+    if q.get("is_page_break_below"):
+        out.append('<div class="page-break"></div>')
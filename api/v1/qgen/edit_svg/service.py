@@ -1,10 +1,10 @@
 import logging
-import os
 
 import supabase
-from google import genai
 from google.genai import types
 
+from api.v1.qgen.utils.gemini_client import get_gemini_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -74,7 +74,7 @@ class EditSVGService:
         # 2. Generate prompt and call Gemini
         prompt = edit_svg_prompt(current_svg, instruction)
 
-        gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        gemini_client = get_gemini_client()
 
         max_retries = 3
         last_exception = None
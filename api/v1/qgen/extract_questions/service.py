@@ -3,7 +3,6 @@ Service layer for extracting questions from files.
 """
 
 import logging
-import os
 
 import supabase
 from fastapi import UploadFile
@@ -12,6 +11,7 @@ from google.genai import types
 
 from api.v1.qgen.models import QUESTION_TYPE_TO_ENUM, ExtractedQuestionsList
 from api.v1.qgen.prompts import extract_questions_prompt
+from api.v1.qgen.utils.gemini_client import get_gemini_client
 from supabase_dir import (
     GenImagesInsert,
     GenQuestionsInsert,
@@ -21,6 +21,20 @@ from supabase_dir import (
 
 logger = logging.getLogger(__name__)
 
+_ALLOWED_CONTENT_TYPES = frozenset(
+    {
+        "image/png",
+        "image/jpeg",
+        "image/jpg",
+        "image/gif",
+        "image/webp",
+        "application/pdf",
+    }
+)
+
+# Files above this size go through the Gemini Files API instead of being sent inline
+INLINE_FILE_MAX_BYTES = 8 * 1024 * 1024
+
 
 class ExtractionProcessingError(Exception):
     """Raised when extraction processing fails."""
@@ -34,41 +48,62 @@ class ExtractionValidationError(Exception):
     pass
 
 
-async def process_uploaded_file(file: UploadFile) -> types.Part:
+def _validate_uploaded_file(file: UploadFile) -> str:
     """
-    Process an uploaded file and convert it to a Gemini Part object.
-
-    Args:
-        file: The uploaded file (image or PDF)
+    Checks the upload is non-empty and of a supported type, without reading it.
 
     Returns:
-        Gemini Part object
+        The file's content type
     """
     if not file.filename or not file.size or file.size == 0:
         raise ExtractionValidationError("Empty or invalid file uploaded")
 
-    content = await file.read()
     content_type = file.content_type or "application/octet-stream"
-
-    # Validate file type
-    allowed_types = [
-        "image/png",
-        "image/jpeg",
-        "image/jpg",
-        "image/gif",
-        "image/webp",
-        "application/pdf",
-    ]
-
-    if content_type not in allowed_types:
+    if content_type not in _ALLOWED_CONTENT_TYPES:
         raise ExtractionValidationError(
             f"Unsupported file type: {content_type}. Allowed: images (png, jpeg, gif, webp) and PDF"
         )
+    return content_type
 
+
+async def process_uploaded_file(file: UploadFile) -> types.Part:
+    """
+    Process an uploaded file and convert it to an inline Gemini Part object.
+
+    Args:
+        file: The uploaded file (image or PDF)
+
+    Returns:
+        Gemini Part object
+    """
+    content_type = _validate_uploaded_file(file)
+    content = await file.read()
     await file.seek(0)
     return types.Part.from_bytes(data=content, mime_type=content_type)
 
 
+async def upload_file_to_gemini(gemini_client: genai.Client, file: UploadFile) -> types.File:
+    """
+    Streams an uploaded file to the Gemini Files API from its spooled temporary file, so a large PDF is
+    never held in memory as one bytes object (plus its base64 copy in the request body).
+
+    Args:
+        gemini_client: Gemini API client
+        file: The uploaded file (image or PDF)
+
+    Returns:
+        The uploaded Gemini File, referenced by URI in requests
+    """
+    content_type = _validate_uploaded_file(file)
+    await file.seek(0)
+    uploaded = await gemini_client.aio.files.upload(
+        file=file.file,
+        config=types.UploadFileConfig(mime_type=content_type, display_name=file.filename),
+    )
+    await file.seek(0)
+    return uploaded
+
+
 class ExtractQuestionsService:
     """Service for extracting questions from files using LLM."""
 
@@ -132,27 +167,40 @@ class ExtractQuestionsService:
         Returns:
             Dict with section_id, section_name, questions_extracted count
         """
-        # 1. Process file
-        logger.info(f"Processing file for extraction: {file.filename}")
-        file_part = await process_uploaded_file(file)
+        # 1. Initialize Gemini client
+        gemini_client = get_gemini_client()
 
-        # 2. Initialize Gemini client
-        gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        # 2. Process file: small files inline, large ones uploaded once and referenced by every attempt
+        logger.info(f"Processing file for extraction: {file.filename}")
+        uploaded_file = None
+        if file.size and file.size > INLINE_FILE_MAX_BYTES:
+            uploaded_file = await upload_file_to_gemini(gemini_client, file)
+            file_part = types.Part.from_uri(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type)
+        else:
+            file_part = await process_uploaded_file(file)
 
         # 3. Call LLM with retry
         max_retries = 5
         last_exception = None
         extracted_result = None
 
-        for attempt in range(max_retries):
-            try:
-                extracted_result = await ExtractQuestionsService.process_extraction(
-                    gemini_client, file_part, custom_prompt, attempt + 1
-                )
-                break
-            except Exception as e:
-                last_exception = e
-                logger.warning(f"Extraction attempt {attempt + 1} failed: {e}")
+        try:
+            for attempt in range(max_retries):
+                try:
+                    extracted_result = await ExtractQuestionsService.process_extraction(
+                        gemini_client, file_part, custom_prompt, attempt + 1
+                    )
+                    break
+                except Exception as e:
+                    last_exception = e
+                    logger.warning(f"Extraction attempt {attempt + 1} failed: {e}")
+        finally:
+            if uploaded_file is not None:
+                # Gemini would expire it after 48 hours anyway; don't keep the user's file around that long
+                try:
+                    await gemini_client.aio.files.delete(name=uploaded_file.name)
+                except Exception as e:
+                    logger.warning(f"Failed to delete uploaded Gemini file {uploaded_file.name}: {e}")
 
         if extracted_result is None:
             raise ExtractionProcessingError(f"Extraction failed after {max_retries} retries") from last_exception
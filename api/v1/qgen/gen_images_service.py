@@ -0,0 +1,44 @@
+"""
+Gen Images Service
+
+Handles replacing the SVGs stored for a gen_question.
+
+The fast path is the replace_gen_images Postgres function (supabase_dir/migrations), which swaps the rows
+in one round trip and in one transaction. Databases without the function fall back to a delete followed
+by a bulk insert.
+"""
+
+import logging
+from typing import Any
+
+import supabase
+
+from api.v1.qgen.utils.optional_rpc import OptionalRpc
+
+logger = logging.getLogger(__name__)
+
+_replace_gen_images_rpc = OptionalRpc("replace_gen_images")
+
+
+def replace_gen_images(
+    supabase_client: supabase.Client,
+    gen_question_id: str,
+    gen_image_rows: list[dict[str, Any]],
+) -> None:
+    """
+    Replace all gen_images of a question with the given rows (GenImagesInsert dumps).
+
+    Failures to delete the existing rows are raised; failures to insert the new rows on the
+    fallback path are only logged, matching how SVGs are treated as best-effort elsewhere.
+    """
+    params = {"p_question_id": gen_question_id, "p_rows": gen_image_rows}
+    if _replace_gen_images_rpc.call(supabase_client, params) is not None:
+        return
+
+    supabase_client.table("gen_images").delete().eq("gen_question_id", gen_question_id).execute()
+
+    if gen_image_rows:
+        try:
+            supabase_client.table("gen_images").insert(gen_image_rows).execute()
+        except Exception as e:
+            logger.warning(f"Failed to insert SVGs for question {gen_question_id}: {e}")
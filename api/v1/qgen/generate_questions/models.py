@@ -80,3 +80,9 @@ QUESTION_TYPE_TO_SCHEMA_WITH_CONCEPTS: dict[str, type[BaseModel]] = {
     "long_answer": LongAnswerWithConceptsList,
     "match_the_following": MatchTheFollowingWithConceptsList,
 }
+
+# Item model of each list schema (e.g. "mcq4" -> MCQ4WithConcepts), resolved once at import.
+QUESTION_TYPE_TO_MODEL_WITH_CONCEPTS: dict[str, type[BaseModel]] = {
+    question_type: schema.model_fields["questions"].annotation.__args__[0]
+    for question_type, schema in QUESTION_TYPE_TO_SCHEMA_WITH_CONCEPTS.items()
+}
@@ -1,17 +1,16 @@
 import logging
-import os
 import uuid
 from typing import Literal
 
 import supabase
 from fastapi import Depends, status
 from fastapi.responses import Response
-from google import genai
 from pydantic import BaseModel, Field, model_validator
 
 from api.v1.auth import get_supabase_client, require_supabase_user
 
 from ..credits import check_user_has_credits, deduct_user_credits
+from ..utils.gemini_client import get_gemini_client
 from .batchification import Batch, build_batches_end_to_end
 from .service import (
     BatchProcessingContext,
@@ -186,7 +185,7 @@ async def generate_questions(
         logger.debug(f"Total batches created: {len(batches)}")
 
         # Initialize context
-        gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        gemini_client = get_gemini_client()
 
         ctx = BatchProcessingContext(
             gemini_client=gemini_client,
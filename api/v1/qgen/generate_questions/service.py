@@ -1,5 +1,4 @@
 import asyncio
-import json
 import logging
 import uuid
 from dataclasses import dataclass, field
@@ -7,6 +6,7 @@ from datetime import UTC, datetime, timedelta
 
 import supabase
 from google import genai
+from pydantic_core import from_json
 
 from supabase_dir import (
     GenImagesInsert,
@@ -20,11 +20,17 @@ from ..models import (
 from ..prompts import generate_questions_with_concepts_prompt
 from ..version_service import create_initial_version
 from .batchification import Batch
-from .models import QUESTION_TYPE_TO_SCHEMA_WITH_CONCEPTS
+from .models import QUESTION_TYPE_TO_MODEL_WITH_CONCEPTS, QUESTION_TYPE_TO_SCHEMA_WITH_CONCEPTS
 from .utils.fetch_questions import QuestionRequestType, fetch_questions_from_bank
 
 logger = logging.getLogger(__name__)
 
+DIFFICULTY_TO_HARDNESS_LEVEL = {
+    "easy": PublicHardnessLevelEnumEnum.EASY,
+    "medium": PublicHardnessLevelEnumEnum.MEDIUM,
+    "hard": PublicHardnessLevelEnumEnum.HARD,
+}
+
 
 @dataclass
 class BatchProcessingContext:
@@ -138,23 +144,15 @@ async def process_batch_generation_and_validate(
     generation_result = await process_batch_generation(batch, ctx, batch_idx, retry_idx)
     response = generation_result["response"]
 
-    question_schema = QUESTION_TYPE_TO_SCHEMA_WITH_CONCEPTS.get(batch.question_type)
     question_type_enum = QUESTION_TYPE_TO_ENUM.get(batch.question_type)
-    # The question model is the first argument of the List in the 'questions' annotation
-    question_model = question_schema.__annotations__.get("questions").__args__[0]
-
-    difficulty_mapping = {
-        "easy": PublicHardnessLevelEnumEnum.EASY,
-        "medium": PublicHardnessLevelEnumEnum.MEDIUM,
-        "hard": PublicHardnessLevelEnumEnum.HARD,
-    }
-    hardness_level = difficulty_mapping.get(batch.difficulty, PublicHardnessLevelEnumEnum.MEDIUM)
+    question_model = QUESTION_TYPE_TO_MODEL_WITH_CONCEPTS.get(batch.question_type)
+    hardness_level = DIFFICULTY_TO_HARDNESS_LEVEL.get(batch.difficulty, PublicHardnessLevelEnumEnum.MEDIUM)
 
     try:
         questions_list = response.parsed.questions
     except Exception:
-        raw_text = response.text
-        raw_data = json.loads(raw_text)
+        # pydantic-core's parser; items are still validated one by one so a bad one is skipped
+        raw_data = from_json(response.text)
         questions_list = raw_data.get("questions", [])
 
     validated_questions = []
@@ -5,16 +5,15 @@ Provides AI-generated feedback on question drafts.
 """
 
 import logging
-import os
 
 import supabase
 from fastapi import Depends, HTTPException
-from google import genai
 from pydantic import BaseModel
 
 from api.v1.auth import get_supabase_client
 
 from .models import FeedbackList
+from .utils.gemini_client import get_gemini_client
 
 logger = logging.getLogger(__name__)
 
@@ -128,7 +127,7 @@ async def get_feedback(
 
     # Generate AI feedback using Gemini
     try:
-        gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        gemini_client = get_gemini_client()
 
         # Prepare analysis data
         question_types = {}
@@ -2,6 +2,8 @@
 Defines the Pydantic models relavant to qgen
 """
 
+from typing import Annotated
+
 from pydantic import BaseModel, Field
 
 from supabase_dir import PublicQuestionTypeEnumEnum
@@ -16,6 +18,14 @@ class Column(BaseModel):
     items: list[str] = Field(description="Items in the column")
 
 
+# Fields shared verbatim by every question schema. Declared once so the schemas cannot drift;
+# each model still lists them explicitly to keep the property order Gemini generates in.
+Explanation = Annotated[str | None, Field(description="Explanation for the answer")]
+HardnessLevel = Annotated[str | None, Field(description="Difficulty: easy, medium, hard")]
+Marks = Annotated[int | None, Field(description="Marks for this question")]
+SVGs = Annotated[list[SVG] | None, Field(description="List of SVGs relavant to the question if needed")]
+
+
 class MCQ4(BaseModel):
     """MCQ4 question schema for Gemini structured output."""
 
@@ -25,11 +35,11 @@ class MCQ4(BaseModel):
     option3: str = Field(description="Third option")
     option4: str = Field(description="Fourth option")
     correct_mcq_option: int = Field(description="Correct option (1-4)")
-    explanation: str | None = Field(default=None, description="Explanation for the answer")
-    hardness_level: str | None = Field(default=None, description="Difficulty: easy, medium, hard")
-    marks: int | None = Field(default=None, description="Marks for this question")
+    explanation: Explanation = None
+    hardness_level: HardnessLevel = None
+    marks: Marks = None
     answer_text: str | None = Field(default=None, description="Answer text if applicable")
-    svgs: list[SVG] | None = Field(default=None, description="List of SVGs relavant to the question if needed")
+    svgs: SVGs = None
 
 
 class MCQ4List(BaseModel):
@@ -50,11 +60,11 @@ class MSQ4(BaseModel):
     msq_option2_answer: bool | None = Field(default=None, description="Is option 2 correct")
     msq_option3_answer: bool | None = Field(default=None, description="Is option 3 correct")
     msq_option4_answer: bool | None = Field(default=None, description="Is option 4 correct")
-    explanation: str | None = Field(default=None, description="Explanation for the answer")
-    hardness_level: str | None = Field(default=None, description="Difficulty: easy, medium, hard")
-    marks: int | None = Field(default=None, description="Marks for this question")
+    explanation: Explanation = None
+    hardness_level: HardnessLevel = None
+    marks: Marks = None
     answer_text: str | None = Field(default=None, description="Answer text if applicable")
-    svgs: list[SVG] | None = Field(default=None, description="List of SVGs relavant to the question if needed")
+    svgs: SVGs = None
 
 
 class MSQ4List(BaseModel):
@@ -68,10 +78,10 @@ class FillInTheBlank(BaseModel):
 
     question_text: str | None = Field(default=None, description="The question text with blank")
     answer_text: str | None = Field(default=None, description="The correct answer")
-    explanation: str | None = Field(default=None, description="Explanation for the answer")
-    hardness_level: str | None = Field(default=None, description="Difficulty: easy, medium, hard")
-    marks: int | None = Field(default=None, description="Marks for this question")
-    svgs: list[SVG] | None = Field(default=None, description="List of SVGs relavant to the question if needed")
+    explanation: Explanation = None
+    hardness_level: HardnessLevel = None
+    marks: Marks = None
+    svgs: SVGs = None
 
 
 class FillInTheBlankList(BaseModel):
@@ -85,10 +95,10 @@ class TrueFalse(BaseModel):
 
     question_text: str | None = Field(default=None, description="The statement to evaluate")
     answer_text: str | None = Field(default=None, description="True or False")
-    explanation: str | None = Field(default=None, description="Explanation for the answer")
-    hardness_level: str | None = Field(default=None, description="Difficulty: easy, medium, hard")
-    marks: int | None = Field(default=None, description="Marks for this question")
-    svgs: list[SVG] | None = Field(default=None, description="List of SVGs relavant to the question if needed")
+    explanation: Explanation = None
+    hardness_level: HardnessLevel = None
+    marks: Marks = None
+    svgs: SVGs = None
 
 
 class TrueFalseList(BaseModel):
@@ -102,10 +112,10 @@ class ShortAnswer(BaseModel):
 
     question_text: str | None = Field(default=None, description="The question text")
     answer_text: str | None = Field(default=None, description="The short answer")
-    explanation: str | None = Field(default=None, description="Explanation for the answer")
-    hardness_level: str | None = Field(default=None, description="Difficulty: easy, medium, hard")
-    marks: int | None = Field(default=None, description="Marks for this question")
-    svgs: list[SVG] | None = Field(default=None, description="List of SVGs relavant to the question if needed")
+    explanation: Explanation = None
+    hardness_level: HardnessLevel = None
+    marks: Marks = None
+    svgs: SVGs = None
 
 
 class ShortAnswerList(BaseModel):
@@ -119,10 +129,10 @@ class LongAnswer(BaseModel):
 
     question_text: str | None = Field(default=None, description="The question text")
     answer_text: str | None = Field(default=None, description="The long answer")
-    explanation: str | None = Field(default=None, description="Explanation for the answer")
-    hardness_level: str | None = Field(default=None, description="Difficulty: easy, medium, hard")
-    marks: int | None = Field(default=None, description="Marks for this question")
-    svgs: list[SVG] | None = Field(default=None, description="List of SVGs relavant to the question if needed")
+    explanation: Explanation = None
+    hardness_level: HardnessLevel = None
+    marks: Marks = None
+    svgs: SVGs = None
 
 
 class LongAnswerList(BaseModel):
@@ -139,10 +149,10 @@ class MatchTheFollowing(BaseModel):
     )
     columns: list[Column] = Field(default=None, description="List of columns for matching")
     answer_text: str | None = Field(default=None, description="The answer text")
-    explanation: str | None = Field(default=None, description="Explanation for the answer")
-    hardness_level: str | None = Field(default=None, description="Difficulty: easy, medium, hard")
-    marks: int | None = Field(default=None, description="Marks for this question")
-    svgs: list[SVG] | None = Field(default=None, description="List of SVGs relavant to the question if needed")
+    explanation: Explanation = None
+    hardness_level: HardnessLevel = None
+    marks: Marks = None
+    svgs: SVGs = None
 
 
 class MatchTheFollowingList(BaseModel):
@@ -208,6 +218,19 @@ class AutoCorrectedQuestion(BaseModel):
     question: AllQuestions = Field(..., description="The auto-corrected question")
 
 
+class KeyedAutoCorrectedQuestion(BaseModel):
+    """Auto-corrected question from a batched request, tagged with the key of the question it corrects."""
+
+    key: str = Field(..., description="The key of the input question this corrects, copied exactly")
+    question: AllQuestions = Field(..., description="The auto-corrected question")
+
+
+class AutoCorrectedQuestionList(BaseModel):
+    """Auto-corrected questions for a batched request."""
+
+    corrections: list[KeyedAutoCorrectedQuestion] = Field(..., description="One correction per input question")
+
+
 class ExtractedQuestion(BaseModel):
     """Single extracted question with type discriminator for mixed-type extraction."""
 
@@ -235,9 +258,9 @@ class ExtractedQuestion(BaseModel):
         default=None,
         description="Answer text (for fill_in_blank, true_false, short_answer, long_answer)",
     )
-    explanation: str | None = Field(default=None, description="Explanation for the answer")
-    hardness_level: str | None = Field(default=None, description="Difficulty: easy, medium, hard")
-    marks: int | None = Field(default=None, description="Marks for this question")
+    explanation: Explanation = None
+    hardness_level: HardnessLevel = None
+    marks: Marks = None
     svgs: list[SVG] | None = Field(default=None, description="List of SVGs relevant to the question if needed")
 
 
@@ -4,14 +4,20 @@ Prompt templates for question generation endpoints.
 This module contains all the base prompt functions used by the qgen API endpoints.
 """
 
-from .auto_correct import auto_correct_questions_prompt
+from .auto_correct import (
+    AUTO_CORRECT_SYSTEM_INSTRUCTION,
+    auto_correct_questions_batch_prompt,
+    auto_correct_questions_prompt,
+)
 from .extract_questions import extract_questions_prompt
 from .generate_questions import generate_questions_with_concepts_prompt
 from .regenerate import regenerate_question_prompt
 from .regenerate_with_prompt import regenerate_question_with_prompt_prompt
 
 __all__ = [
+    "AUTO_CORRECT_SYSTEM_INSTRUCTION",
     "auto_correct_questions_prompt",
+    "auto_correct_questions_batch_prompt",
     "generate_questions_with_concepts_prompt",
     "regenerate_question_prompt",
     "regenerate_question_with_prompt_prompt",
@@ -6,11 +6,30 @@ Prompt template for auto-correcting questions.
 from .common_instructions import COMMON_INSTRUCTIONS
 from .svg_instructions import COMMON_SVG_INSTRUCTIONS
 
+# Static instructions shared by every auto-correct call. Sent as the system instruction so the
+# request prefix stays identical across questions and retries and is eligible for Gemini's prompt caching.
+AUTO_CORRECT_SYSTEM_INSTRUCTION = f"""
+    You will be given a question that may not be in proper latex format and a organised way.
+    There may be some grammatical errors in it. Please correct it, don't change anything related to the meaning
+    of the question itself. Return the corrected question in the same format.
+    If user has requested something, then there must be something like either grammatical or latex error. High probability that it is latex error in maths question, so check the question carefully.
+    If an image is attached, use it to help understand and correct the question content.
+    If Diagram is/are required for the questions, then generate it following the below SVG Instructions.
+    Common Latex Errors are:
+        {COMMON_INSTRUCTIONS}
+    Sometimes, if correction is requested, it may be related to unnecessary use of display math ($$...$$) for simple expressions that could be rendered as inline math ($...$). Display math can cause rendering issues in some contexts, so check if any simple expressions are unnecessarily using display math and convert them to inline math for better compatibility with KaTeX rendering.
+    Svg Instructions are:
+        {COMMON_SVG_INSTRUCTIONS}
+    Correct everything , the image would inlude the question text, answer text, options etc. if there are any latex / katex rendering errors , you can check from image if image is attached. Use this image as source of truth, your output is rendered as that image, do necessary actions if there are any katex errors (we are using katex node module at the frontend to render your image)
+    """
+
 
 def auto_correct_questions_prompt(gen_question: dict) -> str:
     """
     Generate prompt to auto correct a question.
 
+    The correction instructions live in AUTO_CORRECT_SYSTEM_INSTRUCTION; this only carries the question.
+
     Args:
         gen_question: Dictionary containing question data
 
@@ -19,16 +38,24 @@ def auto_correct_questions_prompt(gen_question: dict) -> str:
     """
     # Using f-string instead of .format() to avoid issues with curly braces in LaTeX
     return f"""
-    You are given this question {gen_question} and it may not be in proper latex format and a organised way.
-    There may be some grammatical errors in it. Please correct it, don't change anything related to the meaning
-    of the question itself. Return the corrected question in the same format.
-    If user has requested something, then there must be something like either grammatical or latex error. High probability that it is latex error in maths question, so check the question carefully.
-    If an image is attached, use it to help understand and correct the question content.
-    If Diagram is/are required for the questions, then generate it following the below SVG Instructions.
-    Common Latex Errors are:
-        {COMMON_INSTRUCTIONS}
-    Sometimes, if correction is requested, it may be related to unnecessary use of display math ($$...$$) for simple expressions that could be rendered as inline math ($...$). Display math can cause rendering issues in some contexts, so check if any simple expressions are unnecessarily using display math and convert them to inline math for better compatibility with KaTeX rendering.
-    Svg Instructions are:
-        {COMMON_SVG_INSTRUCTIONS}
-    Correct everything , the image would inlude the question text, answer text, options etc. if there are any latex / katex rendering errors , you can check from image if image is attached. Use this image as source of truth, your output is rendered as that image, do necessary actions if there are any katex errors (we are using katex node module at the frontend to render your image)
+    You are given this question {gen_question}. Correct it and return the corrected question in the same format.
+    """
+
+
+def auto_correct_questions_batch_prompt(keyed_questions: list[tuple[str, dict]]) -> str:
+    """
+    Generate prompt to auto correct several independent questions in one call.
+
+    Args:
+        keyed_questions: (key, question dictionary) pairs; each correction must echo its question's key
+
+    Returns:
+        Formatted prompt string
+    """
+    numbered = "\n".join(f"Question with key {key}: {gen_question}" for key, gen_question in keyed_questions)
+    return f"""
+    You are given {len(keyed_questions)} independent questions, each with a key. Correct each one on its own and
+    return exactly one corrected question per input question, each in the same format as its input and tagged with
+    that input question's key, copied exactly.
+    {numbered}
     """
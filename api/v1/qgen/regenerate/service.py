@@ -7,8 +7,8 @@ Architecture:
     3. regenerate_question() - Retry wrapper (5 retries) + updates Supabase
 """
 
+import asyncio
 import logging
-import os
 
 import supabase
 from google import genai
@@ -16,6 +16,8 @@ from pydantic import BaseModel, Field
 
 from api.v1.qgen.models import AllQuestions
 from api.v1.qgen.prompts import regenerate_question_prompt
+from api.v1.qgen.utils.gemini_client import get_gemini_client
+from api.v1.qgen.utils.retry import backoff_delay, classify_error
 from api.v1.qgen.version_service import create_new_version_on_update
 from supabase_dir import GenImagesInsert
 
@@ -62,6 +64,44 @@ def _log_prefix(retry_idx: int = None) -> str:
     return ""
 
 
+def _save_regenerated_question(
+    supabase_client: supabase.Client,
+    gen_question_id: str,
+    update_data: dict,
+    svg_list: list | None,
+) -> None:
+    """
+    Persists a regenerated question (version, row update, SVGs). Sync Supabase calls, so callers
+    run it with asyncio.to_thread.
+    """
+    # Create new version before updating question
+    create_new_version_on_update(supabase_client, gen_question_id, update_data)
+
+    supabase_client.table("gen_questions").update(update_data).eq("id", gen_question_id).execute()
+
+    # Insert SVGs into gen_images table if present
+    if svg_list:
+        logger.debug(f"SVGs generated for question {gen_question_id}: {len(svg_list)} SVG(s) found")
+
+        # First, delete existing SVGs for this question (to replace with new ones)
+        supabase_client.table("gen_images").delete().eq("gen_question_id", gen_question_id).execute()
+
+        for position, svg_item in enumerate(svg_list, start=1):
+            try:
+                svg_string = svg_item.get("svg") if isinstance(svg_item, dict) else svg_item.svg
+                if svg_string:
+                    gen_image = GenImagesInsert(
+                        gen_question_id=gen_question_id,
+                        svg_string=svg_string,
+                        position=position,
+                    )
+                    supabase_client.table("gen_images").insert(
+                        gen_image.model_dump(mode="json", exclude_none=True)
+                    ).execute()
+            except Exception as svg_error:
+                logger.warning(f"Failed to insert SVG for question {gen_question_id}: {svg_error}")
+
+
 # ============================================================================
 # SERVICE CLASS
 # ============================================================================
@@ -73,6 +113,7 @@ class RegenerateService:
         gemini_client: genai.Client,
         gen_question_data: dict,
         retry_idx: int = None,
+        prompt: str | None = None,
     ) -> dict:
         """
         Process a question by calling Gemini API once.
@@ -85,7 +126,8 @@ class RegenerateService:
             extra={"retry_idx": retry_idx},
         )
 
-        prompt = regenerate_question_prompt(gen_question_data)
+        if prompt is None:
+            prompt = regenerate_question_prompt(gen_question_data)
 
         logger.debug(
             "Making Gemini API call",
@@ -116,6 +158,7 @@ class RegenerateService:
         gemini_client: genai.Client,
         gen_question_data: dict,
         retry_idx: int = None,
+        prompt: str | None = None,
     ) -> AllQuestions:
         """
         Process and validate a question.
@@ -128,7 +171,7 @@ class RegenerateService:
             extra={"retry_idx": retry_idx},
         )
 
-        response = await RegenerateService.process_question(gemini_client, gen_question_data, retry_idx)
+        response = await RegenerateService.process_question(gemini_client, gen_question_data, retry_idx, prompt=prompt)
 
         logger.debug(
             "Parsing Gemini response",
@@ -175,7 +218,7 @@ class RegenerateService:
         """
         Attempt to process question with retry logic and update Supabase.
         """
-        gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        gemini_client = get_gemini_client()
 
         logger.debug(
             "Starting regenerate retry wrapper",
@@ -183,6 +226,8 @@ class RegenerateService:
         )
 
         last_exception = None
+        # Render the prompt once; retries send the same one
+        prompt = regenerate_question_prompt(gen_question_data)
 
         for attempt in range(max_retries):
             retry_idx = attempt + 1
@@ -198,7 +243,7 @@ class RegenerateService:
                 )
 
                 regenerated_question = await RegenerateService.process_and_validate(
-                    gemini_client, gen_question_data, retry_idx
+                    gemini_client, gen_question_data, retry_idx, prompt=prompt
                 )
 
                 logger.debug(
@@ -228,32 +273,9 @@ class RegenerateService:
                     else:
                         update_data["match_the_following_columns"] = cols
 
-                # Create new version before updating question
-                create_new_version_on_update(supabase_client, gen_question_id, update_data)
-
-                supabase_client.table("gen_questions").update(update_data).eq("id", gen_question_id).execute()
-
-                # Insert SVGs into gen_images table if present
-                if svg_list:
-                    logger.debug(f"SVGs generated for question {gen_question_id}: {len(svg_list)} SVG(s) found")
-
-                    # First, delete existing SVGs for this question (to replace with new ones)
-                    supabase_client.table("gen_images").delete().eq("gen_question_id", gen_question_id).execute()
-
-                    for position, svg_item in enumerate(svg_list, start=1):
-                        try:
-                            svg_string = svg_item.get("svg") if isinstance(svg_item, dict) else svg_item.svg
-                            if svg_string:
-                                gen_image = GenImagesInsert(
-                                    gen_question_id=gen_question_id,
-                                    svg_string=svg_string,
-                                    position=position,
-                                )
-                                supabase_client.table("gen_images").insert(
-                                    gen_image.model_dump(mode="json", exclude_none=True)
-                                ).execute()
-                        except Exception as svg_error:
-                            logger.warning(f"Failed to insert SVG for question {gen_question_id}: {svg_error}")
+                await asyncio.to_thread(
+                    _save_regenerated_question, supabase_client, gen_question_id, update_data, svg_list
+                )
 
                 logger.debug(
                     "Database update completed successfully",
@@ -268,6 +290,9 @@ class RegenerateService:
             except Exception as e:
                 last_exception = e
 
+                if classify_error(e) == "fatal":
+                    raise QuestionProcessingError(f"Gemini rejected the regenerate request: {e}") from e
+
                 if attempt < max_retries - 1:
                     logger.warning(
                         "Attempt failed, retrying",
@@ -276,6 +301,7 @@ class RegenerateService:
                             "error": str(e),
                         },
                     )
+                    await asyncio.sleep(backoff_delay(attempt))
                 else:
                     logger.error(
                         "All retry attempts exhausted",
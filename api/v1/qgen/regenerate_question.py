@@ -7,8 +7,8 @@ Architecture:
     3. try_retry_and_update() - Retry wrapper (5 retries) + updates Supabase
 """
 
+import asyncio
 import logging
-import os
 
 import supabase
 from fastapi import Depends, HTTPException, status
@@ -17,6 +17,8 @@ from google import genai
 from pydantic import BaseModel, Field
 
 from api.v1.auth import get_supabase_client, require_supabase_user
+from api.v1.qgen.utils.gemini_client import get_gemini_client
+from api.v1.qgen.utils.retry import backoff_delay, classify_error
 from supabase_dir import GenImagesInsert
 
 from .credits import check_user_has_credits, deduct_user_credits
@@ -69,6 +71,40 @@ def _log_prefix(retry_idx: int = None) -> str:
     return ""
 
 
+def _save_regenerated_question(
+    supabase_client: supabase.Client,
+    gen_question_id: str,
+    update_data: dict,
+    svg_list: list | None,
+) -> None:
+    """
+    Update the question row and replace its SVGs. Blocking; call via asyncio.to_thread.
+    """
+    supabase_client.table("gen_questions").update(update_data).eq("id", gen_question_id).execute()
+
+    # Insert SVGs into gen_images table if present
+    if svg_list:
+        logger.debug(f"SVGs generated for question {gen_question_id}: {len(svg_list)} SVG(s) found")
+
+        # First, delete existing SVGs for this question (to replace with new ones)
+        supabase_client.table("gen_images").delete().eq("gen_question_id", gen_question_id).execute()
+
+        for position, svg_item in enumerate(svg_list, start=1):
+            try:
+                svg_string = svg_item.get("svg") if isinstance(svg_item, dict) else svg_item.svg
+                if svg_string:
+                    gen_image = GenImagesInsert(
+                        gen_question_id=gen_question_id,
+                        svg_string=svg_string,
+                        position=position,
+                    )
+                    supabase_client.table("gen_images").insert(
+                        gen_image.model_dump(mode="json", exclude_none=True)
+                    ).execute()
+            except Exception as svg_error:
+                logger.warning(f"Failed to insert SVG for question {gen_question_id}: {svg_error}")
+
+
 # ============================================================================
 # STEP 1: SINGLE QUESTION PROCESSING (No Retries)
 # ============================================================================
@@ -78,6 +114,7 @@ async def process_question(
     gemini_client: genai.Client,
     gen_question_data: dict,
     retry_idx: int = None,
+    prompt: str | None = None,
 ) -> dict:
     """
     Process a question by calling Gemini API once.
@@ -88,6 +125,7 @@ async def process_question(
         gemini_client: Initialized Gemini client
         gen_question_data: Dictionary containing question data
         retry_idx: Current retry attempt number (for logging)
+        prompt: Pre-rendered prompt (rendered from gen_question_data if omitted)
 
     Returns:
         Raw response from Gemini API
@@ -102,7 +140,8 @@ async def process_question(
         extra={"retry_idx": retry_idx},
     )
 
-    prompt = regenerate_question_prompt(gen_question_data)
+    if prompt is None:
+        prompt = regenerate_question_prompt(gen_question_data)
 
     logger.debug(
         "Making Gemini API call",
@@ -139,6 +178,7 @@ async def process_question_and_validate(
     gemini_client: genai.Client,
     gen_question_data: dict,
     retry_idx: int = None,
+    prompt: str | None = None,
 ) -> AllQuestions:
     """
     Process and validate a question.
@@ -149,6 +189,7 @@ async def process_question_and_validate(
         gemini_client: Initialized Gemini client
         gen_question_data: Dictionary containing question data
         retry_idx: Current retry attempt number (for logging)
+        prompt: Pre-rendered prompt, passed through to process_question()
 
     Returns:
         Validated AllQuestions object
@@ -165,7 +206,7 @@ async def process_question_and_validate(
     )
 
     # Step 1: Get response from Gemini
-    response = await process_question(gemini_client, gen_question_data, retry_idx)
+    response = await process_question(gemini_client, gen_question_data, retry_idx, prompt=prompt)
 
     # Step 2: Parse and validate response
     logger.debug(
@@ -242,6 +283,8 @@ async def try_retry_and_update(
     )
 
     last_exception = None
+    # The prompt only depends on the question, so render it once for all attempts
+    prompt = regenerate_question_prompt(gen_question_data)
 
     for attempt in range(max_retries):
         retry_idx = attempt + 1
@@ -256,7 +299,9 @@ async def try_retry_and_update(
                 },
             )
 
-            regenerated_question = await process_question_and_validate(gemini_client, gen_question_data, retry_idx)
+            regenerated_question = await process_question_and_validate(
+                gemini_client, gen_question_data, retry_idx, prompt=prompt
+            )
 
             logger.debug(
                 "Regenerate succeeded, updating database",
@@ -285,29 +330,7 @@ async def try_retry_and_update(
                 else:
                     update_data["match_the_following_columns"] = cols
 
-            supabase_client.table("gen_questions").update(update_data).eq("id", gen_question_id).execute()
-
-            # Insert SVGs into gen_images table if present
-            if svg_list:
-                logger.debug(f"SVGs generated for question {gen_question_id}: {len(svg_list)} SVG(s) found")
-
-                # First, delete existing SVGs for this question (to replace with new ones)
-                supabase_client.table("gen_images").delete().eq("gen_question_id", gen_question_id).execute()
-
-                for position, svg_item in enumerate(svg_list, start=1):
-                    try:
-                        svg_string = svg_item.get("svg") if isinstance(svg_item, dict) else svg_item.svg
-                        if svg_string:
-                            gen_image = GenImagesInsert(
-                                gen_question_id=gen_question_id,
-                                svg_string=svg_string,
-                                position=position,
-                            )
-                            supabase_client.table("gen_images").insert(
-                                gen_image.model_dump(mode="json", exclude_none=True)
-                            ).execute()
-                    except Exception as svg_error:
-                        logger.warning(f"Failed to insert SVG for question {gen_question_id}: {svg_error}")
+            await asyncio.to_thread(_save_regenerated_question, supabase_client, gen_question_id, update_data, svg_list)
 
             logger.debug(
                 "Database update completed successfully",
@@ -322,6 +345,9 @@ async def try_retry_and_update(
         except Exception as e:
             last_exception = e
 
+            if classify_error(e) == "fatal":
+                raise QuestionProcessingError(f"Gemini rejected the regenerate request: {e}") from e
+
             if attempt < max_retries - 1:
                 logger.warning(
                     "Attempt failed, retrying",
@@ -330,6 +356,7 @@ async def try_retry_and_update(
                         "error": str(e),
                     },
                 )
+                await asyncio.sleep(backoff_delay(attempt))
             else:
                 logger.error(
                     "All retry attempts exhausted",
@@ -404,7 +431,7 @@ async def regenerate_question(
 
     # Process and update question
     try:
-        gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        gemini_client = get_gemini_client()
 
         await try_retry_and_update(
             gemini_client=gemini_client,
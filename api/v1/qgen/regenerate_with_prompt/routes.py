@@ -1,10 +1,8 @@
 import logging
-import os
 
 import supabase
 from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile, status
 from fastapi.responses import Response
-from google import genai
 
 from api.v1.auth import get_supabase_client, require_supabase_user
 from api.v1.qgen.credits import check_user_has_credits, deduct_user_credits
@@ -12,6 +10,7 @@ from api.v1.qgen.regenerate_with_prompt.service import (
     QuestionProcessingError,
     RegenerateWithPromptService,
 )
+from api.v1.qgen.utils.gemini_client import get_gemini_client
 
 logger = logging.getLogger(__name__)
 
@@ -85,7 +84,7 @@ async def regenerate_question_with_prompt(
             raise HTTPException(status_code=503, detail="Browser service unavailable")
 
         # Initialize Gemini Client
-        gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        gemini_client = get_gemini_client()
 
         # Process
         await RegenerateWithPromptService.regenerate_question(
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 import supabase
@@ -7,7 +8,12 @@ from google.genai import types
 
 from api.v1.qgen.models import AllQuestions
 from api.v1.qgen.prompts import regenerate_question_with_prompt_prompt
-from api.v1.qgen.utils.screenshot_utils import generate_screenshot, save_image_for_debug
+from api.v1.qgen.utils.retry import backoff_delay, classify_error
+from api.v1.qgen.utils.screenshot_utils import (
+    SCREENSHOT_MIME_TYPE,
+    generate_screenshot,
+    save_image_for_debug_in_background,
+)
 from api.v1.qgen.version_service import create_new_version_on_update
 from supabase_dir import GenImagesInsert
 
@@ -28,6 +34,43 @@ def _log_prefix(retry_idx: int = None) -> str:
     return ""
 
 
+def _save_regenerated_question(
+    supabase_client: supabase.Client,
+    gen_question_id: str,
+    update_data: dict,
+    svg_list: list | None,
+) -> None:
+    """
+    Saves the regenerated question, its new version and SVGs. Meant to be run off the event loop.
+    """
+    # Create new version before updating question
+    create_new_version_on_update(supabase_client, gen_question_id, update_data)
+
+    supabase_client.table("gen_questions").update(update_data).eq("id", gen_question_id).execute()
+
+    # Insert SVGs into gen_images table if present
+    if svg_list:
+        logger.debug(f"SVGs generated for question {gen_question_id}: {len(svg_list)} SVG(s) found")
+
+        # First, delete existing SVGs for this question (to replace with new ones)
+        supabase_client.table("gen_images").delete().eq("gen_question_id", gen_question_id).execute()
+
+        for position, svg_item in enumerate(svg_list, start=1):
+            try:
+                svg_string = svg_item.get("svg") if isinstance(svg_item, dict) else svg_item.svg
+                if svg_string:
+                    gen_image = GenImagesInsert(
+                        gen_question_id=gen_question_id,
+                        svg_string=svg_string,
+                        position=position,
+                    )
+                    supabase_client.table("gen_images").insert(
+                        gen_image.model_dump(mode="json", exclude_none=True)
+                    ).execute()
+            except Exception as svg_error:
+                logger.warning(f"Failed to insert SVG for question {gen_question_id}: {svg_error}")
+
+
 async def process_uploaded_files(files: list[UploadFile], gen_question_id: str = None) -> list[types.Part]:
     """
     Process uploaded files and convert them to Gemini Part objects.
@@ -40,10 +83,7 @@ async def process_uploaded_files(files: list[UploadFile], gen_question_id: str =
 
             # Log image files if logging is enabled
             if content_type.startswith("image/") and gen_question_id:
-                try:
-                    await save_image_for_debug(content, gen_question_id, content_type)
-                except Exception as e:
-                    logger.warning(f"Failed to log uploaded image {file.filename}: {e}")
+                save_image_for_debug_in_background(content, gen_question_id, content_type)
 
             if content_type.startswith("image/") or content_type == "application/pdf":
                 parts.append(types.Part.from_bytes(data=content, mime_type=content_type))
@@ -71,14 +111,16 @@ class RegenerateWithPromptService:
         custom_prompt: str | None = None,
         file_parts: list[types.Part] | None = None,
         retry_idx: int = None,
+        prompt_text: str | None = None,
     ) -> dict:
         prefix = _log_prefix(retry_idx)
         logger.debug(f"{prefix}Processing regenerate with prompt for question")
 
-        prompt_text = regenerate_question_with_prompt_prompt(
-            gen_question=gen_question_data,
-            custom_prompt=custom_prompt,
-        )
+        if prompt_text is None:
+            prompt_text = regenerate_question_with_prompt_prompt(
+                gen_question=gen_question_data,
+                custom_prompt=custom_prompt,
+            )
 
         contents = []
         if file_parts:
@@ -127,9 +169,10 @@ class RegenerateWithPromptService:
         custom_prompt: str | None = None,
         file_parts: list[types.Part] | None = None,
         retry_idx: int = None,
+        prompt_text: str | None = None,
     ) -> AllQuestions:
         response = await RegenerateWithPromptService.process_question(
-            gemini_client, gen_question_data, custom_prompt, file_parts, retry_idx
+            gemini_client, gen_question_data, custom_prompt, file_parts, retry_idx, prompt_text=prompt_text
         )
 
         try:
@@ -165,10 +208,10 @@ class RegenerateWithPromptService:
             logger.info(f"Generating screenshot for question {gen_question_id}")
             try:
                 image_bytes = await generate_screenshot(gen_question_data, browser_service)
-                await save_image_for_debug(image_bytes, gen_question_id, "image/png")
+                save_image_for_debug_in_background(image_bytes, gen_question_id, SCREENSHOT_MIME_TYPE)
 
                 # Create image part
-                screenshot_part = types.Part.from_bytes(data=image_bytes, mime_type="image/png")
+                screenshot_part = types.Part.from_bytes(data=image_bytes, mime_type=SCREENSHOT_MIME_TYPE)
                 all_parts.append(screenshot_part)
             except Exception as e:
                 logger.warning(f"Failed to generate screenshot: {e}")
@@ -182,11 +225,14 @@ class RegenerateWithPromptService:
         # 3. Call Gemini with Retry
         max_retries = 5
         last_exception = None
+        prompt_text = regenerate_question_with_prompt_prompt(
+            gen_question=gen_question_data, custom_prompt=custom_prompt
+        )
 
         for attempt in range(max_retries):
             try:
                 regenerated_question = await RegenerateWithPromptService.process_and_validate(
-                    gemini_client, gen_question_data, custom_prompt, all_parts, attempt + 1
+                    gemini_client, gen_question_data, custom_prompt, all_parts, attempt + 1, prompt_text=prompt_text
                 )
 
                 # 4. Update DB
@@ -211,36 +257,17 @@ class RegenerateWithPromptService:
                     else:
                         update_data["match_the_following_columns"] = cols
 
-                # Create new version before updating question
-                create_new_version_on_update(supabase_client, gen_question_id, update_data)
-
-                supabase_client.table("gen_questions").update(update_data).eq("id", gen_question_id).execute()
-
-                # Insert SVGs into gen_images table if present
-                if svg_list:
-                    logger.debug(f"SVGs generated for question {gen_question_id}: {len(svg_list)} SVG(s) found")
-
-                    # First, delete existing SVGs for this question (to replace with new ones)
-                    supabase_client.table("gen_images").delete().eq("gen_question_id", gen_question_id).execute()
-
-                    for position, svg_item in enumerate(svg_list, start=1):
-                        try:
-                            svg_string = svg_item.get("svg") if isinstance(svg_item, dict) else svg_item.svg
-                            if svg_string:
-                                gen_image = GenImagesInsert(
-                                    gen_question_id=gen_question_id,
-                                    svg_string=svg_string,
-                                    position=position,
-                                )
-                                supabase_client.table("gen_images").insert(
-                                    gen_image.model_dump(mode="json", exclude_none=True)
-                                ).execute()
-                        except Exception as svg_error:
-                            logger.warning(f"Failed to insert SVG for question {gen_question_id}: {svg_error}")
+                await asyncio.to_thread(
+                    _save_regenerated_question, supabase_client, gen_question_id, update_data, svg_list
+                )
 
                 return True
             except Exception as e:
                 last_exception = e
+                if classify_error(e) == "fatal":
+                    raise QuestionProcessingError(f"Gemini rejected the regenerate request: {e}") from e
                 logger.warning(f"Attempt {attempt + 1} failed: {e}")
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(backoff_delay(attempt))
 
         raise QuestionProcessingError(f"Regeneration failed after {max_retries} retries") from last_exception
@@ -11,7 +11,7 @@ from fastapi import APIRouter, status
 
 from .auto_correct.routes import auto_correct_question
 from .download_docx import download_docx
-from .download_pdf import download_pdf
+from .download_pdf import download_pdf, download_pdfs
 from .edit_svg.routes import edit_svg
 from .extract_questions.routes import extract_questions
 from .generate_questions.routes import generate_questions
@@ -31,4 +31,5 @@ router.post("/extract_questions", status_code=status.HTTP_201_CREATED)(extract_q
 router.post("/edit_svg", status_code=status.HTTP_200_OK)(edit_svg)
 router.post("/get_feedback", status_code=status.HTTP_200_OK)(get_feedback)
 router.post("/download_pdf", status_code=status.HTTP_200_OK)(download_pdf)
+router.post("/download_pdfs", status_code=status.HTTP_200_OK)(download_pdfs)
 router.post("/download_docx", status_code=status.HTTP_200_OK)(download_docx)
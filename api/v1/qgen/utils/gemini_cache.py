@@ -0,0 +1,69 @@
+"""
+Explicit Gemini context caching for static system instructions.
+"""
+
+import asyncio
+import logging
+import time
+
+from google import genai
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+
+class SystemInstructionCache:
+    """
+    Registers a static system instruction as Gemini cached content, once per model, and hands out the
+    cache name so requests reference it instead of resending (and re-prefilling) the instruction.
+
+    Caches are re-created refresh_margin seconds before they expire. Creation is best-effort: if Gemini
+    rejects it (e.g. the instruction is below the model's minimum cacheable size), get() returns None
+    for that model until the TTL has passed and callers send the instruction inline.
+    """
+
+    def __init__(self, system_instruction: str, ttl_seconds: int = 3600, refresh_margin: float = 300.0):
+        self._system_instruction = system_instruction
+        self._ttl_seconds = ttl_seconds
+        self._refresh_margin = refresh_margin
+        # model -> (cache name or None, monotonic time until which it is used)
+        self._entries: dict[str, tuple[str | None, float]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _current(self, model: str) -> tuple[str | None, float] | None:
+        entry = self._entries.get(model)
+        return entry if entry and time.monotonic() < entry[1] else None
+
+    async def get(self, gemini_client: genai.Client, model: str) -> str | None:
+        """Returns the cached content name for model, creating it if needed, or None to send inline."""
+        if self._ttl_seconds <= 0:
+            return None
+        if entry := self._current(model):
+            return entry[0]
+
+        async with self._locks.setdefault(model, asyncio.Lock()):
+            # Another caller may have created it while we waited for the lock
+            if entry := self._current(model):
+                return entry[0]
+
+            now = time.monotonic()
+            try:
+                cached = await gemini_client.aio.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        system_instruction=self._system_instruction,
+                        ttl=f"{self._ttl_seconds}s",
+                    ),
+                )
+                entry = (cached.name, now + self._ttl_seconds - self._refresh_margin)
+            except Exception as e:
+                logger.info(f"Gemini context cache unavailable for {model}, sending system instruction inline: {e}")
+                entry = (None, now + self._ttl_seconds)
+
+            self._entries[model] = entry
+            return entry[0]
+
+    def invalidate(self, model: str, name: str) -> None:
+        """Drops a cache the server no longer accepts so the next get() creates a fresh one."""
+        if self._entries.get(model, (None,))[0] == name:
+            del self._entries[model]
@@ -0,0 +1,17 @@
+"""
+Provides the process-wide Gemini client.
+"""
+
+from functools import lru_cache
+
+from google import genai
+
+from config.settings import GEMINI_API_KEY
+
+
+@lru_cache(maxsize=1)
+def get_gemini_client() -> genai.Client:
+    """
+    Returns a cached Gemini client instance so calls share its HTTP connection pool.
+    """
+    return genai.Client(api_key=GEMINI_API_KEY)
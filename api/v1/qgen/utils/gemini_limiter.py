@@ -0,0 +1,103 @@
+"""
+Client-side pacing for Gemini calls, shared by every coroutine in the process.
+"""
+
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from google.genai import errors as genai_errors
+
+from config.settings import GEMINI_MAX_CONCURRENCY, GEMINI_RPM
+
+logger = logging.getLogger(__name__)
+
+# Used when a 429 carries neither a Retry-After header nor a RetryInfo delay
+DEFAULT_RETRY_AFTER = 5.0
+
+_RETRY_DELAY_RE = re.compile(r"^(\d+(?:\.\d+)?)s$")
+
+
+def retry_after_seconds(exc: genai_errors.APIError, default: float = DEFAULT_RETRY_AFTER) -> float:
+    """
+    Returns how long the server asked us to back off after a 429, from the Retry-After header or the
+    google.rpc.RetryInfo entry in the error details.
+    """
+    headers = getattr(exc.response, "headers", None)
+    if headers is not None:
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+
+    error = exc.details.get("error", {}) if isinstance(exc.details, dict) else {}
+    for detail in error.get("details") or []:
+        match = _RETRY_DELAY_RE.match(str(detail.get("retryDelay", ""))) if isinstance(detail, dict) else None
+        if match:
+            return float(match.group(1))
+    return default
+
+
+class GeminiLimiter:
+    """
+    Gates Gemini calls on a concurrency cap, a sliding one-minute request window (requests_per_minute,
+    0 disables it) and a shared retry-after window: once any call gets a 429, every caller waits until
+    the delay the server asked for has passed instead of spending its own retries on more 429s.
+    """
+
+    def __init__(self, max_concurrency: int = 4, requests_per_minute: int = 0, acquire_timeout: float = 120.0):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._requests_per_minute = requests_per_minute
+        self._acquire_timeout = acquire_timeout
+        self._request_times: deque[float] = deque()
+        self.retry_after_until = 0.0
+
+    def _seconds_until_slot(self) -> float:
+        now = time.monotonic()
+        wait = self.retry_after_until - now
+        if self._requests_per_minute:
+            while self._request_times and now - self._request_times[0] >= 60:
+                self._request_times.popleft()
+            if len(self._request_times) >= self._requests_per_minute:
+                wait = max(wait, 60 - (now - self._request_times[0]))
+        return wait
+
+    async def _wait_for_slot(self) -> None:
+        while (wait := self._seconds_until_slot()) > 0:
+            # +-25% jitter so callers released by the same window don't all fire at once
+            await asyncio.sleep(wait * random.uniform(0.75, 1.25))
+        self._request_times.append(time.monotonic())
+
+    def has_free_slot(self) -> bool:
+        """Returns True if a call starting now would get a permit and a request slot without waiting."""
+        return not self._semaphore.locked() and self._seconds_until_slot() <= 0
+
+    def note_rate_limited(self, delay: float) -> None:
+        """Holds all callers for delay seconds from now (never shortens an existing window)."""
+        self.retry_after_until = max(self.retry_after_until, time.monotonic() + delay)
+        logger.warning(f"Gemini rate limited, pausing calls for {delay:.1f}s")
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        Waits for a permit (raising TimeoutError after acquire_timeout seconds) and holds it for the
+        duration of the block. A 429 raised inside the block opens the shared retry-after window.
+        """
+        await asyncio.wait_for(self._semaphore.acquire(), timeout=self._acquire_timeout)
+        try:
+            await self._wait_for_slot()
+            try:
+                yield
+            except genai_errors.APIError as e:
+                if e.code == 429:
+                    self.note_rate_limited(retry_after_seconds(e))
+                raise
+        finally:
+            self._semaphore.release()
+
+
+gemini_limiter = GeminiLimiter(max_concurrency=GEMINI_MAX_CONCURRENCY, requests_per_minute=GEMINI_RPM)
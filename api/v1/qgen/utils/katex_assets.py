@@ -0,0 +1,62 @@
+"""
+KaTeX assets for headless rendering.
+
+When the KaTeX dist files are present under KATEX_ASSETS_DIR (the Docker image fetches them at build
+time), they are read once at import and inlined into the page, with the woff2 fonts embedded as data URIs,
+so rendering makes no network requests. Otherwise the CDN tags are used.
+"""
+
+import base64
+import logging
+import re
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+KATEX_VERSION = "0.16.8"
+KATEX_CDN_URL = f"https://cdn.jsdelivr.net/npm/katex@{KATEX_VERSION}/dist"
+KATEX_ASSETS_DIR = Path(__file__).parent / "assets" / "katex"
+
+_FONT_URL_RE = re.compile(r"url\((fonts/[^)]+)\)")
+
+
+def _inline_fonts(css: str, assets_dir: Path) -> str:
+    """Embed local woff2 fonts as data URIs and point every other font URL at the CDN."""
+
+    def _replace(match: re.Match) -> str:
+        rel_path = match.group(1)
+        font_path = assets_dir / rel_path
+        if rel_path.endswith(".woff2") and font_path.is_file():
+            encoded = base64.b64encode(font_path.read_bytes()).decode("ascii")
+            return f"url(data:font/woff2;base64,{encoded})"
+        return f"url({KATEX_CDN_URL}/{rel_path})"
+
+    return _FONT_URL_RE.sub(_replace, css)
+
+
+def _build_head_html(assets_dir: Path) -> str:
+    try:
+        css = (assets_dir / "katex.min.css").read_text(encoding="utf-8")
+        katex_js = (assets_dir / "katex.min.js").read_text(encoding="utf-8")
+        auto_render_js = (assets_dir / "contrib" / "auto-render.min.js").read_text(encoding="utf-8")
+    except OSError:
+        logger.info("KaTeX assets not found locally, using CDN", extra={"assets_dir": str(assets_dir)})
+        return (
+            f'<link rel="stylesheet" href="{KATEX_CDN_URL}/katex.min.css">\n'
+            f'<script src="{KATEX_CDN_URL}/katex.min.js"></script>\n'
+            f'<script src="{KATEX_CDN_URL}/contrib/auto-render.min.js"></script>'
+        )
+
+    return (
+        f"<style>{_inline_fonts(css, assets_dir)}</style>\n"
+        f"<script>{katex_js}</script>\n"
+        f"<script>{auto_render_js}</script>"
+    )
+
+
+# <head> markup that loads KaTeX and its auto-render extension, built once per process
+KATEX_HEAD_HTML = _build_head_html(KATEX_ASSETS_DIR)
+
+# Set by the pages' KaTeX render scripts once math is rendered and fonts are loaded; browser tasks wait for
+# this instead of network idle
+KATEX_READY = "window.__katexDone === true"
@@ -0,0 +1,81 @@
+"""
+Coalesces concurrent single-item calls into batched calls.
+"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Buffers submitted items until max_batch_size are waiting or max_wait seconds have passed since the
+    first one, then hands them to process_batch in one call.
+
+    process_batch must return one result per item, in order. A result that is an exception is raised
+    to that item's caller only; an exception raised by process_batch itself fails the whole batch.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[list[T]], Awaitable[list[R | BaseException]]],
+        max_batch_size: int = 8,
+        max_wait: float = 0.25,
+    ):
+        self._process_batch = process_batch
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._pending: list[tuple[T, asyncio.Future]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        # Strong references so running batches aren't garbage-collected before they finish
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, item: T) -> R:
+        """Queues item for the next batch and waits for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[T, asyncio.Future]]) -> None:
+        try:
+            results = await self._process_batch([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"process_batch returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Callers that were cancelled while waiting have already-done futures; their results are dropped
+        for (_, future), result in zip(batch, results, strict=True):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
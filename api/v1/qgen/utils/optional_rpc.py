@@ -0,0 +1,44 @@
+"""
+Calls to Postgres functions that a database may not have deployed yet.
+
+The functions are defined in supabase_dir/migrations. Until its migration is applied, PostgREST answers calls to
+a function with PGRST202 and callers fall back to plain table queries.
+"""
+
+import logging
+from typing import Any
+
+import supabase
+from postgrest import APIResponse
+from postgrest.exceptions import APIError
+
+logger = logging.getLogger(__name__)
+
+# PostgREST error code for "function not found in the schema cache"
+MISSING_FUNCTION_CODE = "PGRST202"
+
+
+class OptionalRpc:
+    """
+    A Postgres function called through PostgREST that may be missing from the database.
+
+    call() returns the response, or None if the function is missing. The first PGRST202 marks it unavailable
+    for the rest of the process, so later calls skip straight to the caller's fallback; any other error is
+    raised as usual.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.available = True
+
+    def call(self, supabase_client: supabase.Client, params: dict[str, Any]) -> APIResponse | None:
+        if not self.available:
+            return None
+        try:
+            return supabase_client.rpc(self.name, params).execute()
+        except APIError as e:
+            if e.code != MISSING_FUNCTION_CODE:
+                raise
+            logger.info(f"{self.name} function not available, using the fallback queries")
+            self.available = False
+            return None
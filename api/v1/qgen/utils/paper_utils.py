@@ -1,11 +1,40 @@
+"""
+Paper data shared by the DOCX and PDF downloads.
+
+The fast path is the get_paper_bundle Postgres function (supabase_dir/migrations), which returns the draft and
+everything printed with it in one round trip. Databases without the function fall back to one select per table.
+"""
+
+import asyncio
+import hashlib
+import io
 import logging
+from collections import defaultdict
+from collections.abc import Iterator
 from datetime import time
+from operator import itemgetter
 
+import orjson
 import supabase
 from fastapi import HTTPException
 
+from api.v1.qgen.utils.optional_rpc import OptionalRpc
+
 logger = logging.getLogger(__name__)
 
+_paper_bundle_rpc = OptionalRpc("get_paper_bundle")
+
+# Paper data fetches in progress, by draft id. Finished results are not kept: questions and sections are also
+# edited directly through Supabase, so there is no write to invalidate on and a cached copy would be served
+# (and ETagged) stale.
+_paper_data_in_flight: dict[str, asyncio.Future] = {}
+
+# Sort key for questions; _fetch_paper_data_sync fills in position_in_draft where the column is null
+_by_position = itemgetter("position_in_draft")
+
+# Size of the pieces finished documents are streamed to the client in
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
 
 def format_duration(d_time: time | None) -> str:
     if not d_time:
@@ -25,89 +54,175 @@ def format_duration(d_time: time | None) -> str:
     return f"{total_minutes} Mins" if total_minutes > 0 else "60 Mins"
 
 
-async def fetch_paper_data(draft_id: str, supabase_client: supabase.Client):
+def iter_chunks(stream: io.BytesIO, chunk_size: int = RESPONSE_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yields a finished document in chunk_size pieces for a StreamingResponse."""
+    while chunk := stream.read(chunk_size):
+        yield chunk
+
+
+def paper_etag(data: dict, mode: str) -> str:
     """
-    Fetches all data required to generate a paper.
+    Content hash of the paper data and mode. Images are identified by their gen_images rows (URL or SVG) in
+    images_map. The signed logo URL changes on every request, so the draft's logo path (part of the draft
+    row) stands in for it.
+    """
+    content = {key: value for key, value in data.items() if key != "logo_url"}
+    digest = hashlib.blake2b(orjson.dumps([mode, content], option=orjson.OPT_SORT_KEYS), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
 
-    Includes Draft, Sections, Questions, Instructions, Images.
+
+def group_questions_by_section(questions: list[dict]) -> dict[str, list[dict]]:
     """
-    try:
-        # 1. Fetch Draft Data
-        draft_res = supabase_client.table("qgen_drafts").select("*").eq("id", draft_id).execute()
-        if not draft_res.data:
-            raise HTTPException(status_code=404, detail="Draft not found")
-        draft = draft_res.data[0]
-
-        # 2. Fetch Sections
-        sections_res = (
-            supabase_client.table("qgen_draft_sections")
+    Buckets questions by qgen_draft_section_id in one pass, each bucket sorted by position_in_draft,
+    so renderers don't rescan every question for every section.
+    """
+    questions_by_section: dict[str, list[dict]] = defaultdict(list)
+    for q in questions:
+        questions_by_section[q["qgen_draft_section_id"]].append(q)
+    for section_questions in questions_by_section.values():
+        section_questions.sort(key=_by_position)
+    return questions_by_section
+
+
+def _fetch_paper_bundle(supabase_client: supabase.Client, draft_id: str) -> dict | None:
+    """
+    Fetches the draft with its sections, instructions, questions and images in one get_paper_bundle call.
+    Returns None when the function isn't deployed, in which case the caller queries the tables itself.
+    """
+    response = _paper_bundle_rpc.call(supabase_client, {"p_draft_id": draft_id})
+    return response.data if response is not None else None
+
+
+def _fetch_paper_tables(supabase_client: supabase.Client, draft_id: str) -> dict:
+    """
+    Fallback for databases without get_paper_bundle: one select per table, in dependency order.
+    """
+    # 1. Fetch Draft Data
+    draft_res = supabase_client.table("qgen_drafts").select("*").eq("id", draft_id).execute()
+    if not draft_res.data:
+        return {"draft": None}
+    draft = draft_res.data[0]
+
+    # 2. Fetch Sections
+    sections_res = (
+        supabase_client.table("qgen_draft_sections")
+        .select("*")
+        .eq("qgen_draft_id", draft_id)
+        .order("position_in_draft")
+        .execute()
+    )
+    sections = sections_res.data
+
+    # 3. Fetch Instructions
+    instructions_res = (
+        supabase_client.table("qgen_draft_instructions_drafts_maps")
+        .select("*")
+        .eq("qgen_draft_id", draft_id)
+        .order("created_at", desc=True)
+        .execute()
+    )
+    instructions = instructions_res.data
+
+    # 4. Fetch Questions
+    section_ids = [s["id"] for s in sections]
+    questions = []
+    if section_ids:
+        questions_res = (
+            supabase_client.table("gen_questions")
             .select("*")
-            .eq("qgen_draft_id", draft_id)
-            .order("position_in_draft")
+            .eq("is_in_draft", True)
+            .in_("qgen_draft_section_id", section_ids)
             .execute()
         )
-        sections = sections_res.data
-
-        # 3. Fetch Instructions
-        instructions_res = (
-            supabase_client.table("qgen_draft_instructions_drafts_maps")
+        questions = questions_res.data
+
+    # 5. Fetch Question Images
+    question_ids = [q["id"] for q in questions]
+    images = []
+    if question_ids:
+        images_res = (
+            supabase_client.table("gen_images")
             .select("*")
-            .eq("qgen_draft_id", draft_id)
-            .order("created_at", desc=True)
+            .in_("gen_question_id", question_ids)
+            .order("position")
             .execute()
         )
-        instructions = instructions_res.data
-
-        # 4. Fetch Questions
-        section_ids = [s["id"] for s in sections]
-        questions = []
-        if section_ids:
-            questions_res = (
-                supabase_client.table("gen_questions")
-                .select("*")
-                .eq("is_in_draft", True)
-                .in_("qgen_draft_section_id", section_ids)
-                .execute()
-            )
-            questions = questions_res.data
-
-        # 5. Fetch Question Images
-        question_ids = [q["id"] for q in questions]
-        images_map = {}
-        if question_ids:
-            images_res = (
-                supabase_client.table("gen_images")
-                .select("*")
-                .in_("gen_question_id", question_ids)
-                .order("position")
-                .execute()
-            )
-            for img in images_res.data:
-                q_id = img["gen_question_id"]
-                if q_id not in images_map:
-                    images_map[q_id] = []
-                images_map[q_id].append(img)
-
-        # 6. Get Logo URL if exists
-        logo_url = None
-        if draft.get("logo_url"):
-            try:
-                logo_res = supabase_client.storage.from_("draft_logo_bucket").create_signed_url(draft["logo_url"], 3600)
-                logo_url = logo_res.get("signedUrl")
-            except Exception as e:
-                logger.warning(f"Failed to get signed logo URL: {e}")
-
-        return {
-            "draft": draft,
-            "sections": sections,
-            "questions": questions,
-            "instructions": instructions,
-            "logo_url": logo_url,
-            "images_map": images_map,
-        }
-
+        images = images_res.data
+
+    return {
+        "draft": draft,
+        "sections": sections,
+        "instructions": instructions,
+        "questions": questions,
+        "images": images,
+    }
+
+
+def _fetch_paper_data_sync(draft_id: str, supabase_client: supabase.Client) -> dict:
+    bundle = _fetch_paper_bundle(supabase_client, draft_id) or _fetch_paper_tables(supabase_client, draft_id)
+    draft = bundle["draft"]
+    if not draft:
+        raise HTTPException(status_code=404, detail="Draft not found")
+
+    # position_in_draft is nullable; default it once here so sorting can use a plain itemgetter
+    questions = [
+        q if q.get("position_in_draft") is not None else {**q, "position_in_draft": 0} for q in bundle["questions"]
+    ]
+
+    images_map: dict[str, list[dict]] = defaultdict(list)
+    for img in bundle["images"]:
+        images_map[img["gen_question_id"]].append(img)
+
+    # 6. Get Logo URL if exists
+    logo_url = None
+    if draft.get("logo_url"):
+        try:
+            logo_res = supabase_client.storage.from_("draft_logo_bucket").create_signed_url(draft["logo_url"], 3600)
+            logo_url = logo_res.get("signedUrl")
+        except Exception as e:
+            logger.warning(f"Failed to get signed logo URL: {e}")
+
+    return {
+        "draft": draft,
+        "sections": bundle["sections"],
+        "questions": questions,
+        "instructions": bundle["instructions"],
+        "logo_url": logo_url,
+        "images_map": images_map,
+    }
+
+
+async def _load_paper_data(draft_id: str, supabase_client: supabase.Client) -> dict:
+    try:
+        # The Supabase client is blocking, so the round trips run in a worker thread
+        data = await asyncio.to_thread(_fetch_paper_data_sync, draft_id, supabase_client)
     except HTTPException:
         raise
     except Exception as e:
         logger.exception("Database error during paper data fetching")
         raise HTTPException(status_code=500, detail="Internal Server Error") from e
+    return data
+
+
+async def fetch_paper_data(draft_id: str, supabase_client: supabase.Client):
+    """
+    Fetches all data required to generate a paper.
+
+    Includes Draft, Sections, Questions, Instructions, Images. Concurrent requests for the same draft share
+    one fetch, so callers must not mutate the result.
+    """
+    task = _paper_data_in_flight.get(draft_id)
+    if task is None:
+        task = asyncio.ensure_future(_load_paper_data(draft_id, supabase_client))
+        _paper_data_in_flight[draft_id] = task
+        task.add_done_callback(lambda _: _paper_data_in_flight.pop(draft_id, None))
+
+    # Shielded so one caller disconnecting doesn't cancel the fetch the others are waiting on
+    return await asyncio.shield(task)
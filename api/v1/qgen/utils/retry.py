@@ -4,12 +4,83 @@ Contains the logic to retry calls to Gemini's generate_content method.
 
 import asyncio
 import logging
-from typing import Any
+import random
+from collections.abc import Awaitable, Callable
+from typing import Any, Literal, TypeVar
 
 from google import genai
+from google.genai import errors as genai_errors
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+
+def is_transient_gemini_error(exc: BaseException) -> bool:
+    """
+    Returns True if exc is a Gemini API error worth retrying (rate limiting or a server-side failure).
+    """
+    return isinstance(exc, genai_errors.APIError) and (exc.code == 429 or exc.code >= 500)
+
+
+def classify_error(exc: BaseException, fatal_types: tuple[type[BaseException], ...] = ()) -> Literal["retry", "fatal"]:
+    """
+    Decides whether a failed Gemini attempt is worth repeating. Client errors other than rate limiting
+    (bad request, auth, not found, ...) and instances of fatal_types would fail the same way again.
+    """
+    if isinstance(exc, fatal_types):
+        return "fatal"
+    if isinstance(exc, genai_errors.ClientError) and not is_transient_gemini_error(exc):
+        return "fatal"
+    return "retry"
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0, jitter: float = 0.3) -> float:
+    """
+    Returns the capped exponential backoff (plus random jitter) to wait after the given 0-based attempt.
+    """
+    return min(base * 2**attempt, cap) + random.uniform(0, jitter)
+
+
+async def run_hedged(
+    attempt: Callable[[], Awaitable[T]],
+    max_in_flight: int = 2,
+    hedge_delay: float = 0.0,
+    should_hedge: Callable[[], bool] | None = None,
+) -> T:
+    """
+    Runs up to max_in_flight concurrent copies of attempt and returns the first successful result.
+
+    The first copy starts immediately; each further copy starts once hedge_delay seconds pass
+    without any copy finishing (0 starts them all at once). If should_hedge returns False when
+    the delay is up, no copy is started and the wait begins again. The remaining copies are
+    cancelled as soon as one succeeds. If every started copy fails, the last exception is raised.
+    """
+    pending: set[asyncio.Task] = {asyncio.create_task(attempt())}
+    launched = 1
+    last_exc: BaseException | None = None
+
+    try:
+        while pending:
+            can_hedge = launched < max_in_flight
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=hedge_delay if can_hedge else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_exc = task.exception()
+            if can_hedge and not done and (should_hedge is None or should_hedge()):
+                pending.add(asyncio.create_task(attempt()))
+                launched += 1
+        raise last_exc
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
 
 async def generate_content_with_retries(
     api_endpoint: str,
@@ -1,41 +1,194 @@
+import asyncio
 import logging
 from datetime import datetime
+from itertools import zip_longest
 from pathlib import Path
 from typing import Any
 
 logger = logging.getLogger(__name__)
 
-from config.settings import LOG_IMAGES
+from api.v1.qgen.utils.katex_assets import KATEX_HEAD_HTML, KATEX_READY
+from config.settings import HIGH_QUALITY_SCREENSHOTS, LOG_IMAGES
 
 IMAGES_LOG_DIR = Path(__file__).parent.parent.parent.parent.parent / "logs" / "images"
 
+# Browser context options for question screenshots; BrowserService pre-warms pages with these at startup
+SCREENSHOT_CONTEXT_OPTIONS = {"device_scale_factor": 2}
+_OPTION_LABELS = ("a)", "b)", "c)", "d)")
+
+# JPEG at q85 is several times smaller than PNG for a text card and still reads cleanly for Gemini
+if HIGH_QUALITY_SCREENSHOTS:
+    SCREENSHOT_OPTIONS = {"type": "png"}
+    SCREENSHOT_MIME_TYPE = "image/png"
+else:
+    SCREENSHOT_OPTIONS = {"type": "jpeg", "quality": 85}
+    SCREENSHOT_MIME_TYPE = "image/jpeg"
+
+
+# CSS for the paper - Synchronized with PaperPreview.tsx
+_SCREENSHOT_CSS = """
+@import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
+
+body {
+    font-family: 'Inter', sans-serif;
+    color: black;
+    line-height: 1.5;
+    padding: 20px;
+    margin: 0;
+    background-color: white;
+    width: 600px; /* Fixed width for consistent screenshot */
+}
+
+.question-card {
+    border: 1px solid #e2e8f0;
+    border-radius: 8px;
+    padding: 16px;
+    background: white;
+}
+
+.q-text {
+    font-size: 15px;
+    color: #1f2937;
+    font-weight: 500;
+    margin-bottom: 8px;
+}
+
+.q-marks {
+    font-weight: 600;
+    font-size: 13px;
+    color: #6b7280;
+    margin-left: 8px;
+}
+
+.options-grid {
+    display: grid;
+    grid-template-columns: repeat(2, 1fr);
+    gap: 8px 16px;
+    margin-top: 12px;
+}
+
+.option {
+    display: flex;
+    gap: 8px;
+    font-size: 14px;
+    color: #4b5563;
+}
+
+.opt-label {
+    font-weight: 600;
+    color: #1f2937;
+}
+
+.images-container {
+    display: flex;
+    flex-wrap: wrap;
+    gap: 8px;
+    margin: 8px 0;
+}
+
+.q-image {
+    max-height: 200px;
+    max-width: 100%;
+    object-fit: contain;
+    border-radius: 4px;
+}
+
+.katex { font-size: 1.1em !important; }
+"""
+
+_KATEX_SCRIPT = """
+<script>
+    document.addEventListener("DOMContentLoaded", function() {
+        try {
+            renderMathInElement(document.body, {
+                delimiters: [
+                    {left: '$$', right: '$$', display: true},
+                    {left: '$', right: '$', display: false},
+                    {left: '\\\\(', right: '\\\\)', display: false},
+                    {left: '\\\\[', right: '\\\\]', display: true}
+                ],
+                throwOnError : false
+            });
+        } finally {
+            // Signal KATEX_READY once the math fonts are in, even if rendering failed
+            document.fonts.ready.then(function() { window.__katexDone = true; });
+        }
+    });
+</script>
+"""
+
+# Static parts of the screenshot page, assembled once so each question only fills in the card
+_HTML_HEAD = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="UTF-8">
+        {KATEX_HEAD_HTML}
+        <style>{_SCREENSHOT_CSS}</style>
+    </head>
+    <body>"""
+_HTML_TAIL = f"""
+        {_KATEX_SCRIPT}
+    </body>
+    </html>
+    """
+
+
+# Strong references to fire-and-forget debug saves so they aren't garbage collected before finishing
+_background_tasks: set[asyncio.Task] = set()
+
 
 class ScreenshotError(Exception):
     pass
 
 
+def _write_debug_image(image_content: bytes, gen_question_id: str, content_type: str) -> str:
+    IMAGES_LOG_DIR.mkdir(parents=True, exist_ok=True)
+    ext_map = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
+    ext = ext_map.get(content_type, ".png")
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    filename = f"{gen_question_id}_{timestamp}{ext}"
+    filepath = IMAGES_LOG_DIR / filename
+    filepath.write_bytes(image_content)
+    return str(filepath)
+
+
+def debug_images_enabled() -> bool:
+    return LOG_IMAGES and logger.level <= logging.DEBUG
+
+
 async def save_image_for_debug(
     image_content: bytes,
     gen_question_id: str,
-    content_type: str = "image/png",
+    content_type: str = SCREENSHOT_MIME_TYPE,
 ) -> str | None:
-    if not LOG_IMAGES or logger.level > logging.DEBUG:
+    if not debug_images_enabled():
         return None
 
     try:
-        IMAGES_LOG_DIR.mkdir(parents=True, exist_ok=True)
-        ext_map = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
-        ext = ext_map.get(content_type, ".png")
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        filename = f"{gen_question_id}_{timestamp}{ext}"
-        filepath = IMAGES_LOG_DIR / filename
-        filepath.write_bytes(image_content)
-        return str(filepath)
+        # The write runs in a worker thread so a slow disk never stalls the event loop
+        return await asyncio.to_thread(_write_debug_image, image_content, gen_question_id, content_type)
     except Exception as e:
         logger.warning("Failed to save debug image", extra={"error": str(e)})
         return None
 
 
+def save_image_for_debug_in_background(
+    image_content: bytes,
+    gen_question_id: str,
+    content_type: str = SCREENSHOT_MIME_TYPE,
+) -> None:
+    """
+    Fire-and-forget save_image_for_debug, so callers never wait on it. Does nothing (not even
+    scheduling a task) unless LOG_IMAGES is on.
+    """
+    if not debug_images_enabled():
+        return
+    task = asyncio.create_task(save_image_for_debug(image_content, gen_question_id, content_type))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
 async def generate_screenshot(question: dict[str, Any], browser_service) -> bytes:
     """
     Generate a screenshot of the question using Playwright via BrowserService.
@@ -43,93 +196,6 @@ async def generate_screenshot(question: dict[str, Any], browser_service) -> byte
     if not browser_service:
         raise ScreenshotError("Browser service instance not available")
 
-    # CSS for the paper - Synchronized with PaperPreview.tsx
-    css = """
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
-
-    body {
-        font-family: 'Inter', sans-serif;
-        color: black;
-        line-height: 1.5;
-        padding: 20px;
-        margin: 0;
-        background-color: white;
-        width: 600px; /* Fixed width for consistent screenshot */
-    }
-
-    .question-card {
-        border: 1px solid #e2e8f0;
-        border-radius: 8px;
-        padding: 16px;
-        background: white;
-    }
-
-    .q-text {
-        font-size: 15px;
-        color: #1f2937;
-        font-weight: 500;
-        margin-bottom: 8px;
-    }
-
-    .q-marks {
-        font-weight: 600;
-        font-size: 13px;
-        color: #6b7280;
-        margin-left: 8px;
-    }
-
-    .options-grid {
-        display: grid;
-        grid-template-columns: repeat(2, 1fr);
-        gap: 8px 16px;
-        margin-top: 12px;
-    }
-
-    .option {
-        display: flex;
-        gap: 8px;
-        font-size: 14px;
-        color: #4b5563;
-    }
-
-    .opt-label {
-        font-weight: 600;
-        color: #1f2937;
-    }
-
-    .images-container {
-        display: flex;
-        flex-wrap: wrap;
-        gap: 8px;
-        margin: 8px 0;
-    }
-
-    .q-image {
-        max-height: 200px;
-        max-width: 100%;
-        object-fit: contain;
-        border-radius: 4px;
-    }
-
-    .katex { font-size: 1.1em !important; }
-    """
-
-    katex_script = """
-    <script>
-        document.addEventListener("DOMContentLoaded", function() {
-            renderMathInElement(document.body, {
-                delimiters: [
-                    {left: '$$', right: '$$', display: true},
-                    {left: '$', right: '$', display: false},
-                    {left: '\\\\(', right: '\\\\)', display: false},
-                    {left: '\\\\[', right: '\\\\]', display: true}
-                ],
-                throwOnError : false
-            });
-        });
-    </script>
-    """
-
     # Build HTML content
     images_html = ""
     # Note: Using public URLs for images. If they are local blobs, this won't work directly
@@ -137,56 +203,40 @@ async def generate_screenshot(question: dict[str, Any], browser_service) -> byte
     # For now, we assume simple rendering text is enough context, or existing image URLs work.
 
     # Construct Options
+    question_type = question.get("question_type")
     options_html = ""
-    if question.get("question_type") in ["mcq4", "msq4"]:
-        options = [question.get(f"option{i}") for i in range(1, 5)]
-        labels = ["a)", "b)", "c)", "d)"]
-        options_html = '<div class="options-grid">'
-        for i, opt in enumerate(options):
-            if opt:
-                options_html += f'<div class="option"><span class="opt-label">{labels[i]}</span> {opt}</div>'
-        options_html += "</div>"
-    elif question.get("question_type") == "match_the_following":
+    if question_type in ("mcq4", "msq4"):
+        options = (question.get(f"option{i}") for i in range(1, 5))
+        options_html = (
+            '<div class="options-grid">'
+            + "".join(
+                f'<div class="option"><span class="opt-label">{label}</span> {opt}</div>'
+                for label, opt in zip(_OPTION_LABELS, options, strict=True)
+                if opt
+            )
+            + "</div>"
+        )
+    elif question_type == "match_the_following":
         cols = question.get("match_the_following_columns") or {}
         col_names = list(cols.keys())
         if len(col_names) >= 2:
-            left_col = cols[col_names[0]]
-            right_col = cols[col_names[1]]
-            max_rows = max(len(left_col), len(right_col))
-
-            options_html = '<table class="match-table">'
-            header_row = (
+            rows = zip_longest(cols[col_names[0]], cols[col_names[1]], fillvalue="")
+            options_html = (
+                '<table class="match-table">'
                 f'<tr><th style="text-align:left">{col_names[0]}</th>'
                 f'<th style="text-align:left">{col_names[1]}</th></tr>'
-            )
-            options_html += header_row
-            for i in range(max_rows):
-                left_item = left_col[i] if i < len(left_col) else ""
-                right_item = right_col[i] if i < len(right_col) else ""
-
-                options_html += "<tr>"
-                options_html += (
+                + "".join(
+                    "<tr>"
                     f'<td><div class="match-item"><span class="match-prefix">{i + 1}.</span> {left_item}</div></td>'
-                )
-                options_html += (
-                    f'<td><div class="match-item">'
-                    f'<span class="match-prefix">{chr(65 + i)}.</span> '
+                    f'<td><div class="match-item"><span class="match-prefix">{chr(65 + i)}.</span> '
                     f"{right_item}</div></td>"
+                    "</tr>"
+                    for i, (left_item, right_item) in enumerate(rows)
                 )
-                options_html += "</tr>"
-            options_html += "</table>"
+                + "</table>"
+            )
 
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta charset="UTF-8">
-        <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/katex@0.16.8/dist/katex.min.css">
-        <script src="https://cdn.jsdelivr.net/npm/katex@0.16.8/dist/katex.min.js"></script>
-        <script src="https://cdn.jsdelivr.net/npm/katex@0.16.8/dist/contrib/auto-render.min.js"></script>
-        <style>{css}</style>
-    </head>
-    <body>
+    html_content = f"""{_HTML_HEAD}
         <div class="question-card" id="card">
             <div style="display: flex; justify-content: space-between;">
                 <div class="q-text">{question.get("question_text", "")}</div>
@@ -195,17 +245,15 @@ async def generate_screenshot(question: dict[str, Any], browser_service) -> byte
             {images_html}
             {options_html}
         </div>
-        {katex_script}
-    </body>
-    </html>
-    """
+    {_HTML_TAIL}"""
 
     try:
         screenshot_bytes = await browser_service.take_screenshot(
             html_content=html_content,
             selector="body",
-            screenshot_options={"type": "png"},
-            context_options={"device_scale_factor": 2},
+            screenshot_options=SCREENSHOT_OPTIONS,
+            context_options=SCREENSHOT_CONTEXT_OPTIONS,
+            ready_function=KATEX_READY,
         )
         return screenshot_bytes
     except Exception as e:
@@ -1,8 +1,10 @@
 import logging
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from standardwebhooks.webhooks import Webhook
+from supabase import Client
 
+from api.v1.auth import get_supabase_client
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -54,7 +56,10 @@ router = APIRouter()
 
 
 @router.post("/auth/sms-hook")
-async def handle_supabase_sms(request: Request):
+async def handle_supabase_sms(
+    request: Request,
+    supabase: Client = Depends(get_supabase_client),
+):
     payload = await request.body()
     headers = request.headers
 
@@ -76,16 +81,8 @@ async def handle_supabase_sms(request: Request):
     # 3. Store in Supabase table
     logger.info(f"Storing OTP for {user_phone}")
 
-    # We need a direct Supabase client to write to the table
-    # This assumes we have a service_role client or similar that can write to this table
-    # Since we are in the backend, we should use the service key
+    # The injected client is the shared service-role client, which can write to this table
     try:
-        from supabase import Client, create_client
-
-        url: str = settings.SUPABASE_URL
-        key: str = settings.SUPABASE_SERVICE_KEY
-        supabase: Client = create_client(url, key)
-
         # Upsert: if phone exists, update the otp
         data = {
             "phone_number": user_phone,
@@ -7,6 +7,7 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
 # Initialize logging configuration (must be imported before other modules)
 from config.logger import setup_logging
@@ -21,11 +22,20 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    from api.v1.auth import get_supabase_client
+    from api.v1.qgen.download_docx import close_image_client
+    from api.v1.qgen.utils.screenshot_utils import SCREENSHOT_CONTEXT_OPTIONS
     from services.browser_service import BrowserService
 
+    # Build the process-wide Supabase client up front so the first request doesn't pay for it
+    try:
+        get_supabase_client()
+    except RuntimeError:
+        logger.warning("Supabase client not initialized at startup", exc_info=True)
+
     # Initialize BrowserService
     browser_service = BrowserService()
-    await browser_service.start()
+    await browser_service.start(warm_context_options=SCREENSHOT_CONTEXT_OPTIONS)
 
     # Store in app state
     app.state.browser_service = browser_service
@@ -36,13 +46,19 @@ async def lifespan(app: FastAPI):
 
     # Cleanup
     await browser_service.stop()
+    await close_image_client()
 
 
 def create_app() -> FastAPI:
     """
     The function to create the FastAPI application instance. To be used by main.py
     """
-    app = FastAPI(title="My FastAPI Application", lifespan=lifespan)
+    # orjson encodes the (already jsonable) route results noticeably faster than stdlib json
+    app = FastAPI(
+        title="My FastAPI Application",
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse,
+    )
 
     app.include_router(v1_router)
 
@@ -31,6 +31,25 @@ DEPLOYMENT_ENV = os.getenv("DEPLOYMENT_ENV")
 LOGGING_LEVEL = os.getenv("LOGGING_LEVEL", "INFO").upper()
 PING = os.getenv("PING", "FALSE").upper()
 LOG_IMAGES = os.getenv("LOG_IMAGES", "false").lower() == "true"
+# Lossless PNG question screenshots instead of the default JPEG (mainly for debugging rendering).
+HIGH_QUALITY_SCREENSHOTS = os.getenv("HIGH_QUALITY_SCREENSHOTS", "FALSE").upper() == "TRUE"
+# Seconds to reuse a verified Supabase user for the same bearer token (0 disables).
+SUPABASE_JWT_CACHE_TTL = float(os.getenv("SUPABASE_JWT_CACHE_TTL", "0"))
+# Search bank_questions through the `question_tsv` full-text column instead of ILIKE.
+# Requires the generated tsvector column + GIN index from migration 20261016000004_bank_questions_question_tsv.
+BANK_SEARCH_FTS = os.getenv("BANK_SEARCH_FTS", "FALSE").upper() == "TRUE"
+# Verify asymmetric (RS256/ES256) Supabase JWTs locally against the project JWKS.
+SUPABASE_JWT_LOCAL_VERIFY = os.getenv("SUPABASE_JWT_LOCAL_VERIFY", "TRUE").upper() == "TRUE"
+# Client-side Gemini pacing for auto-correct: max concurrent calls and requests per minute (0 disables).
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "0"))
+# Seconds each Gemini context cache of the auto-correct instructions lives (0 sends them inline on every call).
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# Connection pool shared by the cached Supabase clients: max open connections and idle keep-alive connections.
+SUPABASE_HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "20"))
+SUPABASE_HTTP_MAX_KEEPALIVE = int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", "10"))
+# Concurrent BrowserService workers, and warm screenshot pages kept per context configuration.
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", str(min(os.cpu_count() or 1, 4))))
 
 logger.info(
     "Configuration loaded",
@@ -1,23 +1,65 @@
 import asyncio
+import json
 import logging
 from collections.abc import Callable
 from typing import Any
 
-from playwright.async_api import Browser, Playwright, async_playwright
+from playwright.async_api import Browser, BrowserContext, Page, Playwright, async_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from config.settings import BROWSER_POOL_SIZE
 
 logger = logging.getLogger(__name__)
 
+# Page-relative bounding box of the first element matching a selector, or null
+_BOUNDING_BOX_JS = """sel => {
+    const el = document.querySelector(sel);
+    if (!el) return null;
+    const r = el.getBoundingClientRect();
+    return {x: r.left + window.scrollX, y: r.top + window.scrollY, width: r.width, height: r.height};
+}"""
+
+# Default wait, in milliseconds, for a ready_function to become truthy
+READY_TIMEOUT_MS = 5000
+
+
+async def _load_content(page: Page, html: str, ready_function: str | None, ready_timeout: float) -> bool:
+    """
+    Sets the page content and waits until ready_function is truthy, or for network idle without one.
+    A ready signal that never fires is logged and the page is used as it is; returns whether it fired.
+    """
+    if not ready_function:
+        await page.set_content(html, wait_until="networkidle")
+        return True
+
+    await page.set_content(html, wait_until="domcontentloaded")
+    try:
+        await page.wait_for_function(ready_function, timeout=ready_timeout)
+        return True
+    except PlaywrightTimeoutError:
+        logger.warning(f"Page not ready after {ready_timeout}ms, continuing anyway")
+        return False
+
 
 class BrowserService:
-    def __init__(self):
+    def __init__(self, pool_size: int = BROWSER_POOL_SIZE):
         self._playwright: Playwright | None = None
         self._browser: Browser | None = None
         self._queue: asyncio.Queue = asyncio.Queue()
-        self._worker_task: asyncio.Task | None = None
+        self._worker_tasks: list[asyncio.Task] = []
         self._running = False
+        # Number of worker loops, and the max number of warm pages kept per set of context options
+        self._pool_size = max(1, pool_size)
+        # Warm (context, page) pairs for pooled tasks, keyed by their serialized context options
+        self._page_pools: dict[str, asyncio.Queue[tuple[BrowserContext, Page]]] = {}
+
+    async def start(self, warm_context_options: dict[str, Any] | None = None):
+        """
+        Initialize the browser and the worker loops.
 
-    async def start(self):
-        """Initialize the browser and the worker loop."""
+        If warm_context_options is given, a full pool of pages with those options is created up front
+        so the first pooled tasks don't pay for context creation.
+        """
         if self._running:
             return
 
@@ -26,21 +68,32 @@ class BrowserService:
         self._browser = await self._playwright.chromium.launch(
             headless=True, args=["--no-sandbox", "--disable-setuid-sandbox"]
         )
+        if warm_context_options is not None:
+            pool = self._page_pool(warm_context_options)
+            for _ in range(self._pool_size):
+                pool.put_nowait(await self._new_page(warm_context_options))
         self._running = True
-        self._worker_task = asyncio.create_task(self._worker())
-        logger.info("BrowserService started.")
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self._pool_size)]
+        logger.info("BrowserService started.", extra={"pool_size": self._pool_size})
 
     async def stop(self):
-        """Stop the worker loop and close the browser."""
+        """Stop the worker loops and close the browser."""
         if not self._running:
             return
 
         logger.info("Stopping BrowserService...")
         self._running = False
-        await self._queue.put(None)  # Sentinel to stop worker
+        for _ in self._worker_tasks:
+            await self._queue.put(None)  # Sentinel to stop each worker
+
+        if self._worker_tasks:
+            await asyncio.gather(*self._worker_tasks)
 
-        if self._worker_task:
-            await self._worker_task
+        for pool in self._page_pools.values():
+            while not pool.empty():
+                context, _ = pool.get_nowait()
+                await context.close()
+        self._page_pools.clear()
 
         if self._browser:
             await self._browser.close()
@@ -50,8 +103,40 @@ class BrowserService:
 
         logger.info("BrowserService stopped.")
 
+    def _page_pool(self, context_options: dict[str, Any] | None) -> asyncio.Queue:
+        key = json.dumps(context_options or {}, sort_keys=True)
+        pool = self._page_pools.get(key)
+        if pool is None:
+            pool = self._page_pools[key] = asyncio.Queue()
+        return pool
+
+    async def _new_page(self, context_options: dict[str, Any] | None) -> tuple[BrowserContext, Page]:
+        if not self._browser:
+            raise RuntimeError("Browser is not initialized")
+        context = await self._browser.new_context(**(context_options or {}))
+        return context, await context.new_page()
+
+    async def _acquire_page(self, context_options: dict[str, Any] | None) -> tuple[BrowserContext, Page]:
+        """Check out a warm page for these context options, creating one if the pool is empty."""
+        pool = self._page_pool(context_options)
+        if not pool.empty():
+            return pool.get_nowait()
+        return await self._new_page(context_options)
+
+    async def _release_page(self, context_options: dict[str, Any] | None, context: BrowserContext, page: Page):
+        """Reset a pooled page and return it, or close it if the pool is already full or the reset fails."""
+        pool = self._page_pool(context_options)
+        if self._running and pool.qsize() < self._pool_size:
+            try:
+                await page.goto("about:blank")
+                pool.put_nowait((context, page))
+                return
+            except Exception as e:
+                logger.warning(f"Failed to reset pooled page, discarding it: {e}")
+        await context.close()
+
     async def _worker(self):
-        """Background worker to process browser tasks sequentially."""
+        """Background worker to process browser tasks from the shared queue."""
         logger.info("BrowserService worker loop started.")
         while True:
             item = await self._queue.get()
@@ -59,19 +144,20 @@ class BrowserService:
                 self._queue.task_done()
                 break
 
-            func, context_options, args, kwargs, future = item
+            func, context_options, pooled, args, kwargs, future = item
 
             try:
-                if not self._browser:
-                    raise RuntimeError("Browser is not initialized")
-
-                # Create a new context/page for each task to ensure isolation
-                context = await self._browser.new_context(**(context_options or {}))
-                page = await context.new_page()
+                # Pooled tasks reuse a warm page; the rest get a new context/page to ensure isolation
+                if pooled:
+                    context, page = await self._acquire_page(context_options)
+                else:
+                    context, page = await self._new_page(context_options)
+                reusable = False
 
                 try:
                     # Pass the page as the first argument to the function
                     result = await func(page, *args, **kwargs)
+                    reusable = pooled
                     if not future.done():
                         future.set_result(result)
                 except Exception as e:
@@ -79,8 +165,12 @@ class BrowserService:
                     if not future.done():
                         future.set_exception(e)
                 finally:
-                    await page.close()
-                    await context.close()
+                    # A page whose task failed may be in an odd state, so only clean runs go back to the pool
+                    if reusable:
+                        await self._release_page(context_options, context, page)
+                    else:
+                        await page.close()
+                        await context.close()
 
             except Exception as e:
                 logger.critical(f"Critical error in browser worker: {e}")
@@ -90,25 +180,62 @@ class BrowserService:
                 self._queue.task_done()
         logger.info("BrowserService worker loop exited.")
 
-    async def _submit(self, func: Callable, context_options: dict[str, Any], *args, **kwargs) -> Any:
-        """Submit a task to the queue and wait for the result."""
+    async def _submit(
+        self, func: Callable, context_options: dict[str, Any], *args, pooled: bool = False, **kwargs
+    ) -> Any:
+        """
+        Submit a task to the queue and wait for the result.
+
+        Pooled tasks run on a reused page and must not leave state behind that matters to the next task.
+        """
         if not self._running:
             raise RuntimeError("BrowserService is not running")
 
         future = asyncio.get_running_loop().create_future()
-        await self._queue.put((func, context_options, args, kwargs, future))
+        await self._queue.put((func, context_options, pooled, args, kwargs, future))
         return await future
 
-    async def generate_pdf(self, html_content: str, pdf_options: dict[str, Any] = None) -> bytes:
+    async def generate_pdf(
+        self,
+        html_content: str,
+        pdf_options: dict[str, Any] = None,
+        ready_function: str | None = None,
+        ready_timeout: float = READY_TIMEOUT_MS,
+    ) -> bytes:
         """
         Generate a PDF from HTML content.
+
+        With ready_function, the PDF is printed once that JS expression is truthy and the page's images have
+        loaded, instead of after the network has been idle for a while.
+        """
+        pdf_bytes, _ = await self.render_pdf(html_content, pdf_options, ready_function, ready_timeout)
+        return pdf_bytes
+
+    async def render_pdf(
+        self,
+        html_content: str,
+        pdf_options: dict[str, Any] = None,
+        ready_function: str | None = None,
+        ready_timeout: float = READY_TIMEOUT_MS,
+        complete_function: str | None = None,
+    ) -> tuple[bytes, bool]:
+        """
+        Like generate_pdf, but also reports whether the page rendered completely: the ready signal fired and
+        complete_function (a JS expression evaluated once the page has loaded), if given, is truthy.
         """
 
         async def _task(page, html, options):
-            await page.set_content(html, wait_until="networkidle")
-            return await page.pdf(**(options or {}))
+            complete = await _load_content(page, html, ready_function, ready_timeout)
+            if ready_function:
+                # Images aren't covered by the ready signal; "load" fires as soon as they are in
+                await page.wait_for_load_state("load")
+            if complete and complete_function:
+                complete = bool(await page.evaluate(complete_function))
+            return await page.pdf(**(options or {})), complete
 
-        return await self._submit(_task, None, html_content, pdf_options)
+        # Paper HTML is self-contained (escaped text, inlined KaTeX), so PDFs can share warm pages too and
+        # skip creating a browser context per download
+        return await self._submit(_task, None, html_content, pdf_options, pooled=True)
 
     async def take_screenshot(
         self,
@@ -116,21 +243,30 @@ class BrowserService:
         selector: str = "body",
         screenshot_options: dict[str, Any] = None,
         context_options: dict[str, Any] = None,
+        ready_function: str | None = None,
+        ready_timeout: float = READY_TIMEOUT_MS,
     ) -> bytes:
         """
         Take a screenshot of a specific element from HTML content.
+
+        With ready_function, the page is captured as soon as that JS expression is truthy instead of after
+        the network has been idle for a while. If it never becomes truthy, the page is captured anyway.
         """
 
         async def _task(page, html, sel, options):
-            await page.set_content(html, wait_until="networkidle")
-            element = await page.query_selector(sel)
-            if not element:
+            await _load_content(page, html, ready_function, ready_timeout)
+            # One evaluate for the box plus a clipped page screenshot costs fewer round trips than
+            # query_selector + element.screenshot, which re-measures and scrolls the element itself
+            box = await page.evaluate(_BOUNDING_BOX_JS, sel)
+            if not box:
                 logger.warning(f"Selector '{sel}' not found, falling back to body")
-                element = await page.query_selector("body")
+                box = await page.evaluate(_BOUNDING_BOX_JS, "body")
 
-            return await element.screenshot(**(options or {}))
+            # full_page so the clip may extend below the viewport for tall content
+            return await page.screenshot(clip=box, full_page=True, **(options or {}))
 
-        return await self._submit(_task, context_options, html_content, selector, screenshot_options)
+        # Screenshots only render self-contained HTML, so they can safely share warm pages
+        return await self._submit(_task, context_options, html_content, selector, screenshot_options, pooled=True)
 
     # We need to handle context options (like viewport, scale factor)
     # Let's enhance _submit to accept context_options
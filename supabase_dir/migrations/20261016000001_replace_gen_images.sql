@@ -0,0 +1,11 @@
+-- Replaces all gen_images of a question in one round trip and one transaction.
+-- Used by api/v1/qgen/gen_images_service.py; without it the service falls back to a delete and a bulk insert.
+create or replace function replace_gen_images(p_question_id uuid, p_rows jsonb)
+returns void
+language sql
+as $$
+    delete from gen_images where gen_question_id = p_question_id;
+    insert into gen_images (gen_question_id, svg_string, position)
+    select p_question_id, row ->> 'svg_string', (row ->> 'position')::int
+    from jsonb_array_elements(p_rows) as row;
+$$;
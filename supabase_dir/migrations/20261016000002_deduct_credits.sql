@@ -0,0 +1,9 @@
+-- Floors and writes a user's new credit balance in one statement, so concurrent deductions cannot overwrite
+-- each other. Returns the new balance, or null if the user doesn't exist.
+-- Used by api/v1/qgen/credits.py; without it deductions fall back to a read followed by an update.
+create or replace function deduct_credits(uid uuid, n int)
+returns int
+language sql
+as $$
+    update users set credits = greatest(0, credits - n) where id = uid returning credits;
+$$;
@@ -0,0 +1,33 @@
+-- Returns a draft with everything printed with it (sections, instructions, questions in the draft and their
+-- images) in one round trip. Used by api/v1/qgen/utils/paper_utils.py; without it the paper data is read with
+-- one select per table.
+create or replace function get_paper_bundle(p_draft_id uuid)
+returns jsonb
+language sql
+stable
+as $$
+    with sections as (
+        select * from qgen_draft_sections where qgen_draft_id = p_draft_id
+    ), questions as (
+        select q.* from gen_questions q
+        join sections s on s.id = q.qgen_draft_section_id
+        where q.is_in_draft
+    )
+    select jsonb_build_object(
+        'draft', (select to_jsonb(d) from qgen_drafts d where d.id = p_draft_id),
+        'sections', coalesce(
+            (select jsonb_agg(to_jsonb(s) order by s.position_in_draft) from sections s), '[]'::jsonb
+        ),
+        'instructions', coalesce(
+            (select jsonb_agg(to_jsonb(i) order by i.created_at desc)
+             from qgen_draft_instructions_drafts_maps i where i.qgen_draft_id = p_draft_id),
+            '[]'::jsonb
+        ),
+        'questions', coalesce((select jsonb_agg(to_jsonb(q)) from questions q), '[]'::jsonb),
+        'images', coalesce(
+            (select jsonb_agg(to_jsonb(g) order by g.position)
+             from gen_images g join questions q on q.id = g.gen_question_id),
+            '[]'::jsonb
+        )
+    );
+$$;
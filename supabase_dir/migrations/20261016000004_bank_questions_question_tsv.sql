@@ -0,0 +1,9 @@
+-- Full-text search column for bank question listings. Word matches served by the GIN index replace the
+-- substring ILIKE scan over question_text. 'simple' skips stemming and stop words, so mixed-language and
+-- LaTeX-heavy text is indexed as written.
+-- Used by api/v1/bank/router.py when BANK_SEARCH_FTS is on. Adding a stored generated column rewrites the table.
+alter table bank_questions
+    add column if not exists question_tsv tsvector
+    generated always as (to_tsvector('simple', coalesce(question_text, ''))) stored;
+
+create index if not exists bank_questions_question_tsv_idx on bank_questions using gin (question_tsv);
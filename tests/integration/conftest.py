@@ -17,7 +17,7 @@ from unittest.mock import patch
 import pytest
 from dotenv import load_dotenv
 from fastapi.testclient import TestClient
-from supabase import Client, create_client
+from supabase import AsyncClient, Client, acreate_client, create_client
 
 from api.v1.qgen.models import MCQ4, FillInTheBlank, ShortAnswer, TrueFalse
 from app import create_app
@@ -245,17 +245,13 @@ def mock_gemini_client(use_live_gemini):
         # Use real Gemini API
         yield
     else:
-        # Patch genai.Client in all modules that use it
-        with (
-            patch("api.v1.qgen.generate_questions.routes.genai.Client", MockGeminiClient),
-            patch("api.v1.qgen.auto_correct.service.genai.Client", MockGeminiClient),
-            patch("api.v1.qgen.regenerate_question.genai.Client", MockGeminiClient),
-            patch("api.v1.qgen.regenerate_with_prompt.routes.genai.Client", MockGeminiClient),
-            patch("api.v1.qgen.get_feedback.genai.Client", MockGeminiClient),
-            patch("api.v1.qgen.edit_svg.service.genai.Client", MockGeminiClient),
-            patch("api.v1.bank.router.genai.Client", MockGeminiClient),
-        ):
+        from api.v1.qgen.utils.gemini_client import get_gemini_client
+
+        # Every module gets its client from the shared factory, so patching it covers them all
+        get_gemini_client.cache_clear()
+        with patch("api.v1.qgen.utils.gemini_client.genai.Client", MockGeminiClient):
             yield
+        get_gemini_client.cache_clear()
 
 
 # ============================================================================
@@ -403,14 +399,14 @@ def auth_session(env: dict[str, str], service_supabase_client: Client) -> dict[s
 
 
 @pytest.fixture(scope="session")
-def app(service_supabase_client: Client):
+def app(env: dict[str, str], service_supabase_client: Client):
     """
     Create the FastAPI application instance with test Supabase client.
 
     Overrides get_supabase_client to use the same Supabase instance that
     the tests authenticate against, ensuring JWT validation succeeds.
     """
-    from api.v1.auth import get_supabase_client
+    from api.v1.auth import get_async_supabase_client, get_supabase_client
 
     # Clear any cached client that may point to a different Supabase instance
     get_supabase_client.cache_clear()
@@ -420,6 +416,16 @@ def app(service_supabase_client: Client):
     # Override the get_supabase_client dependency to return our test client
     app_instance.dependency_overrides[get_supabase_client] = lambda: service_supabase_client
 
+    # The async client is created lazily on the TestClient's event loop and then reused
+    async_service_clients: list[AsyncClient] = []
+
+    async def get_async_service_client() -> AsyncClient:
+        if not async_service_clients:
+            async_service_clients.append(await acreate_client(env["SUPABASE_URL"], env["SUPABASE_SERVICE_KEY"]))
+        return async_service_clients[0]
+
+    app_instance.dependency_overrides[get_async_supabase_client] = get_async_service_client
+
     # Also patch the function directly since require_supabase_user calls it directly
     with patch("api.v1.auth.get_supabase_client", return_value=service_supabase_client):
         yield app_instance
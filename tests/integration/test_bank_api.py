@@ -12,6 +12,8 @@ import pytest
 from fastapi.testclient import TestClient
 from supabase import Client
 
+from api.v1.bank.dependencies import _role_cache
+
 # ============================================================================
 # FIXTURES FOR ADMIN ACCESS
 # ============================================================================
@@ -60,6 +62,7 @@ def admin_auth_session(env: dict[str, str], service_supabase_client: Client):
             "credits": 10000,  # Give admin user credits for testing
         }
     ).execute()
+    _role_cache.clear()
 
     yield {
         "access_token": token,
@@ -68,6 +71,7 @@ def admin_auth_session(env: dict[str, str], service_supabase_client: Client):
 
     # Cleanup: reset user type to non-admin
     service_supabase_client.table("users").update({"user_type": "private_user"}).eq("id", user_id).execute()
+    _role_cache.clear()
 
 
 @pytest.fixture
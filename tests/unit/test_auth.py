@@ -0,0 +1,314 @@
+"""
+Unit tests for auth.py using pytest.
+
+Tests the verified-user cache and local JWKS verification in require_supabase_user.
+"""
+
+import asyncio
+import time
+import uuid
+from unittest.mock import MagicMock, patch
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+
+from api.v1 import auth
+from api.v1.auth import SupabaseUser, _extract_bearer_token, require_supabase_user
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    """Ensure every test starts with an empty verified-user cache."""
+    auth._user_cache.clear()
+    yield
+    auth._user_cache.clear()
+
+
+@pytest.fixture
+def make_token():
+    """Build an HS256 token with the given expiry offset (seconds from now)."""
+
+    def _make(exp_in: float = 3600) -> str:
+        claims = {"sub": str(uuid.uuid4()), "exp": int(time.time() + exp_in)}
+        return jwt.encode(claims, "test-secret", algorithm="HS256")
+
+    return _make
+
+
+@pytest.fixture
+def mock_supabase_client():
+    """Create a mock Supabase client whose get_user returns a user."""
+    client = MagicMock()
+    client.auth.get_user.return_value = MagicMock(user=MagicMock(id=str(uuid.uuid4())))
+    return client
+
+
+# ============================================================================
+# BEARER TOKEN EXTRACTION TESTS
+# ============================================================================
+
+
+class TestExtractBearerToken:
+    """Tests for _extract_bearer_token function."""
+
+    @pytest.mark.parametrize(
+        ("header", "expected"),
+        [
+            ("Bearer abc.def.ghi", "abc.def.ghi"),
+            ("bearer abc.def.ghi", "abc.def.ghi"),
+            ("  BEARER   abc.def.ghi  ", "abc.def.ghi"),
+            ("abc.def.ghi", "abc.def.ghi"),
+            ("   ", None),
+            ("", None),
+            (None, None),
+        ],
+    )
+    def test_extracts_token(self, header, expected):
+        """Scheme is case-insensitive and surrounding whitespace is ignored."""
+        assert _extract_bearer_token(header) == expected
+
+
+# ============================================================================
+# USER CACHE TESTS
+# ============================================================================
+
+
+class TestRequireSupabaseUserCache:
+    """Tests for the verified-user cache in require_supabase_user."""
+
+    def test_cache_disabled_by_default(self, make_token, mock_supabase_client):
+        """Every call should hit Supabase when the TTL is 0."""
+        token = make_token()
+
+        with (
+            patch.object(auth, "SUPABASE_JWT_CACHE_TTL", 0),
+            patch.object(auth, "get_supabase_client", return_value=mock_supabase_client),
+        ):
+            require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+            require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+
+        assert mock_supabase_client.auth.get_user.call_count == 2
+
+    def test_cache_hit_skips_supabase(self, make_token, mock_supabase_client):
+        """A second call with the same token should be served from the cache."""
+        token = make_token()
+
+        with (
+            patch.object(auth, "SUPABASE_JWT_CACHE_TTL", 10),
+            patch.object(auth, "get_supabase_client", return_value=mock_supabase_client),
+        ):
+            first = require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+            request = MagicMock()
+            second = require_supabase_user(request, authorization=f"Bearer {token}")
+
+        assert mock_supabase_client.auth.get_user.call_count == 1
+        assert second is first
+        assert request.state.supabase_user is first
+
+    def test_cache_key_is_token_hash(self, make_token, mock_supabase_client):
+        """The raw token must never be used as a cache key."""
+        token = make_token()
+
+        with (
+            patch.object(auth, "SUPABASE_JWT_CACHE_TTL", 10),
+            patch.object(auth, "get_supabase_client", return_value=mock_supabase_client),
+        ):
+            require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+
+        assert token not in auth._user_cache
+        assert auth._token_cache_key(token) in auth._user_cache
+
+    def test_expired_token_not_cached(self, make_token, mock_supabase_client):
+        """Tokens past their exp claim should never be cached."""
+        token = make_token(exp_in=-5)
+
+        with (
+            patch.object(auth, "SUPABASE_JWT_CACHE_TTL", 10),
+            patch.object(auth, "get_supabase_client", return_value=mock_supabase_client),
+        ):
+            require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+            require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+
+        assert mock_supabase_client.auth.get_user.call_count == 2
+
+    def test_failed_verification_not_cached(self, make_token, mock_supabase_client):
+        """Rejected tokens should raise 401 and leave the cache empty."""
+        token = make_token()
+        mock_supabase_client.auth.get_user.side_effect = Exception("invalid JWT")
+
+        with (
+            patch.object(auth, "SUPABASE_JWT_CACHE_TTL", 10),
+            patch.object(auth, "get_supabase_client", return_value=mock_supabase_client),
+        ):
+            with pytest.raises(HTTPException) as exc_info:
+                require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+
+        assert exc_info.value.status_code == 401
+        assert len(auth._user_cache) == 0
+
+
+# ============================================================================
+# LOCAL JWKS VERIFICATION TESTS
+# ============================================================================
+
+
+@pytest.fixture
+def rsa_key():
+    """Generate an RSA key pair standing in for the project's JWKS signing key."""
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture
+def mock_jwks_client(rsa_key):
+    """Create a mock PyJWKClient that resolves every token to the test public key."""
+    client = MagicMock()
+    client.get_signing_key_from_jwt.return_value = MagicMock(key=rsa_key.public_key())
+    return client
+
+
+def _rs256_token(private_key, **overrides) -> str:
+    claims = {
+        "sub": str(uuid.uuid4()),
+        "email": "teacher@example.com",
+        "aud": "authenticated",
+        "role": "authenticated",
+        "exp": int(time.time() + 3600),
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, private_key, algorithm="RS256")
+
+
+class TestLocalJwtVerification:
+    """Tests for JWKS-based verification in require_supabase_user."""
+
+    def test_rs256_token_verified_without_supabase(self, rsa_key, mock_jwks_client, mock_supabase_client):
+        """Asymmetric tokens should be verified locally and never hit Supabase Auth."""
+        token = _rs256_token(rsa_key)
+        request = MagicMock()
+
+        with (
+            patch.object(auth, "SUPABASE_URL", "http://supabase.test"),
+            patch.object(auth, "_get_jwks_client", return_value=mock_jwks_client),
+            patch.object(auth, "get_supabase_client", return_value=mock_supabase_client),
+        ):
+            user = require_supabase_user(request, authorization=f"Bearer {token}")
+
+        assert isinstance(user, SupabaseUser)
+        assert user.id == jwt.decode(token, options={"verify_signature": False})["sub"]
+        assert user.email == "teacher@example.com"
+        assert request.state.supabase_user is user
+        mock_supabase_client.auth.get_user.assert_not_called()
+
+    def test_locally_verified_user_cached_until_exp(self, rsa_key, mock_jwks_client):
+        """Locally verified users should be cached without re-reading the token."""
+        exp = int(time.time() + 3)
+        token = _rs256_token(rsa_key, exp=exp)
+
+        with (
+            patch.object(auth, "SUPABASE_URL", "http://supabase.test"),
+            patch.object(auth, "SUPABASE_JWT_CACHE_TTL", 60),
+            patch.object(auth, "_get_jwks_client", return_value=mock_jwks_client),
+        ):
+            user = require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+            cached = require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+
+        assert cached is user
+        assert user.exp == exp
+        assert auth._user_cache[auth._token_cache_key(token)] == (user, exp)
+        assert mock_jwks_client.get_signing_key_from_jwt.call_count == 1
+
+    def test_expired_rs256_token_rejected(self, rsa_key, mock_jwks_client, mock_supabase_client):
+        """Expired asymmetric tokens should be rejected locally with 401."""
+        token = _rs256_token(rsa_key, exp=int(time.time() - 60))
+
+        with (
+            patch.object(auth, "SUPABASE_URL", "http://supabase.test"),
+            patch.object(auth, "_get_jwks_client", return_value=mock_jwks_client),
+            patch.object(auth, "get_supabase_client", return_value=mock_supabase_client),
+        ):
+            with pytest.raises(HTTPException) as exc_info:
+                require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+
+        assert exc_info.value.status_code == 401
+        mock_supabase_client.auth.get_user.assert_not_called()
+
+    def test_hs256_token_falls_back_to_supabase(self, make_token, mock_jwks_client, mock_supabase_client):
+        """Symmetric tokens cannot be checked against the JWKS and go to Supabase Auth."""
+        token = make_token()
+
+        with (
+            patch.object(auth, "SUPABASE_URL", "http://supabase.test"),
+            patch.object(auth, "_get_jwks_client", return_value=mock_jwks_client),
+            patch.object(auth, "get_supabase_client", return_value=mock_supabase_client),
+        ):
+            require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+
+        mock_jwks_client.get_signing_key_from_jwt.assert_not_called()
+        mock_supabase_client.auth.get_user.assert_called_once_with(token)
+
+    def test_jwks_unavailable_falls_back_to_supabase(self, rsa_key, mock_jwks_client, mock_supabase_client):
+        """JWKS fetch errors should degrade to Supabase Auth instead of failing the request."""
+        token = _rs256_token(rsa_key)
+        mock_jwks_client.get_signing_key_from_jwt.side_effect = jwt.PyJWKClientConnectionError("unreachable")
+
+        with (
+            patch.object(auth, "SUPABASE_URL", "http://supabase.test"),
+            patch.object(auth, "_get_jwks_client", return_value=mock_jwks_client),
+            patch.object(auth, "get_supabase_client", return_value=mock_supabase_client),
+        ):
+            require_supabase_user(MagicMock(), authorization=f"Bearer {token}")
+
+        mock_supabase_client.auth.get_user.assert_called_once_with(token)
+
+
+# ============================================================================
+# SUPABASE CLIENT TESTS
+# ============================================================================
+
+
+class TestSupabaseClients:
+    """Tests for the cached Supabase clients and their shared connection pool."""
+
+    def test_sync_client_cached_with_pooled_http_client(self):
+        """The sync client should be built once, with a pooled httpx client."""
+        auth.get_supabase_client.cache_clear()
+        try:
+            with (
+                patch.object(auth, "SUPABASE_URL", "https://example.supabase.co"),
+                patch.object(auth, "SUPABASE_SERVICE_KEY", "service-key"),
+                patch.object(auth, "create_client") as mock_create,
+            ):
+                first = auth.get_supabase_client()
+                second = auth.get_supabase_client()
+
+            assert first is second
+            mock_create.assert_called_once()
+            assert isinstance(mock_create.call_args.kwargs["options"].httpx_client, httpx.Client)
+        finally:
+            auth.get_supabase_client.cache_clear()
+
+    @pytest.mark.asyncio
+    async def test_async_client_built_once_under_concurrency(self):
+        """Concurrent first calls should share one async client."""
+
+        async def _create(*_args, **_kwargs):
+            await asyncio.sleep(0)
+            return MagicMock()
+
+        with (
+            patch.object(auth, "_async_supabase_client", None),
+            patch.object(auth, "SUPABASE_URL", "https://example.supabase.co"),
+            patch.object(auth, "SUPABASE_SERVICE_KEY", "service-key"),
+            patch.object(auth, "acreate_client", side_effect=_create) as mock_create,
+        ):
+            clients = await asyncio.gather(*(auth.get_async_supabase_client() for _ in range(5)))
+
+        assert all(client is clients[0] for client in clients)
+        mock_create.assert_called_once()
@@ -2,20 +2,36 @@
 Unit tests for auto-correct service logic.
 
 These tests validate the new refactored architecture in `api.v1.qgen.auto_correct.service`:
-    1. process_question() - Single Gemini call via AutoCorrectService
-    2. process_and_validate() - Calls process_question + validates response
-    3. correct_question() - Integration flow (mocked)
+    1. process_and_validate() - Single Gemini call + validates response
+    2. correct_question() - Integration flow (mocked)
 """
 
+import asyncio
 from unittest.mock import AsyncMock, MagicMock, patch
 
+import orjson
 import pytest
+from google.genai import errors as genai_errors
+from google.genai import types
 
 from api.v1.qgen.auto_correct.service import (
     AutoCorrectService,
+    QuestionProcessingError,
+    QuestionValidationError,
     generate_screenshot,
 )
-from api.v1.qgen.models import MCQ4
+from api.v1.qgen.models import (
+    MCQ4,
+    AutoCorrectedQuestion,
+    AutoCorrectedQuestionList,
+    KeyedAutoCorrectedQuestion,
+    MatchTheFollowing,
+)
+from api.v1.qgen.prompts import AUTO_CORRECT_SYSTEM_INSTRUCTION
+from api.v1.qgen.utils.gemini_cache import SystemInstructionCache
+from api.v1.qgen.utils.gemini_limiter import GeminiLimiter
+from api.v1.qgen.utils.katex_assets import KATEX_HEAD_HTML
+from api.v1.qgen.utils.screenshot_utils import save_image_for_debug, save_image_for_debug_in_background
 
 # ============================================================================
 # FIXTURES
@@ -40,6 +56,22 @@ def mock_mcq4_question() -> dict:
     }
 
 
+@pytest.fixture(autouse=True)
+def fresh_gemini_limiter():
+    """Give every test its own limiter so a 429 in one test can't pause the next."""
+    limiter = GeminiLimiter()
+    with patch("api.v1.qgen.auto_correct.service.gemini_limiter", limiter):
+        yield limiter
+
+
+@pytest.fixture(autouse=True)
+def inline_system_instruction():
+    """Send the instructions inline by default; context cache tests install their own cache."""
+    cache = SystemInstructionCache(AUTO_CORRECT_SYSTEM_INSTRUCTION, ttl_seconds=0)
+    with patch("api.v1.qgen.auto_correct.service._system_instruction_cache", cache):
+        yield cache
+
+
 @pytest.fixture
 def mock_browser_service():
     service = AsyncMock()
@@ -60,14 +92,14 @@ def mock_browser_service():
 
         # Mock successful response
         mock_response = MagicMock()
-        # Mock the parsed response structure: response.parsed.question -> MCQ4 object
+        # Mock the raw JSON text matching the response schema
         mock_mcq = MCQ4(**mock_mcq4_question)
         mock_mcq.question_text = "Corrected Text"  # Change something to verify
 
-        mock_response.parsed.question = mock_mcq
+        mock_response.text = AutoCorrectedQuestion(question=mock_mcq).model_dump_json(exclude_none=True)
         mock_gemini.aio.models.generate_content.return_value = mock_response
 
-        with patch("api.v1.qgen.auto_correct.service.genai.Client", return_value=mock_gemini):
+        with patch("api.v1.qgen.auto_correct.service.get_gemini_client", return_value=mock_gemini):
             success = await AutoCorrectService.correct_question(
                 gen_question_data=mock_mcq4_question,
                 gen_question_id=mock_mcq4_question["id"],
@@ -106,9 +138,445 @@ class TestGenerateScreenshot:
         # Basic HTML validation
         assert "<!DOCTYPE html>" in html_content
         assert mock_mcq4_question["question_text"] in html_content
-        assert "katex.min.css" in html_content
+        assert KATEX_HEAD_HTML in html_content
 
         # Verify options
         assert kwargs.get("selector") == "body"
-        assert kwargs.get("screenshot_options") == {"type": "png"}
+        assert kwargs.get("screenshot_options") == {"type": "jpeg", "quality": 85}
         assert kwargs.get("context_options") == {"device_scale_factor": 2}
+        assert kwargs.get("ready_function") == "window.__katexDone === true"
+        assert "window.__katexDone = true" in html_content
+
+
+class TestSaveImageForDebug:
+    @pytest.mark.asyncio
+    async def test_background_save_skipped_when_disabled(self):
+        """
+        Test that no task is even scheduled when LOG_IMAGES is off.
+        """
+        with (
+            patch("api.v1.qgen.utils.screenshot_utils.LOG_IMAGES", False),
+            patch("api.v1.qgen.utils.screenshot_utils.asyncio.create_task") as mock_create_task,
+        ):
+            save_image_for_debug_in_background(b"png", "q1")
+
+        mock_create_task.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_save_writes_file_when_enabled(self, tmp_path):
+        """
+        Test that the debug image is written under IMAGES_LOG_DIR when LOG_IMAGES is on.
+        """
+        with (
+            patch("api.v1.qgen.utils.screenshot_utils.LOG_IMAGES", True),
+            patch("api.v1.qgen.utils.screenshot_utils.IMAGES_LOG_DIR", tmp_path),
+        ):
+            path = await save_image_for_debug(b"png-bytes", "q1", "image/png")
+
+        assert path.startswith(str(tmp_path))
+        assert path.endswith(".png")
+        assert open(path, "rb").read() == b"png-bytes"
+
+
+class TestCorrectQuestionSvgs:
+    @pytest.mark.asyncio
+    async def test_svgs_replaced_in_single_call(self, mock_mcq4_question: dict, mock_browser_service):
+        """
+        Test that all corrected SVGs are persisted with one replace_gen_images call.
+        """
+        corrected = MCQ4(**mock_mcq4_question, svgs=[{"svg": "<svg>1</svg>"}, {"svg": "<svg>2</svg>"}])
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            return_value=MagicMock(text=AutoCorrectedQuestion(question=corrected).model_dump_json(exclude_none=True))
+        )
+        mock_supabase = MagicMock()
+
+        with (
+            patch("api.v1.qgen.auto_correct.service.get_gemini_client", return_value=mock_gemini),
+            patch("api.v1.qgen.auto_correct.service.create_new_version_on_update"),
+        ):
+            success = await AutoCorrectService.correct_question(
+                gen_question_data=mock_mcq4_question,
+                gen_question_id=mock_mcq4_question["id"],
+                supabase_client=mock_supabase,
+                browser_service=mock_browser_service,
+            )
+
+        assert success is True
+        mock_supabase.rpc.assert_called_once()
+        assert mock_supabase.rpc.call_args.args[0] == "replace_gen_images"
+        rows = mock_supabase.rpc.call_args.args[1]["p_rows"]
+        assert [(row["svg_string"], row["position"]) for row in rows] == [("<svg>1</svg>", 1), ("<svg>2</svg>", 2)]
+
+
+class TestCorrectQuestionUpdatePayload:
+    @pytest.mark.asyncio
+    async def test_match_the_following_payload_is_json_native(self, mock_mcq4_question: dict, mock_browser_service):
+        """
+        Test that the gen_questions update maps columns and holds only JSON-native values.
+        """
+        corrected = MatchTheFollowing(
+            question_text="Match",
+            columns=[{"name": "A", "items": ["1", "2"]}, {"name": "B", "items": ["x", "y"]}],
+            svgs=[{"svg": "<svg/>"}],
+        )
+        mock_supabase = MagicMock()
+
+        with (
+            patch("api.v1.qgen.auto_correct.service.get_gemini_client"),
+            patch.object(AutoCorrectService, "correct_with_retries", new_callable=AsyncMock, return_value=corrected),
+            patch("api.v1.qgen.auto_correct.service.create_new_version_on_update"),
+        ):
+            await AutoCorrectService.correct_question(
+                gen_question_data=mock_mcq4_question,
+                gen_question_id=mock_mcq4_question["id"],
+                supabase_client=mock_supabase,
+                browser_service=mock_browser_service,
+            )
+
+        update_data = mock_supabase.table.return_value.update.call_args.args[0]
+        assert update_data == {
+            "question_text": "Match",
+            "match_the_following_columns": {"A": ["1", "2"], "B": ["x", "y"]},
+        }
+        assert orjson.loads(orjson.dumps(update_data)) == update_data
+
+
+class TestCorrectQuestionRetries:
+    @pytest.mark.asyncio
+    async def test_validation_error_fails_fast(self, mock_mcq4_question: dict, mock_browser_service):
+        """
+        Test that an invalid Gemini response is not retried.
+        """
+        invalid = MCQ4(**{**mock_mcq4_question, "question_text": ""})
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            return_value=MagicMock(text=AutoCorrectedQuestion(question=invalid).model_dump_json(exclude_none=True))
+        )
+
+        with (
+            patch("api.v1.qgen.auto_correct.service.get_gemini_client", return_value=mock_gemini),
+            patch("api.v1.qgen.auto_correct.service.asyncio.sleep", new_callable=AsyncMock) as mock_sleep,
+        ):
+            with pytest.raises(QuestionProcessingError):
+                await AutoCorrectService.correct_question(
+                    gen_question_data=mock_mcq4_question,
+                    gen_question_id=mock_mcq4_question["id"],
+                    supabase_client=MagicMock(),
+                    browser_service=mock_browser_service,
+                )
+
+        assert mock_gemini.aio.models.generate_content.call_count == 1
+        mock_sleep.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_rate_limit_retried_with_backoff(
+        self, mock_mcq4_question: dict, mock_browser_service, fresh_gemini_limiter
+    ):
+        """
+        Test that a 429 from Gemini is retried after a backoff sleep and opens the limiter's retry window.
+        """
+        retry_info = {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "0s"}
+        rate_limited = genai_errors.ClientError(
+            429, {"error": {"message": "quota", "status": "RESOURCE_EXHAUSTED", "details": [retry_info]}}
+        )
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            side_effect=[
+                rate_limited,
+                MagicMock(
+                    text=AutoCorrectedQuestion(question=MCQ4(**mock_mcq4_question)).model_dump_json(exclude_none=True)
+                ),
+            ]
+        )
+        uploaded = MagicMock(uri="https://files.example/screenshot", mime_type="image/png")
+        uploaded.name = "files/screenshot"
+        mock_gemini.aio.files.upload = AsyncMock(return_value=uploaded)
+        mock_gemini.aio.files.delete = AsyncMock()
+
+        with (
+            patch("api.v1.qgen.auto_correct.service.get_gemini_client", return_value=mock_gemini),
+            patch("api.v1.qgen.auto_correct.service.create_new_version_on_update"),
+            patch("api.v1.qgen.auto_correct.service.asyncio.sleep", new_callable=AsyncMock) as mock_sleep,
+        ):
+            success = await AutoCorrectService.correct_question(
+                gen_question_data=mock_mcq4_question,
+                gen_question_id=mock_mcq4_question["id"],
+                supabase_client=MagicMock(),
+                browser_service=mock_browser_service,
+            )
+
+        assert success is True
+        assert mock_gemini.aio.models.generate_content.call_count == 2
+        mock_sleep.assert_awaited_once()
+        assert fresh_gemini_limiter.retry_after_until > 0
+
+        # First attempt sends the image inline, the retry references the uploaded file
+        first_image, retry_image = (
+            call.kwargs["contents"][0] for call in mock_gemini.aio.models.generate_content.call_args_list
+        )
+        assert first_image.inline_data is not None
+        assert retry_image.file_data.file_uri == "https://files.example/screenshot"
+        mock_gemini.aio.files.upload.assert_awaited_once()
+        mock_gemini.aio.files.delete.assert_awaited_once_with(name="files/screenshot")
+
+    @pytest.mark.asyncio
+    async def test_db_failure_does_not_retry_gemini(self, mock_mcq4_question: dict, mock_browser_service):
+        """
+        Test that a failed write surfaces as an error without another Gemini call.
+        """
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            return_value=MagicMock(
+                text=AutoCorrectedQuestion(question=MCQ4(**mock_mcq4_question)).model_dump_json(exclude_none=True)
+            )
+        )
+        mock_supabase = MagicMock()
+        mock_supabase.table.return_value.update.return_value.eq.return_value.execute.side_effect = Exception("db down")
+
+        with (
+            patch("api.v1.qgen.auto_correct.service.get_gemini_client", return_value=mock_gemini),
+            patch("api.v1.qgen.auto_correct.service.create_new_version_on_update"),
+        ):
+            with pytest.raises(QuestionProcessingError):
+                await AutoCorrectService.correct_question(
+                    gen_question_data=mock_mcq4_question,
+                    gen_question_id=mock_mcq4_question["id"],
+                    supabase_client=mock_supabase,
+                    browser_service=mock_browser_service,
+                )
+
+        assert mock_gemini.aio.models.generate_content.call_count == 1
+
+
+class TestCorrectWithRetriesCoalescing:
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_corrections_share_one_call(self, mock_mcq4_question: dict):
+        """
+        Test that concurrent corrections of the same question and screenshot make a single Gemini call.
+        """
+        response_text = AutoCorrectedQuestion(question=MCQ4(**mock_mcq4_question)).model_dump_json(exclude_none=True)
+
+        async def slow_generate(**_):
+            await asyncio.sleep(0.01)
+            return MagicMock(text=response_text)
+
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(side_effect=slow_generate)
+
+        first, second = await asyncio.gather(
+            AutoCorrectService.correct_with_retries(mock_gemini, mock_mcq4_question, b"png"),
+            AutoCorrectService.correct_with_retries(mock_gemini, mock_mcq4_question, b"png"),
+        )
+
+        assert first is second
+        assert mock_gemini.aio.models.generate_content.call_count == 1
+
+        # Once finished, the next correction makes its own call
+        await AutoCorrectService.correct_with_retries(mock_gemini, mock_mcq4_question, b"png")
+        assert mock_gemini.aio.models.generate_content.call_count == 2
+
+
+class TestProcessAndValidateModels:
+    @pytest.mark.asyncio
+    async def test_text_only_falls_back_from_lite_model(self, mock_mcq4_question: dict):
+        """
+        Test that previews without a screenshot try flash-lite first and fall back to flash on invalid output.
+        """
+        invalid = MCQ4(**{**mock_mcq4_question, "question_text": ""})
+        valid = MCQ4(**mock_mcq4_question)
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            side_effect=[
+                MagicMock(text=AutoCorrectedQuestion(question=q).model_dump_json(exclude_none=True))
+                for q in (invalid, valid)
+            ]
+        )
+
+        corrected = await AutoCorrectService.process_and_validate(mock_gemini, mock_mcq4_question)
+
+        assert corrected == valid
+        models = [call.kwargs["model"] for call in mock_gemini.aio.models.generate_content.call_args_list]
+        assert models == ["gemini-2.5-flash-lite", "gemini-2.5-flash"]
+
+    @pytest.mark.asyncio
+    async def test_malformed_json_raises_validation_error(self, mock_mcq4_question: dict):
+        """
+        Test that unparseable or empty response text surfaces as QuestionValidationError.
+        """
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            side_effect=[MagicMock(text='{"question": '), MagicMock(text=None)]
+        )
+
+        with pytest.raises(QuestionValidationError):
+            await AutoCorrectService.process_and_validate(mock_gemini, mock_mcq4_question)
+
+        assert mock_gemini.aio.models.generate_content.call_count == 2
+
+
+class TestProcessAndValidateContextCache:
+    @pytest.fixture
+    def context_cache(self):
+        cache = SystemInstructionCache(AUTO_CORRECT_SYSTEM_INSTRUCTION, ttl_seconds=3600)
+        with patch("api.v1.qgen.auto_correct.service._system_instruction_cache", cache):
+            yield cache
+
+    @pytest.mark.asyncio
+    async def test_cached_instructions_referenced_by_name(self, mock_mcq4_question: dict, context_cache):
+        """
+        Test that calls reference the cached content instead of resending the system instruction.
+        """
+        mock_gemini = MagicMock()
+        mock_gemini.aio.caches.create = AsyncMock(return_value=types.CachedContent(name="cachedContents/1"))
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            return_value=MagicMock(
+                text=AutoCorrectedQuestion(question=MCQ4(**mock_mcq4_question)).model_dump_json(exclude_none=True)
+            )
+        )
+
+        await AutoCorrectService.process_and_validate(mock_gemini, mock_mcq4_question, image_part=MagicMock())
+        await AutoCorrectService.process_and_validate(mock_gemini, mock_mcq4_question, image_part=MagicMock())
+
+        mock_gemini.aio.caches.create.assert_awaited_once()
+        for call in mock_gemini.aio.models.generate_content.call_args_list:
+            assert call.kwargs["config"]["cached_content"] == "cachedContents/1"
+            assert "system_instruction" not in call.kwargs["config"]
+
+    @pytest.mark.asyncio
+    async def test_rejected_cache_falls_back_inline(self, mock_mcq4_question: dict, context_cache):
+        """
+        Test that an expired cache is dropped and the same call is resent with the inline instruction.
+        """
+        response = MagicMock(
+            text=AutoCorrectedQuestion(question=MCQ4(**mock_mcq4_question)).model_dump_json(exclude_none=True)
+        )
+        mock_gemini = MagicMock()
+        mock_gemini.aio.caches.create = AsyncMock(return_value=types.CachedContent(name="cachedContents/1"))
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            side_effect=[genai_errors.ClientError(404, {"error": {"message": "cache not found"}}), response]
+        )
+
+        corrected = await AutoCorrectService.process_and_validate(
+            mock_gemini, mock_mcq4_question, image_part=MagicMock()
+        )
+
+        assert corrected == MCQ4(**mock_mcq4_question)
+        retry_config = mock_gemini.aio.models.generate_content.call_args.kwargs["config"]
+        assert retry_config["system_instruction"] == AUTO_CORRECT_SYSTEM_INSTRUCTION
+        assert "cached_content" not in retry_config
+        assert context_cache._entries == {}
+
+
+class TestCorrectTextOnlyBatch:
+    @pytest.mark.asyncio
+    async def test_concurrent_previews_share_one_call(self, mock_mcq4_question: dict):
+        """
+        Test that concurrent text-only corrections are answered by a single batched Gemini call.
+        """
+        first = MCQ4(**{**mock_mcq4_question, "question_text": "First"})
+        second = MCQ4(**{**mock_mcq4_question, "question_text": "Second"})
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            return_value=MagicMock(
+                text=AutoCorrectedQuestionList(
+                    corrections=[
+                        KeyedAutoCorrectedQuestion(key="q1", question=first),
+                        KeyedAutoCorrectedQuestion(key="q2", question=second),
+                    ]
+                ).model_dump_json(exclude_none=True)
+            )
+        )
+
+        with patch("api.v1.qgen.auto_correct.service.get_gemini_client", return_value=mock_gemini):
+            results = await asyncio.gather(
+                AutoCorrectService.correct_text_only({**mock_mcq4_question, "question_text": "1"}),
+                AutoCorrectService.correct_text_only({**mock_mcq4_question, "question_text": "2"}),
+            )
+
+        assert results == [first, second]
+        mock_gemini.aio.models.generate_content.assert_awaited_once()
+        config = mock_gemini.aio.models.generate_content.call_args.kwargs["config"]
+        assert config["response_json_schema"]["title"] == "AutoCorrectedQuestionList"
+
+    @pytest.mark.asyncio
+    async def test_invalid_entries_corrected_individually(self, mock_mcq4_question: dict):
+        """
+        Test that a batched entry without question_text is retried on its own while valid ones are kept.
+        """
+        valid = MCQ4(**mock_mcq4_question)
+        invalid = MCQ4(**{**mock_mcq4_question, "question_text": ""})
+        batched = AutoCorrectedQuestionList(
+            corrections=[
+                KeyedAutoCorrectedQuestion(key="q1", question=valid),
+                KeyedAutoCorrectedQuestion(key="q2", question=invalid),
+            ]
+        )
+        single = AutoCorrectedQuestion(question=valid)
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            side_effect=[
+                MagicMock(text=batched.model_dump_json(exclude_none=True)),
+                MagicMock(text=single.model_dump_json(exclude_none=True)),
+            ]
+        )
+
+        with patch("api.v1.qgen.auto_correct.service.get_gemini_client", return_value=mock_gemini):
+            results = await AutoCorrectService._correct_text_only_batch([mock_mcq4_question, mock_mcq4_question])
+
+        assert results == [valid, valid]
+        assert mock_gemini.aio.models.generate_content.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_corrections_matched_by_key_not_position(self, mock_mcq4_question: dict):
+        """
+        Test that reordered corrections are returned to the caller whose question they echo the key of.
+        """
+        first = MCQ4(**{**mock_mcq4_question, "question_text": "First"})
+        second = MCQ4(**{**mock_mcq4_question, "question_text": "Second"})
+        batched = AutoCorrectedQuestionList(
+            corrections=[
+                KeyedAutoCorrectedQuestion(key="q2", question=second),
+                KeyedAutoCorrectedQuestion(key="q1", question=first),
+            ]
+        )
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            return_value=MagicMock(text=batched.model_dump_json(exclude_none=True))
+        )
+
+        with patch("api.v1.qgen.auto_correct.service.get_gemini_client", return_value=mock_gemini):
+            results = await AutoCorrectService._correct_text_only_batch([mock_mcq4_question, mock_mcq4_question])
+
+        assert results == [first, second]
+        mock_gemini.aio.models.generate_content.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_repeated_or_unknown_keys_corrected_individually(self, mock_mcq4_question: dict):
+        """
+        Test that corrections with a repeated or unknown key are discarded and their questions retried on their own.
+        """
+        valid = MCQ4(**mock_mcq4_question)
+        other = MCQ4(**{**mock_mcq4_question, "question_text": "Someone else's question"})
+        batched = AutoCorrectedQuestionList(
+            corrections=[
+                KeyedAutoCorrectedQuestion(key="q1", question=other),
+                KeyedAutoCorrectedQuestion(key="q1", question=valid),
+                KeyedAutoCorrectedQuestion(key="q9", question=other),
+            ]
+        )
+        single = AutoCorrectedQuestion(question=valid)
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            side_effect=[
+                MagicMock(text=batched.model_dump_json(exclude_none=True)),
+                MagicMock(text=single.model_dump_json(exclude_none=True)),
+                MagicMock(text=single.model_dump_json(exclude_none=True)),
+            ]
+        )
+
+        with patch("api.v1.qgen.auto_correct.service.get_gemini_client", return_value=mock_gemini):
+            results = await AutoCorrectService._correct_text_only_batch([mock_mcq4_question, mock_mcq4_question])
+
+        assert results == [valid, valid]
+        assert mock_gemini.aio.models.generate_content.await_count == 3
@@ -0,0 +1,88 @@
+"""
+Unit tests for bank/dependencies.py using pytest.
+
+Tests the admin check and its per-user role cache.
+"""
+
+import uuid
+from unittest.mock import MagicMock, patch
+
+import pytest
+from cachetools import TTLCache
+from fastapi import HTTPException
+
+from api.v1.bank import dependencies
+from api.v1.bank.dependencies import _role_cache, require_admin
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+
+@pytest.fixture(autouse=True)
+def clear_role_cache():
+    """Ensure every test starts with an empty role cache."""
+    _role_cache.clear()
+    yield
+    _role_cache.clear()
+
+
+@pytest.fixture
+def user():
+    """Create a mock authenticated user."""
+    return MagicMock(id=str(uuid.uuid4()))
+
+
+def _supabase_with_user_type(user_type: str) -> MagicMock:
+    client = MagicMock()
+    query = client.table.return_value.select.return_value.eq.return_value.single.return_value
+    query.execute.return_value = MagicMock(data={"user_type": user_type})
+    return client
+
+
+# ============================================================================
+# REQUIRE ADMIN TESTS
+# ============================================================================
+
+
+class TestRequireAdmin:
+    """Tests for require_admin dependency."""
+
+    def test_admin_allowed(self, user):
+        """Admins should pass through and get the user back."""
+        client = _supabase_with_user_type("skolist-admin")
+
+        assert require_admin(user=user, supabase_client=client) is user
+
+    def test_non_admin_forbidden(self, user):
+        """Non-admin users should get 403."""
+        client = _supabase_with_user_type("private_user")
+
+        with pytest.raises(HTTPException) as exc_info:
+            require_admin(user=user, supabase_client=client)
+
+        assert exc_info.value.status_code == 403
+
+    def test_role_cached_between_requests(self, user):
+        """A second request for the same user should not query the users table."""
+        client = _supabase_with_user_type("skolist-admin")
+
+        require_admin(user=user, supabase_client=client)
+        require_admin(user=user, supabase_client=client)
+
+        assert client.table.call_count == 1
+
+    def test_role_read_again_after_ttl(self, user):
+        """Once the cached role expires, the next request should re-read it, e.g. after a demotion."""
+        now = [0.0]
+        cache = TTLCache(maxsize=16, ttl=60, timer=lambda: now[0])
+        demoted_client = _supabase_with_user_type("private_user")
+
+        with patch.object(dependencies, "_role_cache", cache):
+            require_admin(user=user, supabase_client=_supabase_with_user_type("skolist-admin"))
+            now[0] = 61
+            with pytest.raises(HTTPException) as exc_info:
+                require_admin(user=user, supabase_client=demoted_client)
+
+        assert exc_info.value.status_code == 403
+        assert demoted_client.table.call_count == 1
@@ -0,0 +1,128 @@
+"""
+Unit tests for bank/router.py using pytest.
+
+Tests how bank listings build their search filters and which previews are cached.
+"""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from api.v1.bank import router as bank_router
+from api.v1.bank.router import (
+    BankFilter,
+    ListQuestionsRequest,
+    PreviewRequest,
+    RegeneratePreviewRequest,
+    list_bank_questions,
+    preview_auto_correct,
+    preview_regenerate,
+)
+from api.v1.qgen.models import MCQ4
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Ensure every test starts with empty total count and preview caches."""
+    bank_router._total_count_cache.clear()
+    bank_router._preview_cache.clear()
+    yield
+    bank_router._total_count_cache.clear()
+    bank_router._preview_cache.clear()
+
+
+@pytest.fixture
+def question() -> dict:
+    """A bank question in the Generations format."""
+    return {
+        "question_text": "What is 2 + 2?",
+        "question_type": "mcq4",
+        "option1": "3",
+        "option2": "4",
+        "option3": "5",
+        "option4": "6",
+        "correct_mcq_option": 2,
+    }
+
+
+def _supabase_with_query() -> tuple[MagicMock, MagicMock]:
+    """A client whose bank_questions query builder returns itself from every filter call."""
+    query = MagicMock()
+    for method in ("eq", "ilike", "filter", "in_", "range", "order"):
+        getattr(query, method).return_value = query
+    query.execute.return_value = MagicMock(data=[], count=0)
+    client = MagicMock()
+    client.table.return_value.select.return_value = query
+    return client, query
+
+
+# ============================================================================
+# LIST TESTS
+# ============================================================================
+
+
+class TestListBankQuestionsSearch:
+    """Tests for the search_query filter of list_bank_questions."""
+
+    async def test_full_text_search_when_enabled(self):
+        """With BANK_SEARCH_FTS on, the search should filter the indexed question_tsv column."""
+        client, query = _supabase_with_query()
+        request = ListQuestionsRequest(filters=BankFilter(search_query="newton laws"))
+
+        with patch("api.v1.bank.router.BANK_SEARCH_FTS", True):
+            await list_bank_questions(request, supabase=client)
+
+        query.filter.assert_called_once_with("question_tsv", "wfts(simple)", "newton laws")
+        query.ilike.assert_not_called()
+
+    async def test_substring_search_by_default(self):
+        """With BANK_SEARCH_FTS off, the search should keep the ILIKE substring match."""
+        client, query = _supabase_with_query()
+        request = ListQuestionsRequest(filters=BankFilter(search_query="newton"))
+
+        with patch("api.v1.bank.router.BANK_SEARCH_FTS", False):
+            await list_bank_questions(request, supabase=client)
+
+        query.ilike.assert_called_once_with("question_text", "%newton%")
+        query.filter.assert_not_called()
+
+
+# ============================================================================
+# PREVIEW TESTS
+# ============================================================================
+
+
+class TestPreviewCache:
+    """Tests for caching of the preview endpoints."""
+
+    async def test_auto_correct_preview_cached(self, question):
+        """A repeated auto-correct preview of an unchanged question should not call Gemini again."""
+        corrected = MCQ4(**{**question, "question_text": "What is 2 + 2 ?"})
+
+        with patch(
+            "api.v1.bank.router.AutoCorrectService.correct_text_only", new_callable=AsyncMock, return_value=corrected
+        ) as mock_correct:
+            first = await preview_auto_correct(PreviewRequest(question=question), supabase=MagicMock())
+            second = await preview_auto_correct(PreviewRequest(question=question), supabase=MagicMock())
+
+        mock_correct.assert_awaited_once()
+        assert first.new == second.new
+        assert first.new["question_text"] == "What is 2 + 2 ?"
+
+    async def test_regenerate_preview_not_cached(self, question):
+        """Regenerating again with the same prompt should produce a fresh version every time."""
+        versions = [MCQ4(**{**question, "question_text": text}) for text in ("First", "Second")]
+        request = RegeneratePreviewRequest(question=question, prompt="make it harder")
+
+        with patch(
+            "api.v1.bank.router.process_question_and_validate", new_callable=AsyncMock, side_effect=versions
+        ) as mock_regenerate:
+            first = await preview_regenerate(request, supabase=MagicMock(), gemini_client=MagicMock())
+            second = await preview_regenerate(request, supabase=MagicMock(), gemini_client=MagicMock())
+
+        assert mock_regenerate.await_count == 2
+        assert (first.new["question_text"], second.new["question_text"]) == ("First", "Second")
@@ -0,0 +1,212 @@
+"""
+Unit tests for services/browser_service.py using pytest.
+
+Tests the warm page pool, ready signal and clipping used for screenshots, with Playwright mocked out.
+"""
+
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+from services.browser_service import BrowserService
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+
+@pytest.fixture
+def mock_browser():
+    """Patch async_playwright so chromium.launch returns a mock browser with fresh contexts/pages."""
+    browser = AsyncMock()
+
+    def _new_context(**_):
+        page = AsyncMock()
+        page.evaluate = AsyncMock(return_value={"x": 0, "y": 0, "width": 640, "height": 300})
+        page.screenshot = AsyncMock(return_value=b"png")
+        context = AsyncMock()
+        context.new_page = AsyncMock(return_value=page)
+        return context
+
+    browser.new_context = AsyncMock(side_effect=_new_context)
+    playwright = AsyncMock()
+    playwright.chromium.launch = AsyncMock(return_value=browser)
+
+    with patch("services.browser_service.async_playwright") as mock_ap:
+        mock_ap.return_value.start = AsyncMock(return_value=playwright)
+        yield browser
+
+
+# ============================================================================
+# PAGE POOL TESTS
+# ============================================================================
+
+
+class TestBrowserServicePagePool:
+    """Tests for reusing warm pages across take_screenshot calls."""
+
+    @pytest.mark.asyncio
+    async def test_warm_pages_reused_for_screenshots(self, mock_browser):
+        """Screenshots with the warmed context options should never create a new context."""
+        service = BrowserService(pool_size=2)
+        await service.start(warm_context_options={"device_scale_factor": 2})
+        assert mock_browser.new_context.call_count == 2
+
+        for _ in range(5):
+            assert await service.take_screenshot("<p>q</p>", context_options={"device_scale_factor": 2}) == b"png"
+
+        assert mock_browser.new_context.call_count == 2
+        await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_failed_task_page_not_returned_to_pool(self, mock_browser):
+        """A page whose task raised should be closed instead of going back to the pool."""
+        service = BrowserService(pool_size=1)
+        await service.start(warm_context_options={})
+        context, page = service._page_pool({}).get_nowait()
+        page.set_content = AsyncMock(side_effect=RuntimeError("render failed"))
+        service._page_pool({}).put_nowait((context, page))
+
+        with pytest.raises(RuntimeError):
+            await service.take_screenshot("<p>q</p>", context_options={})
+
+        context.close.assert_awaited()
+        assert service._page_pool({}).empty()
+        await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_pdf_pages_reused(self, mock_browser):
+        """PDF generation should reuse a pooled page instead of creating a context per call."""
+        service = BrowserService(pool_size=1)
+        await service.start()
+
+        for _ in range(3):
+            await service.generate_pdf("<p>paper</p>")
+
+        assert mock_browser.new_context.call_count == 1
+        await service.stop()
+
+
+# ============================================================================
+# READY SIGNAL TESTS
+# ============================================================================
+
+
+class TestBrowserServiceReadyFunction:
+    """Tests for waiting on a JS ready signal instead of network idle."""
+
+    @pytest.mark.asyncio
+    async def test_ready_function_replaces_networkidle(self, mock_browser):
+        """A ready_function should load on domcontentloaded and wait for the expression."""
+        service = BrowserService(pool_size=1)
+        await service.start(warm_context_options={})
+        context, page = service._page_pool({}).get_nowait()
+        service._page_pool({}).put_nowait((context, page))
+
+        await service.take_screenshot("<p>q</p>", context_options={}, ready_function="window.ready")
+
+        page.set_content.assert_awaited_once_with("<p>q</p>", wait_until="domcontentloaded")
+        page.wait_for_function.assert_awaited_once_with("window.ready", timeout=5000)
+        await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_ready_timeout_still_takes_screenshot(self, mock_browser):
+        """A ready signal that never fires should not fail the screenshot."""
+        service = BrowserService(pool_size=1)
+        await service.start(warm_context_options={})
+        context, page = service._page_pool({}).get_nowait()
+        page.wait_for_function = AsyncMock(side_effect=PlaywrightTimeoutError("timed out"))
+        service._page_pool({}).put_nowait((context, page))
+
+        result = await service.take_screenshot("<p>q</p>", context_options={}, ready_function="window.ready")
+
+        assert result == b"png"
+        await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_pdf_ready_function_waits_for_signal_and_load(self, mock_browser):
+        """A PDF with a ready_function should wait for the signal and the load event, not network idle."""
+        service = BrowserService(pool_size=1)
+        await service.start()
+        pages = []
+
+        async def _new_page(*_):
+            context, page = await BrowserService._new_page(service, None)
+            pages.append(page)
+            return context, page
+
+        service._new_page = _new_page
+
+        await service.generate_pdf("<p>paper</p>", ready_function="window.ready")
+
+        page = pages[0]
+        page.set_content.assert_awaited_once_with("<p>paper</p>", wait_until="domcontentloaded")
+        page.wait_for_function.assert_awaited_once_with("window.ready", timeout=5000)
+        page.wait_for_load_state.assert_awaited_once_with("load")
+        page.pdf.assert_awaited_once()
+        await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_render_pdf_reports_incomplete_page(self, mock_browser):
+        """render_pdf should report a page whose ready signal timed out or whose complete check fails."""
+        service = BrowserService(pool_size=1)
+        await service.start(warm_context_options={})
+        context, page = service._page_pool({}).get_nowait()
+        page.evaluate = AsyncMock(return_value=False)
+        page.pdf = AsyncMock(return_value=b"pdf")
+        service._page_pool({}).put_nowait((context, page))
+
+        assert await service.render_pdf("<p>paper</p>", ready_function="window.ready") == (b"pdf", True)
+        assert await service.render_pdf(
+            "<p>paper</p>", ready_function="window.ready", complete_function="window.ok"
+        ) == (b"pdf", False)
+        page.evaluate.assert_awaited_once_with("window.ok")
+
+        page.wait_for_function = AsyncMock(side_effect=PlaywrightTimeoutError("timed out"))
+        assert await service.render_pdf("<p>paper</p>", ready_function="window.ready") == (b"pdf", False)
+        await service.stop()
+
+
+# ============================================================================
+# CLIP TESTS
+# ============================================================================
+
+
+class TestBrowserServiceClip:
+    """Tests for clipping screenshots to the selected element."""
+
+    @pytest.mark.asyncio
+    async def test_screenshot_clipped_to_selector_box(self, mock_browser):
+        """The page screenshot should be clipped to the element's bounding box."""
+        service = BrowserService(pool_size=1)
+        await service.start(warm_context_options={})
+        context, page = service._page_pool({}).get_nowait()
+        service._page_pool({}).put_nowait((context, page))
+
+        await service.take_screenshot(
+            "<p>q</p>", selector="#card", screenshot_options={"type": "jpeg"}, context_options={}
+        )
+
+        assert page.evaluate.call_args.args[1] == "#card"
+        page.screenshot.assert_awaited_once_with(
+            clip={"x": 0, "y": 0, "width": 640, "height": 300}, full_page=True, type="jpeg"
+        )
+        page.query_selector.assert_not_called()
+        await service.stop()
+
+    @pytest.mark.asyncio
+    async def test_missing_selector_falls_back_to_body(self, mock_browser):
+        """An unmatched selector should clip to the body instead."""
+        service = BrowserService(pool_size=1)
+        await service.start(warm_context_options={})
+        context, page = service._page_pool({}).get_nowait()
+        body_box = {"x": 0, "y": 0, "width": 640, "height": 120}
+        page.evaluate = AsyncMock(side_effect=[None, body_box])
+        service._page_pool({}).put_nowait((context, page))
+
+        await service.take_screenshot("<p>q</p>", selector="#missing", context_options={})
+
+        assert page.evaluate.call_args.args[1] == "body"
+        assert page.screenshot.call_args.kwargs["clip"] == body_box
+        await service.stop()
@@ -8,7 +8,9 @@ import uuid
 from unittest.mock import MagicMock, patch
 
 import pytest
+from postgrest.exceptions import APIError
 
+from api.v1.qgen import credits
 from api.v1.qgen.credits import check_user_has_credits, deduct_user_credits
 
 # ============================================================================
@@ -16,6 +18,13 @@ from api.v1.qgen.credits import check_user_has_credits, deduct_user_credits
 # ============================================================================
 
 
+@pytest.fixture(autouse=True)
+def reset_rpc_flag():
+    """Ensure every test starts assuming the RPC is deployed."""
+    with patch.object(credits._deduct_credits_rpc, "available", True):
+        yield
+
+
 @pytest.fixture
 def user_id():
     """Generate a random user ID for testing."""
@@ -33,20 +42,21 @@ def mock_supabase_client():
 # ============================================================================
 
 
+def _mock_check_response(mock_client: MagicMock, data: list) -> None:
+    """Set the result of select().eq().limit().execute()."""
+    mock_eq = mock_client.table.return_value.select.return_value.eq.return_value
+    mock_eq.limit.return_value.execute.return_value = MagicMock(data=data)
+
+
 class TestCheckUserHasCredits:
     """Tests for check_user_has_credits function."""
 
     @patch("api.v1.qgen.credits.get_supabase_client")
     def test_returns_true_when_user_has_credits(self, mock_get_client, user_id):
-        """Test that check returns True when user has positive credits."""
+        """Test that check returns True when the user has credits left."""
         mock_client = MagicMock()
         mock_get_client.return_value = mock_client
-
-        # Chain for select().eq().single().execute()
-        mock_response = MagicMock()
-        mock_response.data = {"credits": 1000}
-        mock_chain = mock_client.table.return_value.select.return_value
-        mock_chain.eq.return_value.single.return_value.execute.return_value = mock_response
+        _mock_check_response(mock_client, [{"credits": 1000}])
 
         result = check_user_has_credits(user_id)
 
@@ -54,49 +64,41 @@ class TestCheckUserHasCredits:
         mock_client.table.assert_called_with("users")
 
     @patch("api.v1.qgen.credits.get_supabase_client")
-    def test_returns_false_when_user_has_zero_credits(self, mock_get_client, user_id):
-        """Test that check returns False when user has zero credits."""
+    def test_returns_false_when_out_of_credits(self, mock_get_client, user_id):
+        """Test that check returns False when the user has no credits left."""
         mock_client = MagicMock()
         mock_get_client.return_value = mock_client
+        _mock_check_response(mock_client, [{"credits": 0}])
 
-        mock_response = MagicMock()
-        mock_response.data = {"credits": 0}
-        mock_chain = mock_client.table.return_value.select.return_value
-        mock_chain.eq.return_value.single.return_value.execute.return_value = mock_response
-
-        result = check_user_has_credits(user_id)
+        with patch.object(credits.logger, "warning") as mock_warning:
+            result = check_user_has_credits(user_id)
 
         assert result is False
+        mock_warning.assert_not_called()
 
     @patch("api.v1.qgen.credits.get_supabase_client")
-    def test_returns_false_when_user_has_negative_credits(self, mock_get_client, user_id):
-        """Test that check returns False when user has negative credits."""
+    def test_missing_user_logged_as_not_found(self, mock_get_client, user_id):
+        """Test that a missing user returns False and is logged, unlike a user with zero credits."""
         mock_client = MagicMock()
         mock_get_client.return_value = mock_client
+        _mock_check_response(mock_client, [])
 
-        mock_response = MagicMock()
-        mock_response.data = {"credits": -10}
-        mock_chain = mock_client.table.return_value.select.return_value
-        mock_chain.eq.return_value.single.return_value.execute.return_value = mock_response
-
-        result = check_user_has_credits(user_id)
+        with patch.object(credits.logger, "warning") as mock_warning:
+            result = check_user_has_credits(user_id)
 
         assert result is False
+        assert "not found" in mock_warning.call_args.args[0]
 
     @patch("api.v1.qgen.credits.get_supabase_client")
-    def test_returns_true_when_user_has_one_credit(self, mock_get_client, user_id):
-        """Test that check returns True when user has exactly 1 credit."""
+    def test_returns_false_on_error(self, mock_get_client, user_id):
+        """Test that check fails safe to False when the query raises."""
         mock_client = MagicMock()
         mock_get_client.return_value = mock_client
-
-        mock_response = MagicMock()
-        mock_response.data = {"credits": 1}
-        mock_chain = mock_client.table.return_value.select.return_value
-        mock_chain.eq.return_value.single.return_value.execute.return_value = mock_response
+        mock_client.table.side_effect = RuntimeError("db down")
 
         result = check_user_has_credits(user_id)
 
-        assert result is True
+        assert result is False
 
 
 # ============================================================================
@@ -104,37 +106,59 @@ class TestCheckUserHasCredits:
 # ============================================================================
 
 
+def _mock_missing_rpc(mock_client: MagicMock, current_credits: int) -> None:
+    """Make deduct_credits missing and set the fallback's fetched balance."""
+    mock_client.rpc.return_value.execute.side_effect = APIError({"code": "PGRST202", "message": "not found"})
+    mock_chain = mock_client.table.return_value.select.return_value
+    mock_chain.eq.return_value.single.return_value.execute.return_value = MagicMock(data={"credits": current_credits})
+
+
 class TestDeductUserCredits:
     """Tests for deduct_user_credits function."""
 
     @patch("api.v1.qgen.credits.get_supabase_client")
-    def test_deducts_credits_correctly(self, mock_get_client, user_id):
-        """Test that credits are deducted correctly."""
+    def test_deducts_with_single_rpc(self, mock_get_client, user_id):
+        """Test that the deduction is one deduct_credits call with no table access."""
         mock_client = MagicMock()
         mock_get_client.return_value = mock_client
+        mock_client.rpc.return_value.execute.return_value = MagicMock(data=900)
 
-        # Mock fetch response with 1000 credits
-        mock_fetch_response = MagicMock()
-        mock_fetch_response.data = {"credits": 1000}
-        mock_chain = mock_client.table.return_value.select.return_value
-        mock_chain.eq.return_value.single.return_value.execute.return_value = mock_fetch_response
+        deduct_user_credits(user_id, 100)
+
+        mock_client.rpc.assert_called_once_with("deduct_credits", {"uid": str(user_id), "n": 100})
+        mock_client.table.assert_not_called()
 
+    @patch("api.v1.qgen.credits.get_supabase_client")
+    def test_missing_rpc_falls_back_once(self, mock_get_client, user_id):
+        """Test that a missing function falls back to select + update and is not retried."""
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        _mock_missing_rpc(mock_client, 1000)
+
+        deduct_user_credits(user_id, 100)
         deduct_user_credits(user_id, 100)
 
-        # Verify update called with 900 (1000 - 100)
+        assert mock_client.rpc.call_count == 1
         mock_client.table("users").update.assert_called_with({"credits": 900})
 
     @patch("api.v1.qgen.credits.get_supabase_client")
-    def test_floors_credits_at_zero(self, mock_get_client, user_id):
-        """Test that credits cannot go below zero."""
+    def test_other_rpc_errors_do_not_fall_back(self, mock_get_client, user_id):
+        """Test that other RPC errors are logged without a racy fallback write."""
         mock_client = MagicMock()
         mock_get_client.return_value = mock_client
+        mock_client.rpc.return_value.execute.side_effect = APIError({"code": "42501", "message": "denied"})
 
-        # Mock fetch response with 5 credits
-        mock_fetch_response = MagicMock()
-        mock_fetch_response.data = {"credits": 5}
-        mock_chain = mock_client.table.return_value.select.return_value
-        mock_chain.eq.return_value.single.return_value.execute.return_value = mock_fetch_response
+        deduct_user_credits(user_id, 100)
+
+        mock_client.table.assert_not_called()
+        assert credits._deduct_credits_rpc.available is True
+
+    @patch("api.v1.qgen.credits.get_supabase_client")
+    def test_fallback_floors_credits_at_zero(self, mock_get_client, user_id):
+        """Test that credits cannot go below zero on the fallback path."""
+        mock_client = MagicMock()
+        mock_get_client.return_value = mock_client
+        _mock_missing_rpc(mock_client, 5)
 
         # Deduct more than available
         deduct_user_credits(user_id, 10)
@@ -143,15 +167,11 @@ class TestDeductUserCredits:
         mock_client.table("users").update.assert_called_with({"credits": 0})
 
     @patch("api.v1.qgen.credits.get_supabase_client")
-    def test_deducts_exact_amount(self, mock_get_client, user_id):
-        """Test that exact amount is deducted."""
+    def test_fallback_deducts_exact_amount(self, mock_get_client, user_id):
+        """Test that exact amount is deducted on the fallback path."""
         mock_client = MagicMock()
         mock_get_client.return_value = mock_client
-
-        mock_fetch_response = MagicMock()
-        mock_fetch_response.data = {"credits": 50}
-        mock_chain = mock_client.table.return_value.select.return_value
-        mock_chain.eq.return_value.single.return_value.execute.return_value = mock_fetch_response
+        _mock_missing_rpc(mock_client, 50)
 
         deduct_user_credits(user_id, 50)
 
@@ -1,9 +1,22 @@
+import base64
+import io
 from unittest.mock import AsyncMock, MagicMock, patch
 
+import httpx
 import pytest
+from docx import Document
+from docx.oxml.ns import qn
 from fastapi.testclient import TestClient
 
 from api.v1.auth import get_supabase_client, require_supabase_user
+from api.v1.qgen import download_docx
+from api.v1.qgen.download_docx import (
+    _download_images,
+    _image_cache_key,
+    add_text_with_math,
+    remove_control_characters,
+    set_table_no_border,
+)
 from app import create_app
 
 # Basic Mock data
@@ -13,6 +26,7 @@ MOCK_QUESTIONS = [
     {
         "id": "q-1",
         "qgen_draft_section_id": "sec-1",
+        "position_in_draft": 1,
         "question_text": "Q1 $x^2$",
         "marks": 5,
         "is_in_draft": True,
@@ -63,6 +77,16 @@ class MockSupabaseClient:
         return MagicMock()
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Downloaded images and built documents are cached per process; start every test cold."""
+    download_docx._image_cache.clear()
+    download_docx._docx_cache.clear()
+    yield
+    download_docx._image_cache.clear()
+    download_docx._docx_cache.clear()
+
+
 @pytest.fixture
 def test_app():
     # Only patch app start, not concerned with PDF browser here since we are testing DOCX
@@ -113,11 +137,12 @@ def test_download_docx_page_break(test_app):
         {
             "id": "q-1",
             "qgen_draft_section_id": "sec-1",
+            "position_in_draft": 1,
             "question_text": "Q1",
             "marks": 5,
             "is_page_break_below": True,
         },
-        {"id": "q-2", "qgen_draft_section_id": "sec-1", "question_text": "Q2", "marks": 5},
+        {"id": "q-2", "qgen_draft_section_id": "sec-1", "position_in_draft": 2, "question_text": "Q2", "marks": 5},
     ]
 
     with patch("api.v1.qgen.download_docx.fetch_paper_data", new_callable=AsyncMock) as mock_fetch:
@@ -139,8 +164,8 @@ def test_download_docx_page_break(test_app):
 
 def test_download_docx_rollback_on_math_failure(test_app):
     """
-    Test: Verify that if math2docx fails, the rollback logic removes corrupted elements
-    and falls back to inserting the original text using add_run.
+    Test: Verify that if math2docx fails, nothing from the attempt reaches the paragraph
+    and the original text is inserted using add_run instead.
     """
     client = test_app
 
@@ -149,6 +174,7 @@ def test_download_docx_rollback_on_math_failure(test_app):
         {
             "id": "q-1",
             "qgen_draft_section_id": "sec-1",
+            "position_in_draft": 1,
             "question_text": f"Math: {latex_text}",
             "marks": 5,
         }
@@ -167,12 +193,8 @@ def test_download_docx_rollback_on_math_failure(test_app):
             mock_paragraph = MagicMock()
             mock_doc.add_paragraph.return_value = mock_paragraph
 
-            # Mock the internal list _p (lxml element list)
-            # We need it to be a real list so we can test append/remove logic if we want,
-            # but for this test, we primarily want to see if the fallback 'add_run' is called.
-            # The rollback logic accesses len(paragraph._p).
+            # Math is rendered into a separate staging paragraph; on failure nothing is spliced into _p
             mock_paragraph._p = MagicMock()
-            mock_paragraph._p.__len__.return_value = 0  # Simulate empty initially
 
             # We need to simulate math2docx failing
             with patch("api.v1.qgen.download_docx.math2docx.add_math") as mock_add_math:
@@ -182,8 +204,10 @@ def test_download_docx_rollback_on_math_failure(test_app):
 
                 assert response.status_code == 200
 
-                # Check that add_math was attempted
+                # Check that add_math was attempted, on a staging paragraph rather than the real one
                 mock_add_math.assert_called()
+                assert mock_add_math.call_args.args[0] is not mock_paragraph
+                mock_paragraph._p.extend.assert_not_called()
 
                 # Check that simple text fallback occurred
                 # The fallback would call paragraph.add_run(part)
@@ -196,3 +220,221 @@ def test_download_docx_rollback_on_math_failure(test_app):
                 run_calls = [args[0][0] for args in mock_paragraph.add_run.call_args_list if args[0]]
                 # The latex part includes the delimiters in the fallback logic: "$\cos\theta$"
                 assert latex_text in run_calls
+
+
+def test_remove_control_characters_drops_invalid_xml_chars():
+    """
+    Test: Characters invalid in XML 1.0 are dropped while tab/newline and other text are kept.
+    """
+    text = "a\x00b\x0bc\td\ne\rf\ud800g\ufffeh\uffffié\U0001f600"
+
+    assert remove_control_characters(text) == "abc\td\ne\rfghié\U0001f600"
+    assert remove_control_characters(None) == ""
+
+
+def test_download_docx_embeds_downloaded_images(test_app):
+    """
+    Test: The logo and question images are fetched once each up front and embedded; failed ones are skipped.
+    """
+    client = test_app
+    png = base64.b64decode(
+        "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+    )
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(str(request.url))
+        if request.url.path == "/missing.png":
+            return httpx.Response(404)
+        return httpx.Response(200, content=png)
+
+    paper_data = {
+        **mock_paper_data(),
+        "logo_url": "https://cdn.test/logo.png",
+        "images_map": {
+            "q-1": [{"img_url": "https://cdn.test/q1.png"}, {"img_url": "https://cdn.test/missing.png"}],
+        },
+    }
+
+    with (
+        patch("api.v1.qgen.download_docx.fetch_paper_data", new_callable=AsyncMock, return_value=paper_data),
+        patch(
+            "api.v1.qgen.download_docx._image_client",
+            httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        ),
+    ):
+        response = client.post("/api/v1/qgen/download_docx", json={"draft_id": "test-draft", "mode": "paper"})
+
+    assert response.status_code == 200
+    assert sorted(requested) == [
+        "https://cdn.test/logo.png",
+        "https://cdn.test/missing.png",
+        "https://cdn.test/q1.png",
+    ]
+    document = Document(io.BytesIO(response.content))
+    assert len(document.inline_shapes) == 2
+
+
+def test_download_docx_with_failed_image_not_cached(test_app):
+    """
+    Test: A document built without one of its images is served without an ETag and is never cached.
+    """
+    client = test_app
+    payload = {"draft_id": "test-draft", "mode": "paper"}
+    paper_data = {**mock_paper_data(), "images_map": {"q-1": [{"img_url": "https://cdn.test/missing.png"}]}}
+
+    with (
+        patch("api.v1.qgen.download_docx.fetch_paper_data", new_callable=AsyncMock, return_value=paper_data),
+        patch(
+            "api.v1.qgen.download_docx._image_client",
+            httpx.AsyncClient(transport=httpx.MockTransport(lambda _: httpx.Response(503))),
+        ),
+        patch("api.v1.qgen.download_docx._build_docx", wraps=download_docx._build_docx) as mock_build,
+    ):
+        first = client.post("/api/v1/qgen/download_docx", json=payload)
+        second = client.post("/api/v1/qgen/download_docx", json=payload)
+
+    assert first.status_code == second.status_code == 200
+    assert "etag" not in first.headers
+    assert first.headers["cache-control"] == "no-store"
+    assert mock_build.call_count == 2
+    assert len(download_docx._docx_cache) == 0
+
+
+def test_image_cache_key_ignores_signed_url_token():
+    """
+    Test: Supabase signed URLs for the same object share a cache key; other URLs keep their query.
+    """
+    signed = "https://x.supabase.co/storage/v1/object/sign/draft_logo_bucket/logo.png?token="
+    assert _image_cache_key(signed + "a") == _image_cache_key(signed + "b")
+    assert _image_cache_key("https://cdn.test/q.png?v=1") != _image_cache_key("https://cdn.test/q.png?v=2")
+
+
+@pytest.mark.asyncio
+async def test_download_images_served_from_cache():
+    """
+    Test: A repeat download of the same URL is a cache hit; non-200 responses are never cached.
+    """
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(request.url.path)
+        if request.url.path == "/missing.png":
+            return httpx.Response(404)
+        return httpx.Response(200, content=b"img")
+
+    urls = ["https://cdn.test/logo.png", "https://cdn.test/missing.png"]
+
+    with patch(
+        "api.v1.qgen.download_docx._image_client",
+        httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    ):
+        first = await _download_images(urls)
+        second = await _download_images(urls)
+
+    assert first == second == {"https://cdn.test/logo.png": b"img"}
+    assert sorted(requested) == ["/logo.png", "/missing.png", "/missing.png"]
+
+
+def test_download_docx_cached_by_etag(test_app):
+    """
+    Test: A repeat download of unchanged data reuses the built document, and a matching If-None-Match gets 304.
+    """
+    client = test_app
+    payload = {"draft_id": "test-draft", "mode": "paper"}
+
+    with (
+        patch("api.v1.qgen.download_docx.fetch_paper_data", new_callable=AsyncMock, return_value=mock_paper_data()),
+        patch("api.v1.qgen.download_docx._build_docx", wraps=download_docx._build_docx) as mock_build,
+    ):
+        first = client.post("/api/v1/qgen/download_docx", json=payload)
+        second = client.post("/api/v1/qgen/download_docx", json=payload)
+        not_modified = client.post(
+            "/api/v1/qgen/download_docx", json=payload, headers={"If-None-Match": first.headers["etag"]}
+        )
+
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content
+    assert first.headers["etag"] == second.headers["etag"]
+    assert mock_build.call_count == 1
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+
+def test_download_docx_etag_changes_with_data(test_app):
+    """
+    Test: Edited questions produce a different ETag, so stale documents are never served.
+    """
+    client = test_app
+    payload = {"draft_id": "test-draft", "mode": "paper"}
+    edited = [{**MOCK_QUESTIONS[0], "question_text": "Edited"}]
+
+    with patch(
+        "api.v1.qgen.download_docx.fetch_paper_data",
+        new_callable=AsyncMock,
+        side_effect=[mock_paper_data(), mock_paper_data(questions=edited)],
+    ):
+        first = client.post("/api/v1/qgen/download_docx", json=payload)
+        second = client.post("/api/v1/qgen/download_docx", json=payload)
+
+    assert first.headers["etag"] != second.headers["etag"]
+
+
+def test_set_table_no_border_copies_template():
+    """
+    Test: Each table gets its own copy of the prebuilt borders element with all six borders set to nil.
+    """
+    document = Document()
+    tables = [document.add_table(rows=1, cols=1) for _ in range(2)]
+    for table in tables:
+        set_table_no_border(table)
+
+    borders = [table._tbl.tblPr.find(qn("w:tblBorders")) for table in tables]
+    assert borders[0] is not borders[1]
+    for tbl_borders in borders:
+        assert [child.get(qn("w:val")) for child in tbl_borders] == ["nil"] * 6
+
+
+def test_add_text_with_math_plain_text_skips_latex_split():
+    """
+    Test: Text without "$" or "\\" is added as one sanitized run without running the LaTeX regex.
+    """
+    paragraph = Document().add_paragraph()
+
+    with patch("api.v1.qgen.download_docx._LATEX_RE") as mock_re:
+        add_text_with_math(paragraph, "Plain\x0btext")
+
+    mock_re.split.assert_not_called()
+    assert [run.text for run in paragraph.runs] == ["Plaintext"]
+
+
+def test_add_text_with_math_splices_rendered_math():
+    """
+    Test: Successful math lands in the paragraph in order; failed math leaves no partial XML, only its text.
+    """
+    paragraph = Document().add_paragraph()
+
+    add_text_with_math(paragraph, r"a $x^2$ b")
+    assert [child.tag.split("}")[1] for child in paragraph._p] == ["r", "oMath", "r"]
+
+    paragraph = Document().add_paragraph()
+    with patch("api.v1.qgen.download_docx.math2docx.add_math", side_effect=ValueError("bad latex")):
+        add_text_with_math(paragraph, r"a $x^2$ b")
+    assert [run.text for run in paragraph.runs] == ["a ", "$x^2$", " b"]
+    assert len(paragraph._p) == 3
+
+
+@pytest.mark.asyncio
+async def test_image_client_shared_until_closed():
+    """
+    Test: Image downloads share one pooled client, which is recreated after app shutdown closes it.
+    """
+    client = download_docx._get_image_client()
+    assert download_docx._get_image_client() is client
+
+    await download_docx.close_image_client()
+
+    assert client.is_closed
+    replacement = download_docx._get_image_client()
+    assert replacement is not client
+    await download_docx.close_image_client()
@@ -1,9 +1,15 @@
+import io
+import zipfile
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from fastapi.testclient import TestClient
+from postgrest.exceptions import APIError
 
 from api.v1.auth import get_supabase_client, require_supabase_user
+from api.v1.qgen import download_pdf
+from api.v1.qgen.download_pdf import generate_paper_html
+from api.v1.qgen.utils.katex_assets import KATEX_HEAD_HTML, KATEX_READY
 from app import create_app
 
 # Mock data
@@ -13,6 +19,7 @@ MOCK_QUESTIONS = [
     {
         "id": "q-1",
         "qgen_draft_section_id": "sec-1",
+        "position_in_draft": 1,
         "question_text": "Q1",
         "marks": 5,
         "is_in_draft": True,
@@ -42,6 +49,10 @@ class MockSupabaseClient:
     def order(self, *args, **kwargs):
         return self
 
+    def rpc(self, *args, **kwargs):
+        # Behave like a database without get_paper_bundle so the per-table selects are exercised
+        raise APIError({"code": "PGRST202", "message": "function not found"})
+
     def execute(self):
         mock_res = MagicMock()
         if self.table_name == "qgen_drafts":
@@ -59,6 +70,14 @@ class MockSupabaseClient:
         return mock_res
 
 
+@pytest.fixture(autouse=True)
+def clear_pdf_cache():
+    """Rendered PDFs are cached per process; start every test cold."""
+    download_pdf._pdf_cache.clear()
+    yield
+    download_pdf._pdf_cache.clear()
+
+
 @pytest.fixture
 def test_app():
     """
@@ -114,13 +133,17 @@ def test_browser_instance_efficiency(test_app):
     """
     client, app, mock_browser = test_app
 
-    # Hit the endpoint 3 times
+    response = client.post("/api/v1/qgen/download_pdf", json={"draft_id": "test-draft", "mode": "paper"})
+    assert response.status_code == 200
+    contexts_after_first = mock_browser.new_context.call_count
+
+    # Hit the endpoint 3 more times
     for _ in range(3):
         response = client.post("/api/v1/qgen/download_pdf", json={"draft_id": "test-draft", "mode": "paper"})
         assert response.status_code == 200
 
-    # Ensure context creation happened 3 times
-    assert mock_browser.new_context.call_count >= 3
+    # Ensure later requests reused the pooled page instead of creating contexts
+    assert mock_browser.new_context.call_count == contexts_after_first
 
     # Verify we aren't creating new BrowserService instances (implied by lifespan fixture)
 
@@ -138,3 +161,193 @@ def test_error_if_service_missing_in_app_state(test_app):
 
     assert response.status_code == 503
     assert "unavailable" in response.json()["detail"].lower()
+
+
+def test_pdf_waits_for_katex_ready_signal(test_app):
+    """
+    Test 4: Verify the PDF waits for the KaTeX ready signal, which the page's render script sets.
+    """
+    client, app, mock_browser = test_app
+    page = mock_browser.new_context.return_value.new_page.return_value
+
+    response = client.post("/api/v1/qgen/download_pdf", json={"draft_id": "test-draft", "mode": "paper"})
+
+    assert response.status_code == 200
+    html = page.set_content.call_args.args[0]
+    assert page.set_content.call_args.kwargs["wait_until"] == "domcontentloaded"
+    assert "window.__katexDone = true" in html
+    page.wait_for_function.assert_awaited_with(KATEX_READY, timeout=5000)
+
+
+def test_pdf_uses_shared_katex_assets(test_app):
+    """
+    Test 5: Verify the paper loads KaTeX from the shared (locally inlined when available) assets and no web fonts.
+    """
+    client, app, mock_browser = test_app
+    page = mock_browser.new_context.return_value.new_page.return_value
+
+    response = client.post("/api/v1/qgen/download_pdf", json={"draft_id": "test-draft", "mode": "paper"})
+
+    assert response.status_code == 200
+    html = page.set_content.call_args.args[0]
+    assert KATEX_HEAD_HTML in html
+    assert html.count("katex.min.js") == KATEX_HEAD_HTML.count("katex.min.js")
+    assert "fonts.googleapis.com" not in html
+
+
+def test_paper_html_escapes_user_text():
+    """
+    Test 6: Verify user-supplied text is HTML-escaped while SVG markup and LaTeX are left for the browser.
+    """
+    questions = [
+        {
+            "id": "q-1",
+            "qgen_draft_section_id": "sec-1",
+            "position_in_draft": 1,
+            "question_text": "Is $a<b$? <script>alert(1)</script>",
+            "marks": 1,
+            "question_type": "mcq4",
+            "option1": "x & y",
+        }
+    ]
+    images_map = {"q-1": [{"svg_string": "<svg><rect/></svg>"}, {"img_url": 'https://cdn.test/q.png?a=1&b="2"'}]}
+
+    html = generate_paper_html(
+        {**MOCK_DRAFT, "paper_title": "<b>Title</b>"}, MOCK_SECTIONS, questions, [], None, "paper", images_map
+    )
+
+    assert "<script>alert(1)</script>" not in html
+    assert "Is $a&lt;b$? &lt;script&gt;" in html
+    assert "x &amp; y" in html
+    assert "&lt;b&gt;Title&lt;/b&gt;" in html
+    assert "<svg><rect/></svg>" in html
+    assert 'src="https://cdn.test/q.png?a=1&amp;b=&quot;2&quot;"' in html
+
+
+def test_download_pdfs_zips_each_mode(test_app):
+    """
+    Test 7: Verify download_pdfs fetches the draft once and returns one PDF per requested mode in a zip.
+    """
+    client, app, mock_browser = test_app
+
+    with patch(
+        "api.v1.qgen.download_pdf.fetch_paper_data",
+        new_callable=AsyncMock,
+        return_value={
+            "draft": MOCK_DRAFT,
+            "sections": MOCK_SECTIONS,
+            "questions": MOCK_QUESTIONS,
+            "instructions": MOCK_INSTRUCTIONS,
+            "logo_url": None,
+            "images_map": {},
+        },
+    ) as mock_fetch:
+        response = client.post(
+            "/api/v1/qgen/download_pdfs", json={"draft_id": "test-draft", "modes": ["paper", "answer"]}
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    mock_fetch.assert_awaited_once()
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        assert zf.namelist() == ["Test Paper_paper.pdf", "Test Paper_answer.pdf"]
+        assert zf.read("Test Paper_answer.pdf") == b"%PDF-service-content"
+
+
+@pytest.mark.parametrize("modes", [[], ["paper", "answer", "paper"], ["paper", "junk"]])
+def test_download_pdfs_validates_modes(test_app, modes):
+    """
+    Test 8: Verify download_pdfs rejects empty, oversized or unknown lists of modes before rendering anything.
+    """
+    client, app, mock_browser = test_app
+
+    response = client.post("/api/v1/qgen/download_pdfs", json={"draft_id": "test-draft", "modes": modes})
+
+    assert response.status_code == 422
+    mock_browser.new_context.return_value.new_page.return_value.pdf.assert_not_awaited()
+
+
+def test_download_pdf_cached_by_etag(test_app):
+    """
+    Test 9: Verify a repeat download of unchanged data reuses the rendered PDF, and a matching If-None-Match gets 304.
+    """
+    client, app, mock_browser = test_app
+    payload = {"draft_id": "test-draft", "mode": "paper"}
+    browser_service = app.state.browser_service
+
+    with patch.object(browser_service, "render_pdf", wraps=browser_service.render_pdf) as mock_render:
+        first = client.post("/api/v1/qgen/download_pdf", json=payload)
+        second = client.post("/api/v1/qgen/download_pdf", json=payload)
+        not_modified = client.post(
+            "/api/v1/qgen/download_pdf", json=payload, headers={"If-None-Match": first.headers["etag"]}
+        )
+
+    assert first.status_code == second.status_code == 200
+    assert first.content == second.content == b"%PDF-service-content"
+    assert first.headers["etag"] == second.headers["etag"]
+    assert mock_render.await_count == 1
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+
+def test_download_pdf_etag_differs_by_mode(test_app):
+    """
+    Test 10: Verify the paper and answer key get different ETags, so one is never served for the other.
+    """
+    client, app, _ = test_app
+
+    paper = client.post("/api/v1/qgen/download_pdf", json={"draft_id": "test-draft", "mode": "paper"})
+    answer = client.post("/api/v1/qgen/download_pdf", json={"draft_id": "test-draft", "mode": "answer"})
+
+    assert paper.headers["etag"] != answer.headers["etag"]
+
+
+def test_incomplete_pdf_render_not_cached(test_app):
+    """
+    Test 11: Verify a render with missing math, images or fonts is served without an ETag and never cached.
+    """
+    client, app, mock_browser = test_app
+    page = mock_browser.new_context.return_value.new_page.return_value
+    page.evaluate = AsyncMock(return_value=False)
+    payload = {"draft_id": "test-draft", "mode": "paper"}
+
+    first = client.post("/api/v1/qgen/download_pdf", json=payload)
+    second = client.post("/api/v1/qgen/download_pdf", json=payload)
+
+    assert first.status_code == second.status_code == 200
+    assert first.content == b"%PDF-service-content"
+    assert "etag" not in first.headers
+    assert first.headers["cache-control"] == "no-store"
+    assert page.pdf.await_count == 2
+    assert len(download_pdf._pdf_cache) == 0
+
+
+def test_download_pdfs_sanitizes_title(test_app):
+    """
+    Test 12: Verify quotes, path separators and line breaks in the paper title never reach the zip or its headers.
+    """
+    client, app, _ = test_app
+
+    with patch(
+        "api.v1.qgen.download_pdf.fetch_paper_data",
+        new_callable=AsyncMock,
+        return_value={
+            "draft": {**MOCK_DRAFT, "paper_title": 'Maths "Final"/..\\x\r\nSet-Cookie: a=b'},
+            "sections": MOCK_SECTIONS,
+            "questions": MOCK_QUESTIONS,
+            "instructions": MOCK_INSTRUCTIONS,
+            "logo_url": None,
+            "images_map": {},
+        },
+    ):
+        response = client.post("/api/v1/qgen/download_pdfs", json={"draft_id": "test-draft", "modes": ["paper"]})
+
+    assert response.status_code == 200
+    assert "set-cookie" not in response.headers
+    disposition = response.headers["content-disposition"]
+    assert disposition.startswith('attachment; filename="Maths _Final_')
+    assert "filename*=UTF-8''Maths%20_Final_" in disposition
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        (name,) = zf.namelist()
+    assert not any(char in name for char in '"/\\\r\n')
+    assert name.endswith("_paper.pdf")
@@ -0,0 +1,114 @@
+"""
+Unit tests for extract_questions/service.py using pytest.
+
+Tests how uploaded files are handed to Gemini: inline for small files, via the Files API for large ones.
+"""
+
+import io
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from google.genai import types
+from starlette.datastructures import Headers, UploadFile
+
+from api.v1.qgen.extract_questions.service import (
+    INLINE_FILE_MAX_BYTES,
+    ExtractionValidationError,
+    ExtractQuestionsService,
+    process_uploaded_file,
+)
+from api.v1.qgen.models import ExtractedQuestionsList
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+
+def _upload(data: bytes, content_type: str = "application/pdf") -> UploadFile:
+    return UploadFile(
+        file=io.BytesIO(data),
+        size=len(data),
+        filename="paper.pdf",
+        headers=Headers({"content-type": content_type}),
+    )
+
+
+def _gemini_client() -> MagicMock:
+    client = MagicMock()
+    client.aio.files.upload = AsyncMock(
+        return_value=types.File(name="files/abc", uri="https://gemini.test/files/abc", mime_type="application/pdf")
+    )
+    client.aio.files.delete = AsyncMock()
+    return client
+
+
+# ============================================================================
+# PROCESS UPLOADED FILE TESTS
+# ============================================================================
+
+
+class TestProcessUploadedFile:
+    """Tests for process_uploaded_file."""
+
+    @pytest.mark.asyncio
+    async def test_small_file_sent_inline(self):
+        """Small files should become inline bytes parts."""
+        part = await process_uploaded_file(_upload(b"%PDF-1.4"))
+
+        assert part.inline_data.data == b"%PDF-1.4"
+        assert part.inline_data.mime_type == "application/pdf"
+
+    @pytest.mark.asyncio
+    async def test_unsupported_type_rejected_before_read(self):
+        """Unsupported types should be rejected without reading the upload."""
+        upload = _upload(b"text", content_type="text/plain")
+        upload.read = AsyncMock()
+
+        with pytest.raises(ExtractionValidationError):
+            await process_uploaded_file(upload)
+
+        upload.read.assert_not_called()
+
+
+# ============================================================================
+# EXTRACT AND INSERT TESTS
+# ============================================================================
+
+
+class TestExtractAndInsertUpload:
+    """Tests for the file handling in extract_and_insert."""
+
+    @pytest.mark.asyncio
+    async def test_large_file_uploaded_once_and_deleted(self):
+        """Large files should be uploaded via the Files API, referenced by URI on every attempt, then deleted."""
+        gemini_client = _gemini_client()
+        upload = _upload(b"x" * (INLINE_FILE_MAX_BYTES + 1))
+        extraction = AsyncMock(side_effect=[RuntimeError("flaky"), ExtractedQuestionsList(questions=[])])
+
+        with (
+            patch("api.v1.qgen.extract_questions.service.get_gemini_client", return_value=gemini_client),
+            patch.object(ExtractQuestionsService, "process_extraction", extraction),
+        ):
+            result = await ExtractQuestionsService.extract_and_insert(upload, "activity", "draft", MagicMock())
+
+        assert result["questions_extracted"] == 0
+        gemini_client.aio.files.upload.assert_awaited_once()
+        assert gemini_client.aio.files.upload.call_args.kwargs["file"] is upload.file
+        file_parts = [call.args[1] for call in extraction.call_args_list]
+        assert all(part.file_data.file_uri == "https://gemini.test/files/abc" for part in file_parts)
+        gemini_client.aio.files.delete.assert_awaited_once_with(name="files/abc")
+
+    @pytest.mark.asyncio
+    async def test_small_file_not_uploaded(self):
+        """Files under the inline limit should not touch the Files API."""
+        gemini_client = _gemini_client()
+        extraction = AsyncMock(return_value=ExtractedQuestionsList(questions=[]))
+
+        with (
+            patch("api.v1.qgen.extract_questions.service.get_gemini_client", return_value=gemini_client),
+            patch.object(ExtractQuestionsService, "process_extraction", extraction),
+        ):
+            await ExtractQuestionsService.extract_and_insert(_upload(b"%PDF-1.4"), "activity", "draft", MagicMock())
+
+        gemini_client.aio.files.upload.assert_not_called()
+        assert extraction.call_args.args[1].inline_data.data == b"%PDF-1.4"
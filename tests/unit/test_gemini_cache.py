@@ -0,0 +1,96 @@
+"""
+Unit tests for gemini_cache.py using pytest.
+
+Tests creation, reuse, refresh and fallback of the system instruction context cache.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from google.genai import errors as genai_errors
+from google.genai import types
+
+from api.v1.qgen.utils.gemini_cache import SystemInstructionCache
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+
+@pytest.fixture
+def mock_gemini():
+    """Gemini client whose caches.create returns numbered cache names."""
+    client = MagicMock()
+    names = iter(f"cachedContents/{i}" for i in range(1, 100))
+
+    async def _create(**_):
+        await asyncio.sleep(0)
+        return types.CachedContent(name=next(names))
+
+    client.aio.caches.create = AsyncMock(side_effect=_create)
+    return client
+
+
+# ============================================================================
+# SYSTEM INSTRUCTION CACHE TESTS
+# ============================================================================
+
+
+class TestSystemInstructionCache:
+    """Tests for SystemInstructionCache.get and invalidate."""
+
+    @pytest.mark.asyncio
+    async def test_created_once_per_model(self, mock_gemini):
+        """Concurrent callers should share one cache per model."""
+        cache = SystemInstructionCache("instructions")
+
+        names = await asyncio.gather(*(cache.get(mock_gemini, "flash") for _ in range(5)))
+        lite_name = await cache.get(mock_gemini, "flash-lite")
+
+        assert set(names) == {"cachedContents/1"}
+        assert lite_name == "cachedContents/2"
+        assert mock_gemini.aio.caches.create.await_count == 2
+        config = mock_gemini.aio.caches.create.call_args.kwargs["config"]
+        assert config.system_instruction == "instructions"
+        assert config.ttl == "3600s"
+
+    @pytest.mark.asyncio
+    async def test_recreated_before_expiry(self, mock_gemini):
+        """A cache inside the refresh margin should be replaced by a new one."""
+        cache = SystemInstructionCache("instructions", ttl_seconds=60, refresh_margin=60)
+
+        assert await cache.get(mock_gemini, "flash") == "cachedContents/1"
+        assert await cache.get(mock_gemini, "flash") == "cachedContents/2"
+
+    @pytest.mark.asyncio
+    async def test_rejected_creation_not_retried(self, mock_gemini):
+        """A rejected cache (e.g. too few tokens) should fall back to inline without retrying."""
+        mock_gemini.aio.caches.create = AsyncMock(
+            side_effect=genai_errors.ClientError(400, {"error": {"message": "Cached content is too small"}})
+        )
+        cache = SystemInstructionCache("instructions")
+
+        assert await cache.get(mock_gemini, "flash") is None
+        assert await cache.get(mock_gemini, "flash") is None
+        mock_gemini.aio.caches.create.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_disabled_with_zero_ttl(self, mock_gemini):
+        """A zero TTL should never create a cache."""
+        cache = SystemInstructionCache("instructions", ttl_seconds=0)
+
+        assert await cache.get(mock_gemini, "flash") is None
+        mock_gemini.aio.caches.create.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_invalidate_forces_new_cache(self, mock_gemini):
+        """Invalidating the current cache should make the next get create a fresh one."""
+        cache = SystemInstructionCache("instructions")
+        name = await cache.get(mock_gemini, "flash")
+
+        cache.invalidate("flash", "cachedContents/other")
+        assert await cache.get(mock_gemini, "flash") == name
+
+        cache.invalidate("flash", name)
+        assert await cache.get(mock_gemini, "flash") == "cachedContents/2"
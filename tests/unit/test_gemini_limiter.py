@@ -0,0 +1,123 @@
+"""
+Unit tests for gemini_limiter.py using pytest.
+
+Tests concurrency gating, the per-minute window and the shared retry-after window.
+"""
+
+import asyncio
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from google.genai import errors as genai_errors
+
+from api.v1.qgen.utils.gemini_limiter import DEFAULT_RETRY_AFTER, GeminiLimiter, retry_after_seconds
+
+# ============================================================================
+# RETRY-AFTER PARSING TESTS
+# ============================================================================
+
+
+class TestRetryAfterSeconds:
+    """Tests for retry_after_seconds."""
+
+    def test_reads_retry_after_header(self):
+        """A Retry-After header should take precedence."""
+        exc = genai_errors.ClientError(429, {"error": {}}, response=MagicMock(headers={"retry-after": "7"}))
+
+        assert retry_after_seconds(exc) == 7.0
+
+    def test_reads_retry_info_delay(self):
+        """Without a header, the RetryInfo retryDelay should be used."""
+        details = [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "12.5s"}]
+        exc = genai_errors.ClientError(429, {"error": {"details": details}})
+
+        assert retry_after_seconds(exc) == 12.5
+
+    def test_falls_back_to_default(self):
+        """Errors without any delay hint should use the default."""
+        exc = genai_errors.ClientError(429, {"error": {"message": "quota"}})
+
+        assert retry_after_seconds(exc) == DEFAULT_RETRY_AFTER
+
+
+# ============================================================================
+# LIMITER TESTS
+# ============================================================================
+
+
+class TestGeminiLimiter:
+    """Tests for GeminiLimiter.acquire."""
+
+    async def test_caps_concurrency(self):
+        """No more than max_concurrency blocks should run at once."""
+        limiter = GeminiLimiter(max_concurrency=2)
+        running = peak = 0
+
+        async def call():
+            nonlocal running, peak
+            async with limiter.acquire():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(call() for _ in range(6)))
+
+        assert peak == 2
+
+    async def test_permit_timeout(self):
+        """Waiting longer than acquire_timeout for a permit should raise TimeoutError."""
+        limiter = GeminiLimiter(max_concurrency=1, acquire_timeout=0.01)
+
+        async with limiter.acquire():
+            with pytest.raises(TimeoutError):
+                async with limiter.acquire():
+                    pass
+
+    async def test_429_opens_retry_window(self):
+        """A 429 inside the block should pause the next acquire and still propagate."""
+        limiter = GeminiLimiter()
+        exc = genai_errors.ClientError(429, {"error": {}}, response=MagicMock(headers={"retry-after": "0.05"}))
+
+        with pytest.raises(genai_errors.ClientError):
+            async with limiter.acquire():
+                raise exc
+
+        start = time.monotonic()
+        async with limiter.acquire():
+            pass
+        assert time.monotonic() - start >= 0.03
+
+    async def test_other_errors_do_not_open_retry_window(self):
+        """Non-429 errors should not affect other callers."""
+        limiter = GeminiLimiter()
+
+        with pytest.raises(genai_errors.ServerError):
+            async with limiter.acquire():
+                raise genai_errors.ServerError(503, {"error": {}})
+
+        assert limiter.retry_after_until == 0.0
+
+    async def test_requests_per_minute_window(self):
+        """Once the per-minute budget is spent, the next caller should have to wait."""
+        limiter = GeminiLimiter(requests_per_minute=2)
+
+        async with limiter.acquire():
+            pass
+        async with limiter.acquire():
+            pass
+
+        assert limiter._seconds_until_slot() > 59
+
+    async def test_has_free_slot(self):
+        """has_free_slot should be False while every permit is held or a retry-after window is open."""
+        limiter = GeminiLimiter(max_concurrency=1)
+        assert limiter.has_free_slot()
+
+        async with limiter.acquire():
+            assert not limiter.has_free_slot()
+        assert limiter.has_free_slot()
+
+        limiter.note_rate_limited(5)
+        assert not limiter.has_free_slot()
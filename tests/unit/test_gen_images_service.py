@@ -0,0 +1,72 @@
+"""
+Unit tests for gen_images_service.py using pytest.
+
+Tests the replace_gen_images RPC fast path and its delete + insert fallback.
+"""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+from postgrest.exceptions import APIError
+
+from api.v1.qgen import gen_images_service
+from api.v1.qgen.gen_images_service import replace_gen_images
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+
+@pytest.fixture(autouse=True)
+def reset_rpc_flag():
+    """Ensure every test starts assuming the RPC is deployed."""
+    with patch.object(gen_images_service._replace_gen_images_rpc, "available", True):
+        yield
+
+
+@pytest.fixture
+def rows() -> list[dict]:
+    return [
+        {"gen_question_id": "q-1", "svg_string": "<svg>1</svg>", "position": 1},
+        {"gen_question_id": "q-1", "svg_string": "<svg>2</svg>", "position": 2},
+    ]
+
+
+# ============================================================================
+# REPLACE GEN IMAGES TESTS
+# ============================================================================
+
+
+class TestReplaceGenImages:
+    """Tests for replace_gen_images function."""
+
+    def test_uses_rpc(self, rows):
+        """The RPC should replace the rows in a single call."""
+        client = MagicMock()
+
+        replace_gen_images(client, "q-1", rows)
+
+        client.rpc.assert_called_once_with("replace_gen_images", {"p_question_id": "q-1", "p_rows": rows})
+        client.table.assert_not_called()
+
+    def test_missing_rpc_falls_back_once(self, rows):
+        """A missing function should fall back to delete + insert and not be retried."""
+        client = MagicMock()
+        client.rpc.return_value.execute.side_effect = APIError({"code": "PGRST202", "message": "not found"})
+
+        replace_gen_images(client, "q-1", rows)
+        replace_gen_images(client, "q-1", rows)
+
+        assert client.rpc.call_count == 1
+        assert client.table.return_value.delete.call_count == 2
+        client.table.return_value.insert.assert_called_with(rows)
+
+    def test_other_rpc_errors_raise(self, rows):
+        """RPC failures other than a missing function should propagate."""
+        client = MagicMock()
+        client.rpc.return_value.execute.side_effect = APIError({"code": "23503", "message": "fk violation"})
+
+        with pytest.raises(APIError):
+            replace_gen_images(client, "q-1", rows)
+
+        client.table.assert_not_called()
@@ -0,0 +1,45 @@
+"""
+Unit tests for katex_assets.py using pytest.
+
+Tests inlining of self-hosted KaTeX assets and the CDN fallback.
+"""
+
+import base64
+
+from api.v1.qgen.utils.katex_assets import KATEX_CDN_URL, _build_head_html
+
+# ============================================================================
+# HEAD HTML TESTS
+# ============================================================================
+
+
+class TestBuildHeadHtml:
+    """Tests for _build_head_html."""
+
+    def test_falls_back_to_cdn_without_local_assets(self, tmp_path):
+        """Missing dist files should produce the CDN link/script tags."""
+        head = _build_head_html(tmp_path)
+
+        assert f'href="{KATEX_CDN_URL}/katex.min.css"' in head
+        assert f'src="{KATEX_CDN_URL}/contrib/auto-render.min.js"' in head
+
+    def test_inlines_local_assets_and_fonts(self, tmp_path):
+        """Local dist files should be inlined, with woff2 fonts embedded and other formats on the CDN."""
+        (tmp_path / "contrib").mkdir()
+        (tmp_path / "fonts").mkdir()
+        (tmp_path / "fonts" / "KaTeX_Main-Regular.woff2").write_bytes(b"woff2-bytes")
+        (tmp_path / "katex.min.css").write_text(
+            '@font-face{src:url(fonts/KaTeX_Main-Regular.woff2) format("woff2"),'
+            'url(fonts/KaTeX_Main-Regular.woff) format("woff")}'
+        )
+        (tmp_path / "katex.min.js").write_text("var katex={};")
+        (tmp_path / "contrib" / "auto-render.min.js").write_text("function renderMathInElement(){}")
+
+        head = _build_head_html(tmp_path)
+
+        encoded = base64.b64encode(b"woff2-bytes").decode("ascii")
+        assert f"url(data:font/woff2;base64,{encoded})" in head
+        assert f"url({KATEX_CDN_URL}/fonts/KaTeX_Main-Regular.woff)" in head
+        assert "<script>var katex={};</script>" in head
+        assert "<script>function renderMathInElement(){}</script>" in head
+        assert "cdn.jsdelivr.net/npm/katex@0.16.8/dist/katex.min.js" not in head
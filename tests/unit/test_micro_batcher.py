@@ -0,0 +1,78 @@
+"""
+Unit tests for micro_batcher.py using pytest.
+
+Tests size- and time-triggered flushes and per-item error propagation.
+"""
+
+import asyncio
+
+import pytest
+
+from api.v1.qgen.utils.micro_batcher import MicroBatcher
+
+# ============================================================================
+# MICRO BATCHER TESTS
+# ============================================================================
+
+
+class TestMicroBatcher:
+    """Tests for MicroBatcher.submit."""
+
+    @pytest.mark.asyncio
+    async def test_full_batch_flushes_immediately(self):
+        """Reaching max_batch_size should send the batch without waiting for max_wait."""
+        batches = []
+
+        async def process(items):
+            batches.append(items)
+            return [item * 10 for item in items]
+
+        batcher = MicroBatcher(process, max_batch_size=3, max_wait=60)
+
+        results = await asyncio.wait_for(asyncio.gather(*(batcher.submit(i) for i in range(3))), timeout=1)
+
+        assert results == [0, 10, 20]
+        assert batches == [[0, 1, 2]]
+
+    @pytest.mark.asyncio
+    async def test_partial_batch_flushes_after_max_wait(self):
+        """Fewer than max_batch_size items should be sent together once max_wait passes."""
+        batches = []
+
+        async def process(items):
+            batches.append(items)
+            return items
+
+        batcher = MicroBatcher(process, max_batch_size=8, max_wait=0.01)
+
+        results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"))
+
+        assert results == ["a", "b"]
+        assert batches == [["a", "b"]]
+
+    @pytest.mark.asyncio
+    async def test_exception_result_raised_to_its_caller_only(self):
+        """An exception returned for one item should fail that caller and leave the others alone."""
+
+        async def process(items):
+            return [ValueError(item) if item == "bad" else item for item in items]
+
+        batcher = MicroBatcher(process, max_batch_size=2)
+
+        good, bad = await asyncio.gather(batcher.submit("good"), batcher.submit("bad"), return_exceptions=True)
+
+        assert good == "good"
+        assert isinstance(bad, ValueError)
+
+    @pytest.mark.asyncio
+    async def test_batch_failure_raised_to_every_caller(self):
+        """An exception from process_batch, or a wrong result count, should fail every caller."""
+
+        async def process(items):
+            return items[:1]
+
+        batcher = MicroBatcher(process, max_batch_size=2)
+
+        results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+        assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,45 @@
+"""
+Unit tests for qgen models using pytest.
+
+Guards the Gemini structured-output schemas against malformed field metadata.
+"""
+
+import pytest
+from pydantic import BaseModel
+
+from api.v1.qgen.generate_questions.models import (
+    QUESTION_TYPE_TO_MODEL_WITH_CONCEPTS,
+    QUESTION_TYPE_TO_SCHEMA_WITH_CONCEPTS,
+)
+from api.v1.qgen.models import (
+    QUESTION_TYPE_TO_SCHEMA,
+    AutoCorrectedQuestion,
+    ExtractedQuestion,
+    ExtractedQuestionsList,
+    FeedbackItem,
+    FeedbackList,
+)
+
+GEMINI_SCHEMAS: list[type[BaseModel]] = [
+    *QUESTION_TYPE_TO_SCHEMA.values(),
+    *(schema.model_fields["questions"].annotation.__args__[0] for schema in QUESTION_TYPE_TO_SCHEMA.values()),
+    *QUESTION_TYPE_TO_SCHEMA_WITH_CONCEPTS.values(),
+    *QUESTION_TYPE_TO_MODEL_WITH_CONCEPTS.values(),
+    AutoCorrectedQuestion,
+    ExtractedQuestion,
+    ExtractedQuestionsList,
+    FeedbackItem,
+    FeedbackList,
+]
+
+
+# ============================================================================
+# SCHEMA METADATA TESTS
+# ============================================================================
+
+
+@pytest.mark.parametrize("schema", GEMINI_SCHEMAS, ids=lambda schema: schema.__name__)
+def test_field_descriptions_are_plain_strings(schema):
+    """A stray trailing comma turns a description into a tuple and pollutes the prompt schema."""
+    for name, field in schema.model_fields.items():
+        assert field.description is None or isinstance(field.description, str), f"{schema.__name__}.{name}"
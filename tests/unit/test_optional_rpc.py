@@ -0,0 +1,52 @@
+"""
+Unit tests for optional_rpc.py using pytest.
+
+Tests calling a Postgres function that may not be deployed.
+"""
+
+from unittest.mock import MagicMock
+
+import pytest
+from postgrest.exceptions import APIError
+
+from api.v1.qgen.utils.optional_rpc import OptionalRpc
+
+# ============================================================================
+# OPTIONAL RPC TESTS
+# ============================================================================
+
+
+class TestOptionalRpc:
+    """Tests for OptionalRpc.call."""
+
+    def test_returns_response(self):
+        """A deployed function's response should be returned as-is."""
+        client = MagicMock()
+
+        response = OptionalRpc("fn").call(client, {"a": 1})
+
+        client.rpc.assert_called_once_with("fn", {"a": 1})
+        assert response is client.rpc.return_value.execute.return_value
+
+    def test_missing_function_marks_unavailable(self):
+        """PGRST202 should return None and skip the round trip on later calls."""
+        client = MagicMock()
+        client.rpc.return_value.execute.side_effect = APIError({"code": "PGRST202", "message": "not found"})
+        rpc = OptionalRpc("fn")
+
+        assert rpc.call(client, {}) is None
+        assert rpc.call(client, {}) is None
+
+        assert rpc.available is False
+        assert client.rpc.call_count == 1
+
+    def test_other_errors_raise(self):
+        """Errors other than a missing function should propagate and keep the function available."""
+        client = MagicMock()
+        client.rpc.return_value.execute.side_effect = APIError({"code": "23503", "message": "fk violation"})
+        rpc = OptionalRpc("fn")
+
+        with pytest.raises(APIError):
+            rpc.call(client, {})
+
+        assert rpc.available is True
@@ -0,0 +1,235 @@
+"""
+Unit tests for utils/paper_utils.py using pytest.
+
+Tests the get_paper_bundle fast path and the per-table fallback behind fetch_paper_data.
+"""
+
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+from postgrest.exceptions import APIError
+
+from api.v1.qgen.utils import paper_utils
+from api.v1.qgen.utils.paper_utils import fetch_paper_data, group_questions_by_section, paper_etag
+
+DRAFT = {"id": "draft-1", "paper_title": "Paper", "logo_url": None}
+SECTIONS = [{"id": "sec-1", "position_in_draft": 1}]
+QUESTIONS = [{"id": "q-1", "qgen_draft_section_id": "sec-1", "position_in_draft": 1}]
+IMAGES = [
+    {"id": "img-1", "gen_question_id": "q-1", "position": 1},
+    {"id": "img-2", "gen_question_id": "q-1", "position": 2},
+]
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+
+@pytest.fixture(autouse=True)
+def reset_module_state():
+    """Each test starts with the RPC assumed available."""
+    paper_utils._paper_bundle_rpc.available = True
+    yield
+    paper_utils._paper_bundle_rpc.available = True
+
+
+def _bundle_client():
+    """Supabase mock whose get_paper_bundle call returns the fixture rows."""
+    client = MagicMock()
+    client.rpc.return_value.execute.return_value = MagicMock(
+        data={"draft": DRAFT, "sections": SECTIONS, "instructions": [], "questions": QUESTIONS, "images": IMAGES}
+    )
+    return client
+
+
+def _table_client():
+    """Supabase mock whose table selects return the fixture rows."""
+    rows = {
+        "qgen_drafts": [DRAFT],
+        "qgen_draft_sections": SECTIONS,
+        "qgen_draft_instructions_drafts_maps": [],
+        "gen_questions": QUESTIONS,
+        "gen_images": IMAGES,
+    }
+    client = MagicMock()
+
+    def _table(name):
+        query = MagicMock()
+        for method in ("select", "eq", "in_", "order"):
+            getattr(query, method).return_value = query
+        query.execute.return_value = MagicMock(data=rows[name])
+        return query
+
+    client.table.side_effect = _table
+    return client
+
+
+# ============================================================================
+# FETCH PAPER DATA TESTS
+# ============================================================================
+
+
+class TestFetchPaperData:
+    """Tests for fetch_paper_data."""
+
+    @pytest.mark.asyncio
+    async def test_uses_bundle_rpc(self):
+        """One get_paper_bundle call should replace the per-table selects."""
+        client = _bundle_client()
+
+        data = await fetch_paper_data("draft-1", client)
+
+        client.rpc.assert_called_once_with("get_paper_bundle", {"p_draft_id": "draft-1"})
+        client.table.assert_not_called()
+        assert data["questions"] == QUESTIONS
+        assert [img["id"] for img in data["images_map"]["q-1"]] == ["img-1", "img-2"]
+
+    @pytest.mark.asyncio
+    async def test_null_question_position_defaults_to_zero(self):
+        """A null position_in_draft should come back as 0 so questions can be sorted on it directly."""
+        client = MagicMock()
+        question = {"id": "q-1", "qgen_draft_section_id": "sec-1", "position_in_draft": None}
+        client.rpc.return_value.execute.return_value = MagicMock(
+            data={"draft": DRAFT, "sections": SECTIONS, "instructions": [], "questions": [question], "images": []}
+        )
+
+        data = await fetch_paper_data("draft-1", client)
+
+        assert data["questions"][0]["position_in_draft"] == 0
+        assert question["position_in_draft"] is None
+
+    @pytest.mark.asyncio
+    async def test_missing_draft_from_rpc_is_404(self):
+        """A null draft in the bundle should surface as 404."""
+        client = MagicMock()
+        client.rpc.return_value.execute.return_value = MagicMock(data={"draft": None})
+
+        with pytest.raises(HTTPException) as exc_info:
+            await fetch_paper_data("missing", client)
+
+        assert exc_info.value.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_falls_back_when_function_missing(self):
+        """PGRST202 should fall back to the table selects and skip the RPC afterwards."""
+        client = _table_client()
+        client.rpc.side_effect = APIError({"code": "PGRST202", "message": "function not found"})
+
+        first = await fetch_paper_data("draft-1", client)
+        second = await fetch_paper_data("draft-1", client)
+
+        assert client.rpc.call_count == 1
+        assert first["draft"] == DRAFT == second["draft"]
+        assert len(first["images_map"]["q-1"]) == 2
+
+    @pytest.mark.asyncio
+    async def test_other_rpc_errors_are_500(self):
+        """Errors other than a missing function should not trigger the fallback."""
+        client = _table_client()
+        client.rpc.side_effect = APIError({"code": "57014", "message": "statement timeout"})
+
+        with pytest.raises(HTTPException) as exc_info:
+            await fetch_paper_data("draft-1", client)
+
+        assert exc_info.value.status_code == 500
+        assert paper_utils._paper_bundle_rpc.available is True
+
+
+# ============================================================================
+# SHARED FETCH TESTS
+# ============================================================================
+
+
+class TestFetchPaperDataSharing:
+    """Tests for sharing in-progress paper data fetches."""
+
+    @pytest.mark.asyncio
+    async def test_sequential_fetches_query_again(self):
+        """A finished fetch should not be reused, so edits made since are seen by the next download."""
+        client = _bundle_client()
+
+        await fetch_paper_data("draft-1", client)
+        await fetch_paper_data("draft-1", client)
+
+        assert client.rpc.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_fetches_share_one_query(self):
+        """Concurrent fetches of the same draft should wait on a single query."""
+        client = _bundle_client()
+
+        results = await asyncio.gather(*(fetch_paper_data("draft-1", client) for _ in range(5)))
+
+        assert all(result is results[0] for result in results)
+        client.rpc.assert_called_once()
+        assert paper_utils._paper_data_in_flight == {}
+
+    @pytest.mark.asyncio
+    async def test_failed_fetch_not_reused(self):
+        """A failed fetch should be dropped from the in-flight map, so the next call queries again."""
+        client = _bundle_client()
+        execute = client.rpc.return_value.execute
+        execute.side_effect = [MagicMock(data={"draft": None}), execute.return_value]
+
+        with pytest.raises(HTTPException):
+            await fetch_paper_data("draft-1", client)
+        data = await fetch_paper_data("draft-1", client)
+
+        assert data["draft"] == DRAFT
+
+
+# ============================================================================
+# GROUPING TESTS
+# ============================================================================
+
+
+class TestGroupQuestionsBySection:
+    """Tests for group_questions_by_section."""
+
+    def test_buckets_sorted_by_position(self):
+        """Questions should be bucketed per section and ordered by position_in_draft."""
+        questions = [
+            {"id": "a", "qgen_draft_section_id": "s1", "position_in_draft": 2},
+            {"id": "b", "qgen_draft_section_id": "s2", "position_in_draft": 1},
+            {"id": "c", "qgen_draft_section_id": "s1", "position_in_draft": 1},
+            {"id": "d", "qgen_draft_section_id": "s1", "position_in_draft": 0},
+        ]
+
+        grouped = group_questions_by_section(questions)
+
+        assert [q["id"] for q in grouped["s1"]] == ["d", "c", "a"]
+        assert [q["id"] for q in grouped["s2"]] == ["b"]
+        assert grouped.get("s3") is None
+
+
+# ============================================================================
+# PAPER ETAG TESTS
+# ============================================================================
+
+
+class TestPaperEtag:
+    """Tests for paper_etag."""
+
+    def _data(self, img_url: str, logo_url: str = "https://signed.test/logo?token=a") -> dict:
+        return {
+            "draft": DRAFT,
+            "sections": SECTIONS,
+            "questions": QUESTIONS,
+            "instructions": [],
+            "logo_url": logo_url,
+            "images_map": {"q-1": [{"id": "img-1", "img_url": img_url}]},
+        }
+
+    def test_changes_with_image_url(self):
+        """A question image pointing somewhere else should produce a different ETag."""
+        assert paper_etag(self._data("https://cdn.test/a.png"), "paper") != paper_etag(
+            self._data("https://cdn.test/b.png"), "paper"
+        )
+
+    def test_ignores_signed_logo_url(self):
+        """A freshly signed logo URL for the same logo should not change the ETag."""
+        assert paper_etag(self._data("https://cdn.test/a.png"), "paper") == paper_etag(
+            self._data("https://cdn.test/a.png", logo_url="https://signed.test/logo?token=b"), "paper"
+        )
@@ -7,6 +7,8 @@ to validate the new refactored architecture:
     2. process_question_and_validate() - Calls process_question + validates response
 """
 
+from unittest.mock import AsyncMock, MagicMock, patch
+
 import google.genai as genai
 import pytest
 
@@ -17,6 +19,7 @@ from api.v1.qgen.regenerate_question import (
     process_question,
     process_question_and_validate,
     regenerate_question_prompt,
+    try_retry_and_update,
 )
 
 # ============================================================================
@@ -342,6 +345,39 @@ class TestProcessQuestionAndValidate:
             assert len(result.explanation) > 0
 
 
+# ============================================================================
+# TESTS FOR try_retry_and_update
+# ============================================================================
+
+
+class TestTryRetryAndUpdate:
+    """Tests for the try_retry_and_update retry wrapper."""
+
+    @pytest.mark.asyncio
+    async def test_prompt_rendered_once_across_retries(self, mock_mcq4_question: dict):
+        """
+        Test that a retried question reuses the prompt rendered before the first attempt.
+        """
+        mock_gemini = MagicMock()
+        mock_gemini.aio.models.generate_content = AsyncMock(
+            side_effect=[ValueError("flaky"), MagicMock(parsed=MagicMock(question=MCQ4(**mock_mcq4_question)))]
+        )
+
+        with (
+            patch(
+                "api.v1.qgen.regenerate_question.regenerate_question_prompt", wraps=regenerate_question_prompt
+            ) as mock_prompt,
+            patch("api.v1.qgen.regenerate_question.asyncio.sleep", new_callable=AsyncMock),
+        ):
+            success = await try_retry_and_update(mock_gemini, mock_mcq4_question, "q1", MagicMock())
+
+        assert success is True
+        assert mock_gemini.aio.models.generate_content.call_count == 2
+        mock_prompt.assert_called_once()
+        prompts = [call.kwargs["contents"] for call in mock_gemini.aio.models.generate_content.call_args_list]
+        assert prompts[0] == prompts[1]
+
+
 # ============================================================================
 # TESTS FOR CUSTOM EXCEPTIONS
 # ============================================================================
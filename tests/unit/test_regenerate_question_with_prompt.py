@@ -117,7 +117,7 @@ class TestRegenerateWithPromptService:
         # Patch screenshot utils to avoid actual browser/file ops if needed,
         # but since we pass mock_browser, generate_screenshot will use it.
         with (
-            patch("api.v1.qgen.regenerate_with_prompt.service.save_image_for_debug", new=AsyncMock()) as mock_save,
+            patch("api.v1.qgen.regenerate_with_prompt.service.save_image_for_debug_in_background") as mock_save,
             patch(
                 "api.v1.qgen.regenerate_with_prompt.service.RegenerateWithPromptService.process_and_validate"
             ) as mock_process,
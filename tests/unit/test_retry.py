@@ -0,0 +1,127 @@
+"""
+Unit tests for utils/retry.py using pytest.
+
+Tests the hedged-attempt helper and the transient-error classification.
+"""
+
+import asyncio
+
+import pytest
+from google.genai import errors as genai_errors
+
+from api.v1.qgen.utils.retry import backoff_delay, classify_error, is_transient_gemini_error, run_hedged
+
+# ============================================================================
+# HEDGED ATTEMPT TESTS
+# ============================================================================
+
+
+class TestRunHedged:
+    """Tests for run_hedged function."""
+
+    async def test_fast_success_starts_single_copy(self):
+        """A copy that answers before the hedge delay should be the only one started."""
+        calls = 0
+
+        async def attempt():
+            nonlocal calls
+            calls += 1
+            return "ok"
+
+        assert await run_hedged(attempt, hedge_delay=1.0) == "ok"
+        assert calls == 1
+
+    async def test_slow_copy_is_hedged_and_cancelled(self):
+        """A slow first copy should be raced by a second one and cancelled when it wins."""
+        cancelled = asyncio.Event()
+        results = iter(["slow", "fast"])
+
+        async def attempt():
+            result = next(results)
+            if result == "slow":
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+            return result
+
+        assert await run_hedged(attempt, hedge_delay=0.01) == "fast"
+        assert cancelled.is_set()
+
+    async def test_no_hedge_while_should_hedge_is_false(self):
+        """A slow copy should not be hedged while should_hedge says there is no spare capacity."""
+        calls = 0
+        checks = 0
+
+        async def attempt():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        def should_hedge():
+            nonlocal checks
+            checks += 1
+            return False
+
+        assert await run_hedged(attempt, hedge_delay=0.01, should_hedge=should_hedge) == "ok"
+        assert calls == 1
+        assert checks >= 2
+
+    async def test_all_copies_failing_raises_last_error(self):
+        """If every started copy fails, the last exception should propagate."""
+
+        async def attempt():
+            await asyncio.sleep(0.01)
+            raise ValueError("invalid")
+
+        with pytest.raises(ValueError):
+            await run_hedged(attempt, hedge_delay=0)
+
+
+# ============================================================================
+# ERROR CLASSIFICATION TESTS
+# ============================================================================
+
+
+class TestTransientErrors:
+    """Tests for is_transient_gemini_error and backoff_delay."""
+
+    @pytest.mark.parametrize(("code", "expected"), [(429, True), (500, True), (503, True), (400, False), (404, False)])
+    def test_status_codes(self, code, expected):
+        """Rate limits and server errors are transient; other client errors are not."""
+        error_cls = genai_errors.ServerError if code >= 500 else genai_errors.ClientError
+        assert is_transient_gemini_error(error_cls(code, {"error": {"message": "x"}})) is expected
+
+    def test_non_api_errors_not_transient(self):
+        """Exceptions outside the Gemini SDK are never classified as transient API errors."""
+        assert is_transient_gemini_error(ValueError("boom")) is False
+
+    def test_backoff_is_capped(self):
+        """Delays grow exponentially but never exceed cap + jitter."""
+        assert backoff_delay(0, base=0.5, jitter=0) == 0.5
+        assert backoff_delay(10, base=0.5, cap=8.0, jitter=0) == 8.0
+
+
+class TestClassifyError:
+    """Tests for classify_error."""
+
+    @pytest.mark.parametrize(
+        ("exc", "expected"),
+        [
+            (genai_errors.ClientError(429, {"error": {}}), "retry"),
+            (genai_errors.ServerError(503, {"error": {}}), "retry"),
+            (genai_errors.ClientError(400, {"error": {}}), "fatal"),
+            (genai_errors.ClientError(403, {"error": {}}), "fatal"),
+            (TimeoutError(), "retry"),
+            (ValueError("boom"), "retry"),
+        ],
+    )
+    def test_gemini_errors(self, exc, expected):
+        """Non-rate-limit client errors are fatal; everything else is worth another attempt."""
+        assert classify_error(exc) == expected
+
+    def test_fatal_types(self):
+        """Callers can mark their own exception types as not worth retrying."""
+        assert classify_error(KeyError("question_text"), fatal_types=(KeyError,)) == "fatal"
@@ -12,6 +12,7 @@ Usage:
         ...
 """
 
+import json
 from typing import Any
 from unittest.mock import MagicMock
 
@@ -124,8 +125,11 @@ class MockGeminiModels:
         to return, mimicking real Gemini API behavior.
         """
         self._call_count += 1
-        schema = config.get("response_schema")
-        schema_name = getattr(schema, "__name__", str(schema)) if schema else ""
+        schema = config.get("response_schema") or config.get("response_json_schema")
+        if isinstance(schema, dict):
+            schema_name = schema.get("title", "")
+        else:
+            schema_name = getattr(schema, "__name__", str(schema)) if schema else ""
         contents_str = str(contents).lower()
 
         # Handle edit_svg endpoint (unstructured response - uses .text, no schema)
@@ -136,20 +140,14 @@ class MockGeminiModels:
 </svg>"""
             return MockParsedResponse(None, text=mock_svg)
 
-        # Handle auto-correct endpoint (returns wrapper with .question)
+        # Handle auto-correct endpoint (JSON schema, so .parsed is a plain dict like the real SDK)
         if "AutoCorrected" in schema_name:
             if "short_answer" in contents_str:
-
-                class QuestionWrapper:
-                    question = create_mock_short_answer("What is Newton's first law of motion?")
-
-                return MockParsedResponse(QuestionWrapper())
+                question = create_mock_short_answer("What is Newton's first law of motion?")
             else:
-
-                class QuestionWrapper:
-                    question = create_mock_mcq4("What is the formula for kinetic energy?")
-
-                return MockParsedResponse(QuestionWrapper())
+                question = create_mock_mcq4("What is the formula for kinetic energy?")
+            wrapper = {"question": question.model_dump(exclude_none=True)}
+            return MockParsedResponse(wrapper, text=json.dumps(wrapper))
 
         # Handle regenerate endpoints (returns wrapper with .question)
         if "Regenerated" in schema_name:
@@ -267,12 +265,8 @@ class MockBrowserService:
 # ============================================================================
 
 # All modules where genai.Client is instantiated and needs patching
+# (every route gets its client from api.v1.qgen.utils.gemini_client; clear
+# get_gemini_client's cache around the patch)
 GEMINI_PATCH_TARGETS = [
-    "api.v1.qgen.generate_questions.routes.genai.Client",
-    "api.v1.qgen.auto_correct.service.genai.Client",
-    "api.v1.qgen.regenerate_question.genai.Client",
-    "api.v1.qgen.regenerate_with_prompt.routes.genai.Client",
-    "api.v1.qgen.get_feedback.genai.Client",
-    "api.v1.qgen.edit_svg.service.genai.Client",
-    "api.v1.bank.router.genai.Client",
+    "api.v1.qgen.utils.gemini_client.genai.Client",
 ]